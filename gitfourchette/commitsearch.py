@@ -0,0 +1,247 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Indexed search for commits in a CommitStore by message, author or hash prefix.
+
+Every CommitChunk keeps a corpus of its lowercase messages laid out in a
+single string, which is filled in on the worker thread as the log is walked.
+On top of it, every chunk gets a ChunkSearchIndex: all hashes in a single hex
+string, and the rows of each author. A query is then a handful of str.find() calls and bisections instead
+of a Python loop over every row. Since splicing a CommitStore reuses its
+chunks, the index survives splicing; only the chunks holding new commits need
+to be indexed.
+"""
+
+from __future__ import annotations
+
+import bisect
+import threading
+from array import array
+from collections.abc import Iterable, Iterator
+
+from gitfourchette.commitstore import CommitChunk, CommitStore, OID_SIZE
+from gitfourchette.porcelain import *
+from gitfourchette.toolbox import abbreviatePerson, AuthorDisplayStyle
+
+HEX_SIZE = 2 * OID_SIZE
+
+
+class ChunkSearchIndex:
+    """ Search index for the rows of a CommitChunk. Extended as the chunk grows. """
+
+    _lock = threading.Lock()
+    "Chunks may be indexed ahead of time on a worker thread (see CommitSearch.warmUp)"
+
+    def __init__(self):
+        self.numRows = 0
+
+        self.hexHashes = ""
+        "Hashes of all rows as a hex string (HEX_SIZE characters per row)"
+
+        self.authorRows: dict[int, array] = {}
+        "Person index -> rows authored by that person, in ascending order"
+
+    def update(self, chunk: CommitChunk):
+        """ Index any rows that were appended to the chunk since the last update. """
+        lo, hi = self.numRows, chunk.flushCorpus()
+        if lo == hi:
+            return
+
+        mocks = chunk.mocks
+        authorRows = self.authorRows
+        for y in range(lo, hi):
+            if y not in mocks:
+                authorRows.setdefault(chunk.authorIdx[y], array('I')).append(y)
+
+        self.hexHashes += chunk.oids[lo * OID_SIZE: hi * OID_SIZE].hex()
+        self.numRows = hi
+
+    @staticmethod
+    def of(chunk: CommitChunk) -> ChunkSearchIndex:
+        with ChunkSearchIndex._lock:
+            index = chunk.searchIndex
+            if index is None:
+                index = ChunkSearchIndex()
+                chunk.searchIndex = index
+            index.update(chunk)
+        return index
+
+
+class CommitSearch:
+    """
+    Find the rows of a CommitStore whose message or author contains a term,
+    or whose hash starts with the term.
+
+    Matching is equivalent to GraphView's historical row-by-row search:
+    the term must be lowercase, and authors are matched against their
+    abbreviated names in the given display style.
+    """
+
+    def __init__(self, store: CommitStore, term: str, likelyHash: bool,
+                 authorStyle: AuthorDisplayStyle = AuthorDisplayStyle.FULL_NAME):
+        assert term
+        assert term == term.lower(), "search term should have been sanitized"
+        assert "\0" not in term
+
+        self.store = store
+        self.term = term
+        self.likelyHash = likelyHash
+        self.authorStyle = authorStyle
+        self.matchingPeople: list[int] = []
+        self.numPeopleChecked = 0
+        self._matchRows: array | None = None
+
+    def isSearching(self, store: CommitStore, term: str, likelyHash: bool, authorStyle: AuthorDisplayStyle):
+        return (self.store is store and self.term == term and self.likelyHash == likelyHash
+                and self.authorStyle == authorStyle)
+
+    @staticmethod
+    def warmUp(store: CommitStore):
+        """ Index all chunks in the store ahead of time (e.g. on a worker thread). """
+        for chunk, _lo, _hi in store.segments:
+            ChunkSearchIndex.of(chunk)
+
+    def _updateMatchingPeople(self):
+        people = self.store.people
+        term = self.term
+        style = self.authorStyle
+        for i in range(self.numPeopleChecked, len(people)):
+            name, email = people[i]
+            if term in abbreviatePerson(Signature(name, email), style).lower():
+                self.matchingPeople.append(i)
+        self.numPeopleChecked = len(people)
+
+    def findRows(self, rows: range) -> Iterator[int]:
+        """
+        Yield the matching rows within `rows`, in the order of the range.
+        `rows` must have a step of 1 or -1.
+        """
+        assert rows.step in (1, -1)
+        store = self.store
+        self._updateMatchingPeople()
+
+        if rows.step == 1:
+            start = max(rows.start, 0)
+            stop = min(rows.stop, len(store))
+            for (chunk, lo, hi), segStart in zip(store.segments, store.segmentStarts, strict=True):
+                a = max(start, segStart)
+                b = min(stop, segStart + hi - lo)
+                if a >= b:
+                    continue
+                shift = segStart - lo
+                for y in self._scanForward(chunk, a - shift, b - shift):
+                    yield y + shift
+        else:
+            start = min(rows.start, len(store) - 1)
+            stop = max(rows.stop, -1)
+            for (chunk, lo, hi), segStart in reversed(list(zip(store.segments, store.segmentStarts, strict=True))):
+                a = min(start, segStart + hi - lo - 1)
+                b = max(stop, segStart - 1)
+                if a <= b:
+                    continue
+                shift = segStart - lo
+                for y in self._scanBackward(chunk, a - shift, b - shift):
+                    yield y + shift
+
+    def countMatches(self, hiddenRows: Iterable[int] = ()) -> int:
+        """
+        Count the matching rows, leaving out `hiddenRows`
+        (e.g. the commits of hidden branches; see CommitLogFilter.hiddenSourceRows).
+        """
+        matchRows = self._matchRows
+        if matchRows is None:
+            matchRows = array('I', self.findRows(range(len(self.store))))
+            self._matchRows = matchRows
+
+        count = len(matchRows)
+        for row in hiddenRows:
+            i = bisect.bisect_left(matchRows, row)
+            if i < len(matchRows) and matchRows[i] == row:
+                count -= 1
+        return count
+
+    def _scanForward(self, chunk: CommitChunk, y: int, end: int) -> Iterator[int]:
+        """ Yield matching local rows of a chunk in [y, end). """
+        index = ChunkSearchIndex.of(chunk)
+        term = self.term
+        text = chunk.corpus
+        textStarts = chunk.corpusStarts
+        authorRows = [index.authorRows[p] for p in self.matchingPeople if p in index.authorRows]
+
+        while y < end:
+            best = end
+
+            pos = text.find(term, textStarts[y], textStarts[end])
+            if pos >= 0:
+                best = bisect.bisect_right(textStarts, pos) - 1
+
+            for personRows in authorRows:
+                i = bisect.bisect_left(personRows, y)
+                if i < len(personRows) and personRows[i] < best:
+                    best = personRows[i]
+
+            if self.likelyHash:
+                best = self._findHashForward(chunk, index, y, best)
+
+            if best >= end:
+                return
+            yield best
+            y = best + 1
+
+    def _scanBackward(self, chunk: CommitChunk, y: int, end: int) -> Iterator[int]:
+        """ Yield matching local rows of a chunk in (end, y], in descending order. """
+        index = ChunkSearchIndex.of(chunk)
+        term = self.term
+        text = chunk.corpus
+        textStarts = chunk.corpusStarts
+        authorRows = [index.authorRows[p] for p in self.matchingPeople if p in index.authorRows]
+
+        while y > end:
+            best = end
+
+            pos = text.rfind(term, textStarts[end + 1], textStarts[y + 1])
+            if pos >= 0:
+                best = bisect.bisect_right(textStarts, pos) - 1
+
+            for personRows in authorRows:
+                i = bisect.bisect_right(personRows, y) - 1
+                if i >= 0 and personRows[i] > best:
+                    best = personRows[i]
+
+            if self.likelyHash:
+                best = self._findHashBackward(chunk, index, y, best)
+
+            if best <= end:
+                return
+            yield best
+            y = best - 1
+
+    def _findHashForward(self, chunk: CommitChunk, index: ChunkSearchIndex, y: int, end: int) -> int:
+        """ Return the first row in [y, end) whose hash starts with the term, or `end`. """
+        hexHashes = index.hexHashes
+        pos = y * HEX_SIZE - 1
+        while True:
+            pos = hexHashes.find(self.term, pos + 1, end * HEX_SIZE)
+            if pos < 0:
+                return end
+            row, column = divmod(pos, HEX_SIZE)
+            if column == 0 and row not in chunk.mocks:
+                return row
+
+    def _findHashBackward(self, chunk: CommitChunk, index: ChunkSearchIndex, y: int, end: int) -> int:
+        """ Return the last row in (end, y] whose hash starts with the term, or `end`. """
+        hexHashes = index.hexHashes
+        lowerBound = (end + 1) * HEX_SIZE
+        pos = (y + 1) * HEX_SIZE
+        while pos > lowerBound:
+            pos = hexHashes.rfind(self.term, lowerBound, pos + len(self.term) - 1)
+            if pos < 0:
+                return end
+            row, column = divmod(pos, HEX_SIZE)
+            if column == 0 and row not in chunk.mocks:
+                return row
+        return end
@@ -0,0 +1,584 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Compact, column-oriented storage for the commit sequence.
+
+Keeping a live pygit2 Commit around for every row in the graph costs hundreds
+of MB on repositories with hundreds of thousands of commits. CommitStore only
+retains the handful of fields that the graph and the commit log need, packed
+in typed arrays, plus a lowercase search corpus of the commit messages (see
+commitsearch). Messages are looked up lazily, and full Commit objects are only
+materialized on demand.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import threading
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+
+from gitfourchette.graph import MockCommit
+from gitfourchette.porcelain import *
+
+logger = logging.getLogger(__name__)
+
+OID_SIZE = 20
+_NULL_RAW = bytes(OID_SIZE)
+
+
+def _plainOid(oid: Oid | str) -> bytes | str:
+    return oid if isinstance(oid, str) else oid.raw
+
+
+def _unplainOid(x: bytes | str) -> Oid | str:
+    return x if isinstance(x, str) else Oid(raw=x)
+
+
+class CommitChunk:
+    """
+    Columns for a contiguous run of commits.
+
+    Chunks are append-only. Several CommitStores may share a chunk, each one
+    looking at a window of the chunk's rows (see CommitStore.segments).
+    """
+
+    def __init__(self):
+        self.oids = bytearray()
+        "Raw hashes (20 bytes per row)"
+
+        self.parentStart = array('I', [0])
+        "Offsets into parentOids/parentOffsets for each row (CSR layout; numRows+1 entries)"
+
+        self.parentOids = bytearray()
+        "Raw hashes of the parents (20 bytes per parent)"
+
+        self.parentOffsets = array('i')
+        """Distance from a row to each of its parents' rows (parentRow - childRow).
+        Zero means that the parent's row isn't known (e.g. beyond a truncated history).
+        Row distances are unaffected by splicing rows at the top of the sequence."""
+
+        self.authorIdx = array('I')
+        self.committerIdx = array('I')
+        self.authorTime = array('q')
+        self.committerTime = array('q')
+        self.authorOffset = array('h')
+        self.committerOffset = array('h')
+
+        self.corpus = ""
+        "Lowercase messages, each one terminated with a NUL character (empty for mock commits)"
+
+        self.corpusStarts = array('I', [0])
+        "Offset of each row's message in `corpus` (one more entry than there are rows in `corpus`)"
+
+        self.pendingCorpus: list[str] = []
+        "Lowercase messages of the latest rows, not folded into `corpus` yet (see flushCorpus)"
+
+        self.searchIndex = None
+        "Lazily-built ChunkSearchIndex (see commitsearch)"
+
+        self.mocks: dict[int, MockCommit] = {}
+        "Rows that hold a mock commit rather than an actual commit"
+
+        self.unresolved: dict[bytes, list[tuple[int, int]]] = {}
+        "Raw parent hash -> (slot in parentOffsets, local row of child) for parents whose row isn't known yet"
+
+    _corpusLock = threading.Lock()
+    "The corpus may be flushed from a worker thread while the UI thread searches it"
+
+    def __len__(self):
+        return len(self.authorTime)
+
+    def rawOid(self, i: int) -> bytes:
+        return bytes(self.oids[i * OID_SIZE: (i + 1) * OID_SIZE])
+
+    def parentSlots(self, i: int) -> range:
+        return range(self.parentStart[i], self.parentStart[i + 1])
+
+    def _appendParents(self, parentRaws: Iterable[bytes]):
+        y = len(self)
+        for raw in parentRaws:
+            slot = len(self.parentOffsets)
+            self.parentOids += raw
+            self.parentOffsets.append(0)
+            self.unresolved.setdefault(raw, []).append((slot, y))
+        self.parentStart.append(len(self.parentOffsets))
+
+    def _resolveChildrenOf(self, raw: bytes, y: int):
+        # Children always come before their parents in the sequence,
+        # so any child that was waiting for this commit is in this chunk already.
+        try:
+            waiting = self.unresolved.pop(raw)
+        except KeyError:
+            return
+        for slot, childY in waiting:
+            self.parentOffsets[slot] = y - childY
+
+    def append(self, raw: bytes, parentRaws: Iterable[bytes],
+               authorIdx: int, committerIdx: int,
+               authorTime: int, committerTime: int,
+               authorOffset: int, committerOffset: int,
+               searchText: str):
+        y = len(self)
+        self._resolveChildrenOf(raw, y)
+        self.oids += raw
+        self._appendParents(parentRaws)
+        self.authorIdx.append(authorIdx)
+        self.committerIdx.append(committerIdx)
+        self.authorTime.append(authorTime)
+        self.committerTime.append(committerTime)
+        self.authorOffset.append(authorOffset)
+        self.committerOffset.append(committerOffset)
+        # Last, so that flushCorpus never takes in a row whose other columns aren't filled in yet
+        self.pendingCorpus.append(searchText)
+
+    def appendMock(self, mock: MockCommit):
+        self.mocks[len(self)] = mock
+        parentRaws = [p.raw for p in mock.parent_ids if not isinstance(p, str)]
+        self.append(_NULL_RAW, parentRaws, 0, 0, 0, 0, 0, 0, "")
+
+    def appendRowsFrom(self, src: CommitChunk, lo: int, hi: int):
+        """ Copy rows [lo:hi] of another chunk, preserving parent row distances. """
+        y0 = len(self)
+        p0, p1 = src.parentStart[lo], src.parentStart[hi]
+        slotShift = len(self.parentOffsets) - p0
+
+        self.oids += src.oids[lo * OID_SIZE: hi * OID_SIZE]
+        self.parentOids += src.parentOids[p0 * OID_SIZE: p1 * OID_SIZE]
+        self.parentOffsets.extend(src.parentOffsets[p0:p1])
+        self.parentStart.extend(s + slotShift for s in src.parentStart[lo + 1: hi + 1])
+        for column in ("authorIdx", "committerIdx", "authorTime", "committerTime", "authorOffset", "committerOffset"):
+            getattr(self, column).extend(getattr(src, column)[lo:hi])
+        self.flushCorpus()
+        srcCorpus = src.corpusSlice(lo, hi)
+        shift = self.corpusStarts[-1] - src.corpusStarts[lo]
+        self.corpus += srcCorpus
+        self.corpusStarts.extend(s + shift for s in src.corpusStarts[lo + 1: hi + 1])
+
+        for y, mock in src.mocks.items():
+            if lo <= y < hi:
+                self.mocks[y - lo + y0] = mock
+
+        for raw, waiting in src.unresolved.items():
+            for slot, childY in waiting:
+                if lo <= childY < hi:
+                    self.unresolved.setdefault(raw, []).append((slot + slotShift, childY - lo + y0))
+
+    def flushCorpus(self) -> int:
+        """
+        Fold the pending lowercase messages into `corpus`.
+        Return the number of rows in `corpus`.
+        """
+        with CommitChunk._corpusLock:
+            pending = self.pendingCorpus
+            n = len(pending)
+            if n:
+                batch = pending[:n]
+                starts = self.corpusStarts
+                pos = starts[-1]
+                for text in batch:
+                    pos += len(text) + 1
+                    starts.append(pos)
+                batch.append("")  # terminate last row
+                self.corpus += "\0".join(batch)
+                del pending[:n]
+            return len(self.corpusStarts) - 1
+
+    def corpusSlice(self, lo: int, hi: int) -> str:
+        """ Lowercase messages of rows [lo:hi], each one terminated with a NUL character. """
+        self.flushCorpus()
+        return self.corpus[self.corpusStarts[lo]: self.corpusStarts[hi]]
+
+
+class StoredCommit:
+    """
+    Lightweight view of a row in a CommitStore.
+
+    Exposes the same attributes as pygit2.Commit. Attributes that aren't kept
+    in the store (tree, raw message, etc.) are forwarded to the actual Commit,
+    which is looked up in the repository on demand.
+    """
+
+    __slots__ = ("_store", "_chunk", "_y")
+
+    def __init__(self, store: CommitStore, chunk: CommitChunk, y: int):
+        self._store = store
+        self._chunk = chunk
+        self._y = y
+
+    def __repr__(self):
+        return f"StoredCommit({self.id})"
+
+    def __eq__(self, other):
+        if isinstance(other, StoredCommit | Commit):
+            return self.id == other.id
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def id(self) -> Oid:
+        return Oid(raw=self._chunk.rawOid(self._y))
+
+    @property
+    def parent_ids(self) -> list[Oid]:
+        chunk = self._chunk
+        return [Oid(raw=bytes(chunk.parentOids[s * OID_SIZE: (s + 1) * OID_SIZE])) for s in chunk.parentSlots(self._y)]
+
+    @property
+    def author(self) -> Signature:
+        chunk, y = self._chunk, self._y
+        name, email = self._store.people[chunk.authorIdx[y]]
+        return Signature(name, email, chunk.authorTime[y], chunk.authorOffset[y])
+
+    @property
+    def committer(self) -> Signature:
+        chunk, y = self._chunk, self._y
+        name, email = self._store.people[chunk.committerIdx[y]]
+        return Signature(name, email, chunk.committerTime[y], chunk.committerOffset[y])
+
+    @property
+    def commit_time(self) -> int:
+        return self._chunk.committerTime[self._y]
+
+    @property
+    def message(self) -> str:
+        return self._store.messageOf(self._chunk.rawOid(self._y))
+
+    def materialize(self) -> Commit:
+        return self._store.repo.peel_commit(self.id)
+
+    def __getattr__(self, name: str):
+        return getattr(self.materialize(), name)
+
+
+class CommitStore:
+    """
+    Sequence of commits (and mock commits) backed by typed arrays.
+
+    Supports the subset of list operations used by the graph splicer:
+    indexing, slicing, iteration and concatenation. Slices share their
+    underlying columns with the original store, so splicing new commits at the
+    top of a huge sequence doesn't copy the entire history.
+    """
+
+    MessageCacheSize = 1000
+    MaxSegments = 16
+
+    repo: Repo | None
+    segments: list[list]
+    "[chunk, lo, hi] windows into chunks, in row order"
+
+    people: list[tuple[str, str]]
+    "Interned (name, email) pairs; shared by all stores derived from this one"
+
+    def __init__(self, repo: Repo | None = None):
+        self.repo = repo
+        self.segments = []
+        self.segmentStarts = []
+        self.length = 0
+        self.people = []
+        self.peopleIndex = {}
+        self.messageCache = {}
+
+    def _derive(self, segments: list[list]) -> CommitStore:
+        store = CommitStore(self.repo)
+        store.people = self.people
+        store.peopleIndex = self.peopleIndex
+        store.messageCache = self.messageCache
+        store._setSegments(segments)
+        return store
+
+    def _setSegments(self, segments: list[list]):
+        self.segments = [s for s in segments if s[2] > s[1]]
+        self.segmentStarts = []
+        n = 0
+        for _chunk, lo, hi in self.segments:
+            self.segmentStarts.append(n)
+            n += hi - lo
+        self.length = n
+
+    # -------------------------------------------------------------------------
+    # Building
+
+    def _internPerson(self, key: tuple[str, str]) -> int:
+        try:
+            return self.peopleIndex[key]
+        except KeyError:
+            i = len(self.people)
+            self.people.append(key)
+            self.peopleIndex[key] = i
+            return i
+
+    def _tailChunk(self) -> CommitChunk:
+        """ Return a chunk that we can append rows to. """
+        if self.segments:
+            seg = self.segments[-1]
+            chunk, _lo, hi = seg
+            if hi == len(chunk):
+                return chunk
+        # The tail chunk is shared with another store (or we don't have one yet): start a new chunk
+        chunk = CommitChunk()
+        self.segments.append([chunk, 0, 0])
+        self.segmentStarts.append(self.length)
+        return chunk
+
+    def append(self, commit: Commit | StoredCommit | MockCommit):
+        chunk = self._tailChunk()
+
+        if isinstance(commit, MockCommit):
+            chunk.appendMock(commit)
+        elif isinstance(commit, StoredCommit):
+            src, y = commit._chunk, commit._y
+            if commit._store.people is not self.people:
+                srcPeople = commit._store.people
+                authorIdx = self._internPerson(srcPeople[src.authorIdx[y]])
+                committerIdx = self._internPerson(srcPeople[src.committerIdx[y]])
+            else:
+                authorIdx, committerIdx = src.authorIdx[y], src.committerIdx[y]
+            chunk.append(src.rawOid(y), [bytes(src.parentOids[s * OID_SIZE: (s + 1) * OID_SIZE]) for s in src.parentSlots(y)],
+                         authorIdx, committerIdx, src.authorTime[y], src.committerTime[y],
+                         src.authorOffset[y], src.committerOffset[y], src.corpusSlice(y, y + 1)[:-1])
+        else:
+            author = commit.author
+            committer = commit.committer
+            chunk.append(commit.id.raw, [p.raw for p in commit.parent_ids],
+                         self._internPerson((author.name, author.email)),
+                         self._internPerson((committer.name, committer.email)),
+                         author.time, committer.time, author.offset, committer.offset, commit.message.lower())
+
+        self.segments[-1][2] += 1
+        self.length += 1
+
+    def extend(self, commits: Iterable[Commit | StoredCommit | MockCommit]):
+        for commit in commits:
+            self.append(commit)
+
+    def resolveParentRows(self, rowLookup: Callable[[Oid], int]):
+        """
+        Fill in parent row distances that couldn't be determined when the rows
+        were added, e.g. for new commits whose parents are in an older chunk.
+        `rowLookup` must return a parent's row in this store, or raise KeyError.
+        """
+        for segIndex, (chunk, lo, hi) in enumerate(self.segments):
+            start = self.segmentStarts[segIndex]
+            for raw in list(chunk.unresolved):
+                waiting = chunk.unresolved[raw]
+                try:
+                    parentRow = rowLookup(Oid(raw=raw))
+                except KeyError:
+                    continue
+                stillWaiting = []
+                for slot, childY in waiting:
+                    if lo <= childY < hi:
+                        chunk.parentOffsets[slot] = parentRow - (start + childY - lo)
+                    else:
+                        stillWaiting.append((slot, childY))
+                if stillWaiting:
+                    chunk.unresolved[raw] = stillWaiting
+                else:
+                    del chunk.unresolved[raw]
+
+    # -------------------------------------------------------------------------
+    # Sequence protocol
+
+    def __len__(self):
+        return self.length
+
+    def __bool__(self):
+        return self.length != 0
+
+    def locate(self, row: int) -> tuple[CommitChunk, int]:
+        """ Return the chunk holding a row, and the row's index within that chunk. """
+        if row < 0:
+            row += self.length
+        if not (0 <= row < self.length):
+            raise IndexError(f"row {row} out of range")
+        segIndex = bisect.bisect_right(self.segmentStarts, row) - 1
+        chunk, lo, _hi = self.segments[segIndex]
+        return chunk, lo + row - self.segmentStarts[segIndex]
+
+    def __getitem__(self, key: int | slice):
+        if isinstance(key, slice):
+            return self._slice(key)
+        chunk, y = self.locate(key)
+        try:
+            return chunk.mocks[y]
+        except KeyError:
+            return StoredCommit(self, chunk, y)
+
+    def __iter__(self) -> Iterator[StoredCommit | MockCommit]:
+        for chunk, lo, hi in self.segments:
+            mocks = chunk.mocks
+            for y in range(lo, hi):
+                try:
+                    yield mocks[y]
+                except KeyError:
+                    yield StoredCommit(self, chunk, y)
+
+    def _slice(self, key: slice) -> CommitStore:
+        start, stop, step = key.indices(self.length)
+        assert step == 1, "CommitStore doesn't support extended slicing"
+        segments = []
+        for (chunk, lo, hi), segStart in zip(self.segments, self.segmentStarts, strict=True):
+            segEnd = segStart + hi - lo
+            a = max(start, segStart)
+            b = min(stop, segEnd)
+            if a < b:
+                segments.append([chunk, lo + a - segStart, lo + b - segStart])
+        return self._derive(segments)
+
+    def __add__(self, other: CommitStore | list) -> CommitStore:
+        if not isinstance(other, CommitStore):
+            tail = self._derive([])
+            tail.extend(other)
+            other = tail
+        assert other.people is self.people or not other, "can't concatenate unrelated stores"
+
+        segments = [list(s) for s in self.segments]
+        for chunk, lo, hi in other.segments:
+            if segments and segments[-1][0] is chunk and segments[-1][2] == lo:
+                segments[-1][2] = hi  # contiguous windows into the same chunk
+            else:
+                segments.append([chunk, lo, hi])
+
+        store = self._derive(segments)
+        store._compact()
+        return store
+
+    def __radd__(self, other: list) -> CommitStore:
+        # GraphSpliceLoop reassembles the sequence with `newCommits[:nAdded] + oldSequence[nRemoved:]`.
+        head = self._derive([])
+        head.extend(other)
+        return head + self
+
+    def _compact(self):
+        """ Keep row lookups fast by merging all but the last segment if there are too many. """
+        if len(self.segments) <= CommitStore.MaxSegments:
+            return
+        merged = CommitChunk()
+        for chunk, lo, hi in self.segments[:-1]:
+            merged.appendRowsFrom(chunk, lo, hi)
+        self._setSegments([[merged, 0, len(merged)], self.segments[-1]])
+
+    # -------------------------------------------------------------------------
+    # Column accessors
+
+    def oid(self, row: int) -> Oid | str:
+        chunk, y = self.locate(row)
+        try:
+            return chunk.mocks[y].id
+        except KeyError:
+            return Oid(raw=chunk.rawOid(y))
+
+    def parentRows(self, row: int) -> list[int]:
+        """ Rows of the commit's parents in the sequence (-1 for parents that aren't in the sequence). """
+        chunk, y = self.locate(row)
+        return [row + chunk.parentOffsets[s] if chunk.parentOffsets[s] else -1 for s in chunk.parentSlots(y)]
+
+    def iterParentRows(self) -> Iterator[list[int]]:
+        """
+        Yield the rows of each commit's parents, in row order. Parents whose row
+        isn't known are left out. (In a slice, some parent rows may lie beyond
+        the end of the slice.)
+        """
+        row = 0
+        for chunk, lo, hi in self.segments:
+            parentStart = chunk.parentStart
+            parentOffsets = chunk.parentOffsets
+            for y in range(lo, hi):
+                yield [row + offset for offset in parentOffsets[parentStart[y]: parentStart[y + 1]] if offset]
+                row += 1
+
+    def messageOf(self, raw: bytes) -> str:
+        cache = self.messageCache
+        try:
+            message = cache.pop(raw)
+        except KeyError:
+            message = self.repo.peel_commit(Oid(raw=raw)).message
+        # Bump to end of keys (dicts keep key insertion order)
+        cache[raw] = message
+
+        # Nuke old entries if the cache grew beyond twice its nominal size
+        if len(cache) > 2 * CommitStore.MessageCacheSize:
+            for key in list(cache.keys())[:len(cache) - CommitStore.MessageCacheSize]:
+                del cache[key]
+
+        return message
+
+    def iterParentLinks(self, start: int = 0) -> Iterator[tuple[Oid | str, list[int], list[Oid]]]:
+        """
+        From row `start` onwards, yield each commit's id, the rows of its
+        parents, and the ids of the parents whose row isn't known (e.g. because
+        they haven't been appended yet). See BatchTrickle.feed.
+        """
+        row = 0
+        for chunk, lo, hi in self.segments:
+            if row + hi - lo <= start:
+                row += hi - lo
+                continue
+            y0 = lo + max(0, start - row)
+            row += y0 - lo
+            mocks = chunk.mocks
+            parentStart = chunk.parentStart
+            parentOffsets = chunk.parentOffsets
+            parentOids = chunk.parentOids
+            for y in range(y0, hi):
+                try:
+                    oid = mocks[y].id
+                except KeyError:
+                    oid = Oid(raw=chunk.rawOid(y))
+                parents = []
+                pendingParents = []
+                for s in range(parentStart[y], parentStart[y + 1]):
+                    offset = parentOffsets[s]
+                    if offset:
+                        parents.append(row + offset)
+                    else:
+                        pendingParents.append(Oid(raw=bytes(parentOids[s * OID_SIZE: (s + 1) * OID_SIZE])))
+                yield oid, parents, pendingParents
+                row += 1
+
+    # -------------------------------------------------------------------------
+    # Persistence (see GraphCache)
+
+    _COLUMNS = ("parentStart", "parentOffsets", "authorIdx", "committerIdx",
+                "authorTime", "committerTime", "authorOffset", "committerOffset", "corpusStarts")
+
+    def toPlainData(self) -> dict:
+        flat = CommitChunk()
+        for chunk, lo, hi in self.segments:
+            flat.appendRowsFrom(chunk, lo, hi)
+        data = {name: getattr(flat, name).tobytes() for name in CommitStore._COLUMNS}
+        data["oids"] = bytes(flat.oids)
+        data["parentOids"] = bytes(flat.parentOids)
+        data["corpus"] = flat.corpus
+        data["people"] = list(self.people)
+        data["mocks"] = [(y, _plainOid(mock.id), [_plainOid(p) for p in mock.parent_ids]) for y, mock in flat.mocks.items()]
+        data["unresolved"] = [(raw, waiting) for raw, waiting in flat.unresolved.items()]
+        return data
+
+    @staticmethod
+    def fromPlainData(repo: Repo, data: dict) -> CommitStore:
+        chunk = CommitChunk()
+        for name in CommitStore._COLUMNS:
+            column = array(getattr(chunk, name).typecode)
+            column.frombytes(data[name])
+            setattr(chunk, name, column)
+        chunk.oids = bytearray(data["oids"])
+        chunk.parentOids = bytearray(data["parentOids"])
+        chunk.corpus = data["corpus"]
+        chunk.mocks = {y: MockCommit(_unplainOid(oid), [_unplainOid(p) for p in parents]) for y, oid, parents in data["mocks"]}
+        chunk.unresolved = {raw: [tuple(w) for w in waiting] for raw, waiting in data["unresolved"]}
+
+        store = CommitStore(repo)
+        store.people = [tuple(p) for p in data["people"]]
+        store.peopleIndex = {p: i for i, p in enumerate(store.people)}
+        store._setSegments([[chunk, 0, len(chunk)]])
+        return store
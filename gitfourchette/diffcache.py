@@ -0,0 +1,72 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+In-memory cache of the diffs of recently-viewed commits.
+
+Diffing a commit against its parents (and running rename detection on the
+result) is the bulk of the work when the user selects a commit in the graph.
+A commit's diffs never change, so LoadCommit keeps them around in a small LRU
+cache. GraphView warms up the cache with the neighbors of the selected commit
+while the user is idle, so that stepping through the history with the arrow
+keys doesn't have to diff anything.
+"""
+
+import threading
+
+from gitfourchette.porcelain import *
+
+
+class CommitDiffCache:
+    CacheSize = 32
+
+    def __init__(self):
+        self.entries: dict[tuple, tuple[list[Diff], bool]] = {}
+        self.lock = threading.Lock()
+        "LoadCommit reads and fills the cache on a worker thread"
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def makeKey(oid: Oid, findSimilarThreshold: int, contextLines: int) -> tuple:
+        return oid, findSimilarThreshold, contextLines
+
+    def get(self, key: tuple) -> tuple[list[Diff], bool] | None:
+        with self.lock:
+            try:
+                # Bump to end of keys (dicts keep key insertion order)
+                entry = self.entries.pop(key)
+            except KeyError:
+                return None
+            self.entries[key] = entry
+            return entry
+
+    def put(self, key: tuple, diffs: list[Diff], skippedRenameDetection: bool):
+        with self.lock:
+            self.entries[key] = (diffs, skippedRenameDetection)
+
+            # Nuke old entries if the cache grew beyond twice its nominal size
+            if len(self.entries) > 2 * CommitDiffCache.CacheSize:
+                for oldKey in list(self.entries.keys())[:len(self.entries) - CommitDiffCache.CacheSize]:
+                    del self.entries[oldKey]
+
+    def __contains__(self, key: tuple) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def diffs(self, repo: Repo, oid: Oid, findSimilarThreshold: int, contextLines: int) -> tuple[list[Diff], bool]:
+        """
+        Return the diffs of a commit compared to its parents (see Repo.commit_diffs),
+        computing them if they aren't in the cache yet.
+        """
+        key = CommitDiffCache.makeKey(oid, findSimilarThreshold, contextLines)
+        entry = self.get(key)
+        if entry is None:
+            entry = repo.commit_diffs(oid, find_similar_threshold=findSimilarThreshold, context_lines=contextLines)
+            self.put(key, *entry)
+        return entry
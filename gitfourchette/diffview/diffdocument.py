@@ -5,8 +5,9 @@
 # -----------------------------------------------------------------------------
 
 import difflib
-from collections.abc import Generator
+from collections.abc import Callable, Generator
 from dataclasses import dataclass
+from os.path import commonprefix
 
 from gitfourchette import colors
 from gitfourchette import settings
@@ -19,6 +20,16 @@ from gitfourchette.toolbox import *
 
 MAX_LINE_LENGTH = 10_000
 
+MAX_INTRALINE_DIFF_LENGTH = 1_000
+"Past this many differing characters between two lines, don't look for matching blocks within the lines"
+
+CHECKPOINT_INTERVAL_MASK = 0xFF
+"Call the checkpoint callback every 256 lines"
+
+
+def _noCheckpoint():
+    pass
+
 
 @dataclass
 class LineData:
@@ -102,7 +113,14 @@ class DiffDocument:
     minuses: int
 
     @staticmethod
-    def fromPatch(patch: Patch, locator: NavLocator):
+    def fromPatch(patch: Patch, locator: NavLocator, checkpoint: Callable[[], None] = _noCheckpoint):
+        """
+        Build a DiffDocument from a patch. This may run on a worker thread;
+        if so, move the document to the UI thread before displaying it.
+
+        `checkpoint` is called every so often while building the document.
+        It may raise an exception to abandon the work.
+        """
         if patch.delta.similarity == 100:
             raise SpecialDiffError.noChange(patch.delta)
 
@@ -179,6 +197,9 @@ class DiffDocument:
 
                 ld = LineData(text=content, hunkPos=DiffLinePos(hunkID, hunkLineNum), diffLine=diffLine)
 
+                if (len(lineData) & CHECKPOINT_INTERVAL_MASK) == 0:
+                    checkpoint()
+
                 assert origin in " -+", F"diffline origin: '{origin}'"
                 if origin == '+':
                     assert diffLine.new_lineno == newLine
@@ -223,7 +244,10 @@ class DiffDocument:
         assert document.isEmpty()
 
         # Build up document from the lineData array.
-        for ld in lineData:
+        for i, ld in enumerate(lineData):
+            if (i & CHECKPOINT_INTERVAL_MASK) == 0:
+                checkpoint()
+
             # Decide block format & character format
             if ld.diffLine is None:
                 bf = style.hunkBF
@@ -270,33 +294,6 @@ class DiffDocument:
 
             ld.cursorEnd = cursor.position()
 
-        # Emphasize doppelganger differences
-        doppelgangerBlocksQueue = []
-        for i, ld in enumerate(lineData):
-            if ld.doppelganger < 0:  # Skip lines without doppelgangers
-                continue
-
-            assert i != ld.doppelganger, "line cannot be its own doppelganger"
-            assert ld.diffLine is not None, "line with doppelganger must have a DiffLine"
-            aheadOfDoppelganger = i < ld.doppelganger
-
-            if aheadOfDoppelganger:
-                sm = difflib.SequenceMatcher(a=ld.text, b=lineData[ld.doppelganger].text)
-                blocks = sm.get_matching_blocks()
-                doppelgangerBlocksQueue.append(blocks)  # Set blocks aside for my doppelganger
-            else:
-                blocks = doppelgangerBlocksQueue.pop(0)  # Consume blocks set aside by my doppelganger
-
-            cf = style.delCF2 if ld.diffLine.origin == '-' else style.addCF2
-            offset = ld.cursorStart
-
-            for x1, x2 in _invertMatchingBlocks(blocks, useA=aheadOfDoppelganger):
-                cursor.setPosition(offset + x1, QTextCursor.MoveMode.MoveAnchor)
-                cursor.setPosition(offset + x2, QTextCursor.MoveMode.KeepAnchor)
-                cursor.setCharFormat(cf)
-
-        assert not doppelgangerBlocksQueue, "should've consumed all doppelganger matching blocks!"
-
         # Done batching text insertions.
         cursor.endEditBlock()
 
@@ -314,3 +311,32 @@ def _invertMatchingBlocks(blockList: list[difflib.Match], useA: bool) -> Generat
             yield px, x1
 
         px = x2
+
+
+def emphasisRanges(a: str, b: str) -> tuple[list[tuple[int, int]], list[tuple[int, int]]]:
+    """
+    Find the spans of text that differ between two lines.
+    Returns a list of (start, end) ranges in `a`, and another in `b`.
+
+    The common prefix and suffix are trimmed off before running SequenceMatcher,
+    which is quadratic, on the remaining part. If the remaining part is too long,
+    it is emphasized in its entirety.
+    """
+    prefix = len(commonprefix((a, b)))
+    suffix = len(commonprefix((a[::-1], b[::-1])))
+    suffix = min(suffix, len(a) - prefix, len(b) - prefix)
+
+    endA = len(a) - suffix
+    endB = len(b) - suffix
+    middleA = a[prefix:endA]
+    middleB = b[prefix:endB]
+
+    if not middleA or not middleB or len(middleA) + len(middleB) > MAX_INTRALINE_DIFF_LENGTH:
+        rangesA = [(prefix, endA)] if middleA else []
+        rangesB = [(prefix, endB)] if middleB else []
+        return rangesA, rangesB
+
+    blocks = difflib.SequenceMatcher(a=middleA, b=middleB).get_matching_blocks()
+    rangesA = [(prefix + x1, prefix + x2) for x1, x2 in _invertMatchingBlocks(blocks, useA=True)]
+    rangesB = [(prefix + x1, prefix + x2) for x1, x2 in _invertMatchingBlocks(blocks, useA=False)]
+    return rangesA, rangesB
@@ -10,11 +10,12 @@ import logging
 import os
 import re
 from bisect import bisect_left, bisect_right
+from collections.abc import Iterable
 
 from gitfourchette import colors
 from gitfourchette import settings
 from gitfourchette.application import GFApplication
-from gitfourchette.diffview.diffdocument import DiffDocument, LineData
+from gitfourchette.diffview.diffdocument import DiffDocument, LineData, emphasisRanges
 from gitfourchette.diffview.diffgutter import DiffGutter
 from gitfourchette.diffview.diffrubberband import DiffRubberBand
 from gitfourchette.exttools import openPrefsDialog
@@ -30,15 +31,88 @@ from gitfourchette.toolbox import *
 logger = logging.getLogger(__name__)
 
 
-class DiffSearchHighlighter(QSyntaxHighlighter):
-    def __init__(self, parent):
+class DiffHighlighter(QSyntaxHighlighter):
+    """
+    Emphasizes the differences between doppelganger lines, and highlights search terms.
+
+    Emphasizing the differences within a line is expensive, so it is done lazily:
+    DiffView calls emphasizeBlocks() for the blocks that scroll into view, and the
+    results are memoized for the lifetime of the document.
+    """
+
+    def __init__(self, parent: DiffView):
         super().__init__(parent)
 
         self.highlightFormat = QTextCharFormat()
         self.highlightFormat.setBackground(colors.yellow)
         self.highlightFormat.setFontWeight(QFont.Weight.Bold)
 
+        self.diffDocument = None
+        self.emphasisCache: dict[int, list[tuple[int, int]]] = {}
+        self.mayComputeEmphasis = False
+
+    def setDiffDocument(self, diffDocument: DiffDocument | None):
+        self.diffDocument = diffDocument
+        self.emphasisCache = {}
+        if diffDocument is not None:
+            self.setDocument(diffDocument.document)
+
+    def lineDataIndex(self, block: QTextBlock) -> int:
+        i = block.blockNumber()
+        if self.diffDocument is None or i >= len(self.diffDocument.lineData):
+            return -1
+        return i
+
+    def needsEmphasis(self, block: QTextBlock) -> bool:
+        i = self.lineDataIndex(block)
+        return i >= 0 and self.diffDocument.lineData[i].doppelganger >= 0 and i not in self.emphasisCache
+
+    def emphasizeBlocks(self, blocks: Iterable[QTextBlock]):
+        self.mayComputeEmphasis = True
+        try:
+            for block in blocks:
+                self.rehighlightBlock(block)
+        finally:
+            self.mayComputeEmphasis = False
+
+    def computeEmphasis(self, i: int) -> list[tuple[int, int]]:
+        lineData = self.diffDocument.lineData
+        j = lineData[i].doppelganger
+        a, b = (i, j) if i < j else (j, i)
+
+        # Memoize the ranges for both doppelgangers at once
+        rangesA, rangesB = emphasisRanges(lineData[a].text, lineData[b].text)
+        self.emphasisCache[a] = rangesA
+        self.emphasisCache[b] = rangesB
+        return self.emphasisCache[i]
+
     def highlightBlock(self, text: str):
+        self.highlightEmphasis()
+        self.highlightSearchTerm(text)
+
+    def highlightEmphasis(self):
+        i = self.lineDataIndex(self.currentBlock())
+        if i < 0:
+            return
+
+        ld = self.diffDocument.lineData[i]
+        if ld.doppelganger < 0:
+            return
+
+        try:
+            ranges = self.emphasisCache[i]
+        except KeyError:
+            if not self.mayComputeEmphasis:
+                return
+            ranges = self.computeEmphasis(i)
+
+        style = self.diffDocument.style
+        cf = style.delCF2 if ld.diffLine.origin == '-' else style.addCF2
+
+        for x1, x2 in ranges:
+            self.setFormat(x1, x2 - x1, cf)
+
+    def highlightSearchTerm(self, text: str):
         searchBar = self.parent().searchBar
         if not searchBar.isVisible():
             return
@@ -90,8 +164,8 @@ class DiffView(QPlainTextEdit):
         self.repo = None
         self.isDetachedWindow = False
 
-        # Highlighter for search terms
-        self.highlighter = DiffSearchHighlighter(self)
+        # Highlighter for intra-line differences and search terms
+        self.highlighter = DiffHighlighter(self)
 
         self.gutter = DiffGutter(self)
         self.gutter.customContextMenuRequested.connect(lambda p: self.execContextMenu(self.gutter.mapToGlobal(p)))
@@ -119,6 +193,7 @@ class DiffView(QPlainTextEdit):
         self.rubberBandButtonGroup.hide()
 
         self.verticalScrollBar().valueChanged.connect(self.updateRubberBand)
+        self.verticalScrollBar().valueChanged.connect(self.emphasizeVisibleLines)
         self.horizontalScrollBar().valueChanged.connect(self.updateRubberBand)
 
         # Initialize font & styling
@@ -165,6 +240,7 @@ class DiffView(QPlainTextEdit):
         super().resizeEvent(event)
         self.resizeGutter()
         self.updateRubberBand()
+        self.emphasizeVisibleLines()
 
     def keyPressEvent(self, event: QKeyEvent):
         # In a detached window, we can't rely on the main window's menu bar to
@@ -247,6 +323,7 @@ class DiffView(QPlainTextEdit):
         # clears the selection in a FileList and then reselects the last-displayed document.
         self.currentLocator = NavLocator()
         self.currentPatch = None
+        self.highlighter.setDiffDocument(None)
 
         # Clear the actual contents
         super().clear()
@@ -279,14 +356,14 @@ class DiffView(QPlainTextEdit):
         self.currentPatch = patch
         self.currentLocator = locator
 
-        newDoc.document.setParent(self)
-        self.setDocument(newDoc.document)
-        self.highlighter.setDocument(newDoc.document)
-
         self.lineData = newDoc.lineData
         self.lineCursorStartCache = [ld.cursorStart for ld in self.lineData]
         self.lineHunkIDCache = [ld.hunkPos.hunkID for ld in self.lineData]
 
+        newDoc.document.setParent(self)
+        self.setDocument(newDoc.document)
+        self.highlighter.setDiffDocument(newDoc)
+
         # now reset defaults that are lost when changing documents
         self.refreshPrefs()
 
@@ -312,6 +389,9 @@ class DiffView(QPlainTextEdit):
         # Now restore cursor/scrollbar positions
         self.restorePosition(locator)
 
+        # Emphasize intra-line differences in the initial viewport
+        self.emphasizeVisibleLines()
+
     @benchmark
     def canReuseCurrentDocument(self, newLocator: NavLocator, newPatch: Patch, newDocument: DiffDocument
                                 ) -> bool:
@@ -734,6 +814,29 @@ class DiffView(QPlainTextEdit):
 
         self.setViewportMargins(gutterWidth, 0, 0, 0)
 
+    # ---------------------------------------------
+    # Intra-line emphasis
+
+    def emphasizeVisibleLines(self):
+        """ Emphasize intra-line differences in the blocks that are currently in the viewport. """
+        highlighter = self.highlighter
+        if highlighter.diffDocument is None:
+            return
+
+        block: QTextBlock = self.firstVisibleBlock()
+        top = self.blockBoundingGeometry(block).translated(self.contentOffset()).top()
+        viewportBottom = self.viewport().rect().bottom()
+        pending = []
+
+        while block.isValid() and top <= viewportBottom:
+            if highlighter.needsEmphasis(block):
+                pending.append(block)
+            top += self.blockBoundingRect(block).height()
+            block = block.next()
+
+        if pending:
+            highlighter.emphasizeBlocks(pending)
+
     # ---------------------------------------------
     # Rubberband
 
@@ -168,6 +168,42 @@ class FileList(QListView):
         self.skippedRenameDetection = skippedRenameDetection
         self.updateFocusPolicy()
 
+    def updateContents(self, diffs: list[Diff], skippedRenameDetection: bool):
+        """
+        Replace the contents of the list without losing the selection or the scroll position
+        (e.g. after staging a file, or when rename detection completes in the background).
+        Does not emit any jump signals.
+        """
+        selectedPaths = list(self.selectedPaths())
+        currentPath = self.currentIndex().data(FileListModel.Role.FilePath)
+        scrollValue = self.verticalScrollBar().value()
+
+        flModel = self.flModel
+        selectionModel = self.selectionModel()
+        SF = QItemSelectionModel.SelectionFlag
+
+        with QSignalBlockerContext(self):
+            patchedInPlace = flModel.updateDiffs(diffs)
+
+            # The model was reset, so restore the selection by hand
+            if not patchedInPlace:
+                newItemSelection = QItemSelection()
+                for path in selectedPaths:
+                    with suppress(KeyError):
+                        index = flModel.index(flModel.fileRows[path], 0)
+                        newItemSelection.select(index, index)
+                selectionModel.select(newItemSelection, SF.Rows | SF.Select)
+
+                with suppress(KeyError):
+                    currentIndex = flModel.index(flModel.fileRows[currentPath], 0)
+                    selectionModel.setCurrentIndex(currentIndex, SF.Rows | SF.Current)
+
+        if not patchedInPlace:
+            self.verticalScrollBar().setValue(scrollValue)
+
+        self.skippedRenameDetection = skippedRenameDetection
+        self.updateFocusPolicy()
+
     def clear(self):
         self.flModel.clear()
         self.commitId = NULL_OID
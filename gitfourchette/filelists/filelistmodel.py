@@ -173,23 +173,80 @@ class FileListModel(QAbstractListModel):
         self.highlightedCounterpartRow = -1
         self.modelReset.emit()
 
-    def setDiffs(self, diffs: list[Diff]):
-        self.beginResetModel()
-
-        self.entries.clear()
-        self.fileRows.clear()
-
+    def makeEntries(self, diffs: list[Diff]) -> list[Entry]:
+        entries = []
         for diff in diffs:
             for patchNo, delta in enumerate(diff.deltas):
                 if self.skipConflicts and delta.status == DeltaStatus.CONFLICTED:
                     continue
                 path = delta.new_file.path
                 path = path.removesuffix("/")  # trees (submodules) have a trailing slash - remove for NavLocator consistency
-                self.fileRows[path] = len(self.entries)
-                self.entries.append(FileListModel.Entry(delta, diff, patchNo, path))
+                entries.append(FileListModel.Entry(delta, diff, patchNo, path))
+        return entries
 
+    def setDiffs(self, diffs: list[Diff]):
+        self.beginResetModel()
+        self.entries = self.makeEntries(diffs)
+        self.fileRows = {entry.canonicalPath: row for row, entry in enumerate(self.entries)}
         self.endResetModel()
 
+    def updateDiffs(self, diffs: list[Diff]) -> bool:
+        """
+        Replace the contents of the model with new diffs, without resetting the model.
+
+        Only the rows for paths that have appeared or vanished are inserted or
+        removed; the rest are updated in place, so that views keep their selection
+        and scroll position. This is useful when just a few files have changed in
+        a long list (e.g. after staging a file, or after rename detection).
+
+        Return False if the model had to be reset instead.
+        """
+        newEntries = self.makeEntries(diffs)
+        newRows = {entry.canonicalPath: row for row, entry in enumerate(newEntries)}
+        oldRows = self.fileRows
+
+        # Paths that are common to the old and new diffs must appear in the same relative order
+        # (libgit2 sorts deltas by path, so this should be a given). Otherwise, just reset the model.
+        oldCommon = [e.canonicalPath for e in self.entries if e.canonicalPath in newRows]
+        newCommon = [e.canonicalPath for e in newEntries if e.canonicalPath in oldRows]
+        if oldCommon != newCommon or len(newRows) != len(newEntries):
+            self.setDiffs(diffs)
+            return False
+
+        # Remove vanished rows in contiguous runs, bottom-up so that row numbers stay valid
+        entries = self.entries
+        row = len(entries) - 1
+        while row >= 0:
+            if entries[row].canonicalPath in newRows:
+                row -= 1
+                continue
+            last = row
+            while row >= 0 and entries[row].canonicalPath not in newRows:
+                row -= 1
+            self.beginRemoveRows(QModelIndex(), row + 1, last)
+            del entries[row + 1: last + 1]
+            self.endRemoveRows()
+
+        # Insert new rows in contiguous runs, top-down
+        row = 0
+        while row < len(newEntries):
+            if newEntries[row].canonicalPath in oldRows:
+                row += 1
+                continue
+            first = row
+            while row < len(newEntries) and newEntries[row].canonicalPath not in oldRows:
+                row += 1
+            self.beginInsertRows(QModelIndex(), first, row - 1)
+            entries[first:first] = newEntries[first:row]
+            self.endInsertRows()
+
+        # The surviving rows point to the old Diff objects; refresh them all
+        self.entries = newEntries
+        self.fileRows = newRows
+        if newEntries:
+            self.dataChanged.emit(self.index(0), self.index(len(newEntries) - 1))
+        return True
+
     def rowCount(self, parent: QModelIndex = QModelIndex_default) -> int:
         return len(self.entries)
 
@@ -264,3 +321,13 @@ class FileListModel(QAbstractListModel):
         Return True if the given path is present in this model.
         """
         return path in self.fileRows
+
+    def getDeltaForFile(self, path: str) -> DiffDelta | None:
+        """
+        Get the delta corresponding to the given path.
+        Return None if the path is absent from this model.
+        """
+        try:
+            return self.entries[self.fileRows[path]].delta
+        except KeyError:
+            return None
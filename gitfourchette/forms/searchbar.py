@@ -91,6 +91,13 @@ class SearchBar(QWidget):
         self.ui.backwardButton.setIcon(stockIcon("go-up-search"))
         self.ui.closeButton.setIcon(stockIcon("dialog-close"))
 
+        # Optional match counter, see showMatchCount()
+        self.matchCountLabel = QLabel(self)
+        self.matchCountLabel.setEnabled(False)
+        self.matchCountLabel.hide()
+        self.ui.horizontalLayout.insertWidget(1, self.matchCountLabel)
+        tweakWidgetFont(self.matchCountLabel, 85)
+
         # The size of the buttons is readjusted after show(),
         # so prevent visible popping when booting up for the first time.
         for button in self.buttons:
@@ -156,6 +163,7 @@ class SearchBar(QWidget):
 
     def onSearchTextChanged(self, text: str):
         self.turnRed(False)
+        self.matchCountLabel.hide()
         self.searchTerm = text.strip().lower()
 
         if self.detectHashes and 0 < len(self.searchTerm) <= 40:
@@ -175,6 +183,10 @@ class SearchBar(QWidget):
         if wasRed ^ red:  # trigger stylesheet refresh
             self.setStyleSheet("* {}")
 
+    def showMatchCount(self, count: int):
+        self.matchCountLabel.setText(self.tr("%n matches", "", count))
+        self.matchCountLabel.show()
+
     def searchRange(self, r: range) -> QModelIndex | None:
         """ Proxy for buddy.searchRange """
         assert hasattr(self.buddy, "searchRange"), "missing searchRange callback"
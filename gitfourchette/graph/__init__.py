@@ -11,13 +11,19 @@ from gitfourchette.graph.graph import (
     ChainHandle,
     Frame,
     Graph,
+    KeyframeStats,
     KF_INTERVAL,
+    NO_JUNCTIONS,
     PlaybackState,
 )
-from gitfourchette.graph.graphtrickle import GraphTrickle
+from gitfourchette.graph.graphtrickle import BatchTrickle, GraphTrickle
 from gitfourchette.graph.graphdiagram import GraphDiagram
 from gitfourchette.graph.graphbuilder import (
     GraphBuildLoop,
     GraphSpliceLoop,
     MockCommit,
 )
+from gitfourchette.graph.graphserializer import (
+    GraphSerializer,
+    GraphSnapshot,
+)
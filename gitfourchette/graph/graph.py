@@ -8,7 +8,7 @@ from __future__ import annotations
 
 import bisect
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from collections.abc import Iterable, Iterator, Set
 from typing import ClassVar
 
@@ -27,12 +27,38 @@ The bigger the interval...:
 - but slower random access to any point of the graph.
 """
 
+VOLATILE_KF_SPACING = 64
+"""
+Minimum distance (in number of commits) between volatile keyframes.
+
+Besides the keyframes saved at KF_INTERVAL while preparing the graph, Graph
+saves "volatile" keyframes as it replays the graph to reach arbitrary rows.
+The more often a region of the graph is visited, the more volatile keyframes
+it accumulates, down to this spacing.
+"""
+
+VOLATILE_KF_PER_REPLAY = 4
+"Number of volatile keyframes saved along a long replay (e.g. 5000 rows are covered by a keyframe every 1250 rows)"
+
+VOLATILE_KF_BUDGET = 1000
+"Maximum number of volatile keyframes to retain. The least recently used ones are evicted first."
+
+PERMANENT_KF = -1
+"Frame.lastUse value of keyframes that may never be evicted"
+
 DEAD_VALUE = "!DEAD"
 
+NO_JUNCTIONS = ()
+"""
+Junction list of arcs that don't have any junctions (i.e. most of them).
+There's one Arc per parent of each commit in the graph, so we can save
+an empty list per arc by sharing this immutable placeholder instead.
+"""
+
 Oid = _RealOidType | str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class BatchRow:
     """
     For a row in the Graph, BatchRow keeps track of the row's batch number
@@ -158,7 +184,7 @@ BATCHROW_UNDEF = BatchRow(-1, -1)
 "Use this special BatchRow as a placeholder for a row position that is yet to be determined."
 
 
-@dataclass
+@dataclass(slots=True)
 class ChainHandle:
     """ Object shared by arcs on the same chain. """
     _t: BatchRow = BATCHROW_UNDEF
@@ -220,7 +246,7 @@ class ChainHandle:
         self._b = BATCHROW_UNDEF
 
 
-@dataclass
+@dataclass(slots=True)
 class ArcJunction:
     """ Represents the merging of an Arc into another Arc. """
 
@@ -237,7 +263,7 @@ class ArcJunction:
         return self.joinedAt < other.joinedAt
 
 
-@dataclass
+@dataclass(slots=True)
 class Arc:
     """ An arc connects two commits in the graph.
 
@@ -267,8 +293,8 @@ class Arc:
     closedBy: Oid
     "Hash of the closing commit (in git parlance, the parent commit)"
 
-    junctions: list[ArcJunction]
-    "Other arcs merging into this arc"
+    junctions: list[ArcJunction] | tuple = NO_JUNCTIONS
+    "Other arcs merging into this arc (shared empty tuple until the first junction)"
 
     nextArc: Arc | None = None
     "Next node in the arc linked list"
@@ -305,6 +331,13 @@ class Arc:
     def isParentlessCommitBogusArc(self):
         return self.openedBy == self.closedBy
 
+    def signature(self) -> int:
+        """
+        Hash of what GraphSplicer compares between two frames' open arcs
+        (see GraphWeaver.openArcSignature and PlaybackState.openArcSignature).
+        """
+        return hash((self.lane, self.openedBy, self.closedBy))
+
     def isIndependentOfRowsAbove(self, row: int):
         """ Return True if this arc is entirely independent of row numbers lower than `row`. """
         return self.openedAt >= row and self.closedAt >= row
@@ -351,6 +384,46 @@ class Frame:
     openArcs: list[Arc | None]  # Arcs that have not resolved their parent commit yet
     lastArc: Arc
 
+    lastUse: int = field(default=PERMANENT_KF, compare=False, repr=False)
+    "If this frame is a volatile keyframe, tick at which it was last used by its Graph"
+
+    dependsOnRow: BatchRow | None = field(default=None, compare=False, repr=False)
+    "If this frame is a keyframe, earliest row at which any of its arcs was opened (see indexDependencies)"
+
+    danglingArcs: list[Arc] = field(default_factory=list, compare=False, repr=False)
+    "If this frame is a keyframe, open arcs whose closing row wasn't known last time we looked"
+
+    def indexDependencies(self):
+        """
+        Note which rows this keyframe depends on, so that we can tell whether
+        splicing rows at the top of the graph invalidates it without looking
+        at all of its arcs (see dependsOnRowsAbove).
+        """
+        arcs = [arc for arc in self.openArcs if arc]
+        arcs.extend(arc for arc in self.solvedArcs if arc)
+        self.dependsOnRow = min((arc.openedAt for arc in arcs), default=self.row)
+        self.danglingArcs = [arc for arc in self.openArcs if arc and not arc.closedAt.isValid()]
+
+    def dependsOnRowsAbove(self, row: int) -> bool:
+        """
+        Return True if any of this keyframe's arcs depends on rows lower than `row`,
+        i.e. if it was opened above `row`, or if it's closed above `row` or not at all.
+        Only valid for keyframes located at `row` or below it.
+        """
+        assert self.row >= row
+
+        if self.dependsOnRow is None:
+            self.indexDependencies()
+
+        if self.dependsOnRow < row:
+            return True
+
+        # All the other arcs are closed at this keyframe's row or below it.
+        # Arcs that were still dangling may have been resolved since; forget about those for good.
+        if self.danglingArcs:
+            self.danglingArcs = [arc for arc in self.danglingArcs if not arc.closedAt.isValid()]
+        return bool(self.danglingArcs)
+
     def arcsClosedByCommit(self, hiddenCommits: Set[Oid] | None = None):
         if DEVDEBUG:
             # Assume that all the arcs in solvedArcs are either None, or are closed by this commit.
@@ -540,6 +613,51 @@ class PlaybackState(Frame):
         self.callingNextWillAdvanceFrame = True
         self.seenCommits: set[Oid] = set()
 
+        self.openArcSignature = 0
+        """XOR of the signatures of the non-stale arcs in openArcs (see Arc.signature).
+        Only maintained after calling trackOpenArcSignature()."""
+
+        self.laneSignatures: list[int] = []
+        "Signature of the arc in each lane of openArcs, or 0 if the arc is stale"
+
+        self.arcExpiry: dict[int, list[Arc]] | None = None
+        "Non-stale arcs by the row at which they're closed (they go stale on the row below)"
+
+    def trackOpenArcSignature(self):
+        """
+        Start maintaining openArcSignature as playback advances.
+        This has a small cost on every row, so it's opt-in (for GraphSplicer).
+        """
+        self.openArcSignature = 0
+        self.laneSignatures = [0] * len(self.openArcs)
+        self.arcExpiry = {}
+        row = int(self.row)
+        for arc in self.openArcs:
+            if arc and not arc.isStale(row):
+                self._countArc(arc)
+
+    def _countArc(self, arc: Arc):
+        signature = arc.signature()
+        self.laneSignatures[arc.lane] = signature
+        self.openArcSignature ^= signature
+        closedAt = int(arc.closedAt)
+        if closedAt >= 0:  # dangling arcs never go stale
+            self.arcExpiry.setdefault(closedAt, []).append(arc)
+
+    def _expireArcs(self, oldRow: int, newRow: int):
+        # The arcs that were counted at oldRow are closed at oldRow or below,
+        # so the ones that go stale at newRow are closed in [oldRow, newRow).
+        arcExpiry = self.arcExpiry
+        openArcs = self.openArcs
+        laneSignatures = self.laneSignatures
+        for closedAt in range(oldRow, newRow):
+            for arc in arcExpiry.pop(closedAt, ()):
+                lane = arc.lane
+                # Skip arcs that have been replaced in their lane (already uncounted)
+                if openArcs[lane] is arc:
+                    self.openArcSignature ^= laneSignatures[lane]
+                    laneSignatures[lane] = 0
+
     def advanceToNextRow(self):
         if not self.callingNextWillAdvanceFrame:
             self.callingNextWillAdvanceFrame = True
@@ -552,6 +670,7 @@ class PlaybackState(Frame):
         goalFound = False
         goalRow = BATCHROW_UNDEF
         goalCommit = None
+        tracking = self.arcExpiry is not None
 
         while self.lastArc.nextArc:
             arc: Arc = self.lastArc.nextArc
@@ -571,6 +690,15 @@ class PlaybackState(Frame):
             self.reserveArcListCapacity(self.solvedArcs, arc.lane + 1)
             self.reserveArcListCapacity(self.openArcs, arc.lane + 1)
 
+            if tracking:
+                if len(self.laneSignatures) <= arc.lane:
+                    self.laneSignatures.extend([0] * (arc.lane + 1 - len(self.laneSignatures)))
+                self.openArcSignature ^= self.laneSignatures[arc.lane]  # uncount the arc we're replacing
+                if arc.isParentlessCommitBogusArc():  # bogus arcs are stale on their own row
+                    self.laneSignatures[arc.lane] = 0
+                else:
+                    self._countArc(arc)
+
             self.solvedArcs[arc.lane] = self.openArcs[arc.lane]  # move any open arc to "just closed"
             self.openArcs[arc.lane] = arc
             self.lastArc = arc
@@ -581,9 +709,13 @@ class PlaybackState(Frame):
         assert self.row < goalRow
         assert goalCommit is not None
 
+        oldRow = self.row
         self.row = goalRow
         self.commit = goalCommit
 
+        if tracking:
+            self._expireArcs(int(oldRow), int(goalRow))
+
         assert isinstance(self.row, BatchRow)
 
     def advanceToCommit(self, commit: Oid):
@@ -609,6 +741,31 @@ class PlaybackState(Frame):
         return self
 
 
+@dataclass
+class KeyframeStats:
+    """ Counters to help tune the density of volatile keyframes. """
+
+    hits: int = 0
+    "Frames that were served directly from a keyframe"
+
+    replays: int = 0
+    "Frames that had to be replayed from a keyframe"
+
+    rowsReplayed: int = 0
+    "Total number of rows that were stepped through while replaying"
+
+    saved: int = 0
+    "Volatile keyframes saved"
+
+    evicted: int = 0
+    "Volatile keyframes evicted to stay within VOLATILE_KF_BUDGET"
+
+    def __str__(self):
+        meanReplay = self.rowsReplayed / max(1, self.replays)
+        return (f"{self.hits} hits, {self.replays} replays ({meanReplay:.1f} rows on average), "
+                f"{self.saved} saved, {self.evicted} evicted")
+
+
 class Graph:
     keyframes: list[Frame]
     keyframeRows: list[BatchRow]
@@ -624,6 +781,17 @@ class Graph:
 
     volatilePlayer: PlaybackState | None
 
+    keyframeClock: int
+    "Incremented every time a keyframe is used; see Frame.lastUse"
+
+    numVolatileKeyframes: int
+    """
+    Upper bound on the number of volatile keyframes in `keyframes`
+    (slicing the keyframe list may drop some without updating this count)
+    """
+
+    keyframeStats: KeyframeStats
+
     def __init__(self):
         self.keyframes = []
         self.keyframeRows = []
@@ -635,10 +803,12 @@ class Graph:
             lane=-1,
             openedBy="!TOP",
             closedBy="!BOTTOM",
-            junctions=[],
             nextArc=None)
         self.ownBatches = []
         self.volatilePlayer = None
+        self.keyframeClock = 0
+        self.numVolatileKeyframes = 0
+        self.keyframeStats = KeyframeStats()
 
     def __del__(self):
         self.freeOwnBatches()
@@ -659,6 +829,9 @@ class Graph:
         self.startArc = source.startArc
         self.commitRows = source.commitRows
         self.ownBatches = source.ownBatches
+        self.keyframeClock = source.keyframeClock
+        self.numVolatileKeyframes = source.numVolatileKeyframes
+        self.keyframeStats = source.keyframeStats
 
         source.ownBatches = []
 
@@ -678,8 +851,10 @@ class Graph:
         if kfID < len(self.keyframes) and self.keyframes[kfID].row == frame.row:
             logger.info(f"Not overwriting existing keyframe {kfID}")
             assert self.keyframes[kfID] == frame.sealCopy()
+            self.keyframes[kfID].lastUse = PERMANENT_KF  # promote volatile keyframe
         else:
             kf = frame.sealCopy()
+            kf.indexDependencies()
             self.keyframes.insert(kfID, kf)
             self.keyframeRows.insert(kfID, frame.row)
         return kfID
@@ -712,6 +887,7 @@ class Graph:
         kfID = self.getBestKeyframeID(goalRow)
         if kfID >= 0:
             kf = self.keyframes[kfID]
+            self.touchKeyframe(kf)
         else:
             kf = self.initialKeyframe()
 
@@ -720,17 +896,25 @@ class Graph:
         else:
             player = PlaybackState(kf)
 
+        # Save volatile keyframes along the way if we have a long way to go.
+        # Repeated visits to the same region keep refining the keyframes there.
+        startRow = int(player.row)
+        distance = goalRow - startRow
+        if distance >= VOLATILE_KF_SPACING:
+            spacing = max(VOLATILE_KF_SPACING, distance // VOLATILE_KF_PER_REPLAY)
+        else:
+            spacing = -1
+
         # Position playback context on target row
         try:
-            volatileKeyframeCounter = 1
+            lastSavedRow = startRow
             assert player.row <= goalRow, f"{player.row} {goalRow}"
             while player.row < goalRow:
                 player.advanceToNextRow()  # raises StopIteration if depleted
 
-                # Save keyframes every now and then
-                if player.row - kf.row >= volatileKeyframeCounter:
-                    volatileKeyframeCounter *= 2
-                    self.saveKeyframe(player)
+                if spacing > 0 and player.row - lastSavedRow >= spacing:
+                    lastSavedRow = player.row
+                    self.saveVolatileKeyframe(player)
 
             assert player.row == goalRow
             player.callingNextWillAdvanceFrame = False  # let us re-obtain current frame by calling next()
@@ -739,11 +923,58 @@ class Graph:
             assert player.callingNextWillAdvanceFrame
             assert player.lastArc.nextArc is None
 
+        self.keyframeStats.replays += 1
+        self.keyframeStats.rowsReplayed += max(0, player.row - startRow)
+
         if oneOff:
             self.volatilePlayer = player
 
         return player
 
+    def touchKeyframe(self, kf: Frame):
+        if kf.lastUse != PERMANENT_KF:
+            self.keyframeClock += 1
+            kf.lastUse = self.keyframeClock
+
+    def saveVolatileKeyframe(self, frame: Frame):
+        """
+        Save a keyframe that may be evicted later if it isn't used much.
+        """
+        kfID = bisect.bisect_left(self.keyframeRows, frame.row)
+        if kfID < len(self.keyframes) and self.keyframes[kfID].row == frame.row:
+            return
+
+        self.keyframeClock += 1
+        kf = frame.sealCopy()
+        kf.lastUse = self.keyframeClock
+        kf.indexDependencies()
+        self.keyframes.insert(kfID, kf)
+        self.keyframeRows.insert(kfID, frame.row)
+        self.keyframeStats.saved += 1
+
+        self.numVolatileKeyframes += 1
+        if self.numVolatileKeyframes > VOLATILE_KF_BUDGET:
+            self.evictColdKeyframes()
+
+    def evictColdKeyframes(self):
+        """
+        Evict the least recently used volatile keyframes so that no more than
+        3/4 of the budget remains (to amortize the cost of eviction).
+        """
+        volatileUses = sorted(kf.lastUse for kf in self.keyframes if kf.lastUse != PERMANENT_KF)
+        numEvict = len(volatileUses) - VOLATILE_KF_BUDGET * 3 // 4
+        if numEvict <= 0:
+            self.numVolatileKeyframes = len(volatileUses)
+            return
+
+        threshold = volatileUses[numEvict - 1]
+        keep = [i for i, kf in enumerate(self.keyframes) if kf.lastUse == PERMANENT_KF or kf.lastUse > threshold]
+        numKept = sum(1 for i in keep if self.keyframes[i].lastUse != PERMANENT_KF)
+        self.keyframes = [self.keyframes[i] for i in keep]
+        self.keyframeRows = [self.keyframeRows[i] for i in keep]
+        self.numVolatileKeyframes = numKept
+        self.keyframeStats.evicted += len(volatileUses) - numKept
+
     def getCommitFrame(self, commit: Oid, unsafe=False) -> Frame:
         row = self.getCommitRow(commit)
         return self.getFrame(row, unsafe)
@@ -756,6 +987,8 @@ class Graph:
         if kfID >= 0 and self.keyframes[kfID].row == row:
             # Cache hit
             frame = self.keyframes[kfID]
+            self.touchKeyframe(frame)
+            self.keyframeStats.hits += 1
         else:
             # Cache miss
             frame = self.startPlayback(row)
@@ -792,14 +1025,9 @@ class Graph:
 
         # Once we reach keyframes occuring at a row >= `row`, see if we should stop deleting keyframes.
         # All open arcs, and all non-stale solved arcs, must be independent of rows <= `row`.
-        while kfID < len(self.keyframes):
-            kf = self.keyframes[kfID]
-
-            if (all(arc is None or arc.isIndependentOfRowsAbove(row) for arc in kf.openArcs)
-                    and all(arc is None or arc.isIndependentOfRowsAbove(row) or arc.isStale(row) for arc in kf.solvedArcs)):
-                break
-            else:
-                kfID += 1
+        # (Keyframes index their dependencies, so this is cheap regardless of the number of lanes.)
+        while kfID < len(self.keyframes) and self.keyframes[kfID].dependsOnRowsAbove(row):
+            kfID += 1
 
         # Delete the keyframes up to kfID.
         self.keyframes = self.keyframes[kfID:]
@@ -822,9 +1050,17 @@ class Graph:
                 deadArc.openedAt = BATCHROW_UNDEF
                 deadArc.openedBy = DEAD_VALUE
 
+        # Arcs are listed by opening row, and each keyframe knows the last arc opened
+        # at its row, so start looking from the closest keyframe above `row` rather
+        # than from the top of the list. (Call this before deleting any keyframes.)
+        kfID = self.getBestKeyframeID(row - 1)
+        arc = self.keyframes[kfID].lastArc if kfID >= 0 else self.startArc
+        assert kfID < 0 or arc.openedAt < row
+        while arc.nextArc is not None and arc.nextArc.openedAt < row:
+            arc = arc.nextArc
+
         # Rewire top of list
-        self.startArc.nextArc =\
-            next((arc for arc in self.startArc if arc.openedAt >= row), None)
+        self.startArc.nextArc = arc.nextArc
 
     def insertFront(self, frontGraph: Graph, numRowsToInsert: int):
         """
@@ -859,6 +1095,8 @@ class Graph:
             assert len(frontGraph.keyframes) == len(frontGraph.keyframeRows)
             self.keyframes = frontGraph.keyframes[:lastFrontKeyframeID + 1] + self.keyframes
             self.keyframeRows = frontGraph.keyframeRows[:lastFrontKeyframeID + 1] + self.keyframeRows
+            self.numVolatileKeyframes += frontGraph.numVolatileKeyframes
+            self.keyframeClock = max(self.keyframeClock, frontGraph.keyframeClock)
 
     def testConsistency(self):
         """ Very expensive consistency check for unit testing """
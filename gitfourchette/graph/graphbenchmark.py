@@ -0,0 +1,319 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Headless benchmarks for the graph engine.
+
+Generates synthetic commit histories of various shapes and measures the
+throughput and peak memory of the graph building blocks. Results are emitted
+as JSON so that they can be compared across commits.
+
+Usage: python -m gitfourchette.graph.graphbenchmark --help
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+
+from gitfourchette.graph.graph import Graph, Oid
+from gitfourchette.graph.graphbuilder import GraphBuildLoop, GraphSpliceLoop, MockCommit
+from gitfourchette.graph.graphtrickle import BatchTrickle, GraphTrickle
+
+SHAPES: dict[str, Callable[[int, random.Random], tuple[list[MockCommit], list[Oid]]]] = {}
+"Synthetic history generators. Each returns a commit sequence (newest first) and the heads of the history."
+
+BENCHMARKS: dict[str, Callable[[SyntheticHistory], Callable[[], int]]] = {}
+"""
+Benchmark setup functions. Each prepares its inputs from a synthetic history,
+then returns the function to measure, which returns the number of items it processed.
+"""
+
+
+def _shape(func):
+    SHAPES[func.__name__] = func
+    return func
+
+
+def _benchmark(func):
+    BENCHMARKS[func.__name__] = func
+    return func
+
+
+class _HistoryWriter:
+    """ Creates commits in chronological order (parents before children). """
+
+    def __init__(self):
+        self.commits: list[MockCommit] = []
+        self.parentsOfLater: set[Oid] = set()
+
+    def __len__(self):
+        return len(self.commits)
+
+    def commit(self, *parents: Oid) -> Oid:
+        oid = f"c{len(self.commits)}"
+        self.commits.append(MockCommit(oid, list(parents)))
+        self.parentsOfLater.update(parents)
+        return oid
+
+    def finish(self) -> tuple[list[MockCommit], list[Oid]]:
+        sequence = self.commits[::-1]  # children before parents
+        heads = [c.id for c in sequence if c.id not in self.parentsOfLater]
+        return sequence, heads
+
+
+@_shape
+def linear(size: int, rng: random.Random):
+    """ A single branch without any merges. """
+    writer = _HistoryWriter()
+    tip = writer.commit()
+    while len(writer) < size:
+        tip = writer.commit(tip)
+    return writer.finish()
+
+
+@_shape
+def mergeTrain(size: int, rng: random.Random):
+    """ A mainline into which short-lived feature branches keep getting merged. """
+    writer = _HistoryWriter()
+    tip = writer.commit()
+    while len(writer) < size:
+        feature = tip
+        for _ in range(rng.randint(1, 8)):
+            feature = writer.commit(feature)
+        tip = writer.commit(tip)
+        tip = writer.commit(tip, feature)
+    return writer.finish()
+
+
+@_shape
+def octopus(size: int, rng: random.Random):
+    """ A mainline punctuated with octopus merges of many single-commit branches. """
+    writer = _HistoryWriter()
+    tip = writer.commit()
+    while len(writer) < size:
+        arms = [writer.commit(tip) for _ in range(rng.randint(3, 12))]
+        tip = writer.commit(tip, *arms)
+    return writer.finish()
+
+
+@_shape
+def longLivedBranches(size: int, rng: random.Random):
+    """ Many branches evolving in parallel, occasionally merging each other. """
+    writer = _HistoryWriter()
+    root = writer.commit()
+    tips = [root] * 24
+    while len(writer) < size:
+        i = rng.randrange(len(tips))
+        if rng.random() < .05:
+            j = rng.randrange(len(tips))
+            parents = (tips[i],) if i == j else (tips[i], tips[j])
+        else:
+            parents = (tips[i],)
+        tips[i] = writer.commit(*parents)
+    return writer.finish()
+
+
+@dataclasses.dataclass
+class SyntheticHistory:
+    shape: str
+    sequence: list[MockCommit]
+    heads: list[Oid]
+    rng: random.Random
+
+    @staticmethod
+    def generate(shape: str, size: int, seed: int = 0) -> SyntheticHistory:
+        rng = random.Random(seed)
+        sequence, heads = SHAPES[shape](size, rng)
+        return SyntheticHistory(shape, sequence, heads, rng)
+
+    def buildGraph(self) -> Graph:
+        return GraphBuildLoop(self.heads).sendAll(self.sequence).graph
+
+
+@_benchmark
+def build(history: SyntheticHistory):
+    def run():
+        GraphBuildLoop(history.heads).sendAll(history.sequence)
+        return len(history.sequence)
+    return run
+
+
+@_benchmark
+def splice(history: SyntheticHistory):
+    """ Splice the newest 1% of the commits on top of a graph of the older commits. """
+    numNew = max(1, len(history.sequence) // 100)
+    oldSequence = history.sequence[numNew:]
+    oldParents = {p for c in oldSequence for p in c.parent_ids}
+    oldHeads = [c.id for c in oldSequence if c.id not in oldParents]
+    graph = GraphBuildLoop(oldHeads).sendAll(oldSequence).graph
+
+    def run():
+        loop = GraphSpliceLoop(graph, oldSequence, oldHeads, history.heads)
+        loop.sendAll(history.sequence)
+        return loop.numRowsAdded
+    return run
+
+
+@_benchmark
+def randomAccess(history: SyntheticHistory):
+    graph = history.buildGraph()
+    numRows = len(history.sequence)
+    rows = [history.rng.randrange(numRows) for _ in range(min(numRows, 10_000))]
+
+    def run():
+        for row in rows:
+            graph.getFrame(row)
+        return len(rows)
+    return run
+
+
+@_benchmark
+def flattenLanes(history: SyntheticHistory):
+    graph = history.buildGraph()
+    frames = [frame.sealCopy() for frame in graph.startPlayback()]
+    hiddenCommits = set()
+
+    def run():
+        assert not graph.isEmpty()  # frames are only valid as long as the graph is alive
+        for frame in frames:
+            frame.flattenLanes(hiddenCommits)
+        return len(frames)
+    return run
+
+
+@_benchmark
+def trickle(history: SyntheticHistory):
+    heads = set(history.heads)
+    hideSeeds = set(history.heads[::2])
+
+    def run():
+        hiddenTrickle = GraphTrickle.newHiddenTrickle(heads, hideSeeds)
+        foreignTrickle = GraphTrickle.newForeignTrickle(heads, hideSeeds)
+        for commit in history.sequence:
+            hiddenTrickle.newCommit(commit.id, commit.parent_ids)
+            foreignTrickle.newCommit(commit.id, commit.parent_ids)
+        return len(history.sequence)
+    return run
+
+
+@_benchmark
+def batchTrickle(history: SyntheticHistory):
+    heads = set(history.heads)
+    hideSeeds = set(history.heads[::2])
+    rows = {commit.id: row for row, commit in enumerate(history.sequence)}
+    parentRows = [[rows[p] for p in commit.parent_ids] for commit in history.sequence]
+
+    def run():
+        BatchTrickle.newHiddenTrickle(rows.__getitem__, heads, hideSeeds).run(parentRows)
+        BatchTrickle.newForeignTrickle(rows.__getitem__, heads, hideSeeds).run(parentRows)
+        return len(history.sequence)
+    return run
+
+
+def runBenchmark(benchmark: str, shape: str, size: int, repeat: int = 3, seed: int = 0, measureMemory: bool = True) -> dict:
+    """
+    Run a benchmark on a synthetic history and return its results.
+
+    The inputs are prepared afresh (from the same seed) for every run, so that
+    all runs see identical inputs; preparation isn't measured. The best time
+    of `repeat` runs is retained. Peak memory is measured in an additional
+    run, because tracemalloc slows execution down.
+    """
+    setup = BENCHMARKS[benchmark]
+
+    bestTime = float("inf")
+    items = 0
+    for _ in range(repeat):
+        run = setup(SyntheticHistory.generate(shape, size, seed))
+        startTime = time.perf_counter()
+        items = run()
+        bestTime = min(bestTime, time.perf_counter() - startTime)
+
+    peakBytes = -1
+    if measureMemory:
+        run = setup(SyntheticHistory.generate(shape, size, seed))
+        tracemalloc.start()
+        try:
+            run()
+            _current, peakBytes = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    return {
+        "benchmark": benchmark,
+        "shape": shape,
+        "size": size,
+        "items": items,
+        "seconds": bestTime,
+        "itemsPerSecond": items / bestTime if bestTime > 0 else 0.0,
+        "peakBytes": peakBytes,
+    }
+
+
+def runSuite(benchmarks=(), shapes=(), sizes=(10_000,), repeat=3, seed=0, measureMemory=True,
+             progress: Callable[[dict], None] | None = None) -> dict:
+    from gitfourchette.appconsts import APP_VERSION
+
+    results = []
+    for shape in (shapes or SHAPES):
+        for size in sizes:
+            for benchmark in (benchmarks or BENCHMARKS):
+                result = runBenchmark(benchmark, shape, size, repeat, seed, measureMemory)
+                results.append(result)
+                if progress:
+                    progress(result)
+
+    return {
+        "version": APP_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def _printResult(result: dict):
+    peak = f"{result['peakBytes'] // 1024:9,d}K" if result["peakBytes"] >= 0 else ""
+    print(f"{result['shape']:>18} {result['size']:>8,d} {result['benchmark']:>13} "
+          f"{1000 * result['seconds']:10.2f} ms {result['itemsPerSecond']:12,.0f}/s {peak}",
+          file=sys.stderr)
+
+
+def main(argv=None):
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="GitFourchette graph benchmarks")
+    parser.add_argument("-b", "--benchmark", nargs="*", choices=list(BENCHMARKS), default=[], help="Benchmarks to run (default: all)")
+    parser.add_argument("-s", "--shape", nargs="*", choices=list(SHAPES), default=[], help="History shapes to generate (default: all)")
+    parser.add_argument("-n", "--size", nargs="*", type=int, default=[10_000], help="Number of commits in each history")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="Keep the best time of this many runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="Skip peak memory measurement")
+    parser.add_argument("-o", "--output", help="Write JSON results to this file instead of stdout")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't print progress to stderr")
+    args = parser.parse_args(argv)
+
+    report = runSuite(args.benchmark, args.shape, args.size, args.repeat, args.seed,
+                      measureMemory=not args.no_memory, progress=None if args.quiet else _printResult)
+
+    text = json.dumps(report, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,13 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+from __future__ import annotations
+
 import dataclasses
 import logging
 from collections.abc import Sequence, Iterable, Callable, Set
 
-from gitfourchette.graph.graph import Graph, BatchRow, KF_INTERVAL, Oid
+from gitfourchette.graph.graph import Graph, BatchRow, Frame, KF_INTERVAL, Oid
 from gitfourchette.graph.graphsplicer import GraphSplicer
 from gitfourchette.graph.graphtrickle import GraphTrickle
 from gitfourchette.graph.graphweaver import GraphWeaver
@@ -36,6 +38,7 @@ class MockCommit:
 
 class GraphBuildLoop:
     onKeyframe: Callable[[int], None]
+    pendingKeyframes: list[Frame] | None
 
     def __init__(
             self,
@@ -43,20 +46,71 @@ class GraphBuildLoop:
             hideSeeds=None,
             localSeeds=None,
             forceHide=None,
-            keyframeInterval=KF_INTERVAL
+            keyframeInterval=KF_INTERVAL,
+            resumeGraph: Graph | None = None,
+            resumeFrame: Frame | None = None,
+            trickle: bool = True,
     ):
+        """
+        Pass trickle=False to skip the hidden/foreign trickles, e.g. if you're
+        going to compute the hidden/foreign commits in a batch afterwards (see
+        BatchTrickle). hiddenCommits and foreignCommits are then left empty.
+        """
         heads = _ensureSet(heads)
         hideSeeds = _ensureSet(hideSeeds)
         # If localSeeds was omitted, all heads are local by default
         localSeeds = _ensureSet(heads if localSeeds is None else localSeeds)
 
-        self.graph, self.weaver = GraphWeaver.newGraph()
+        if resumeGraph is None:
+            self.graph, self.weaver = GraphWeaver.newGraph()
+        else:
+            self.graph = resumeGraph
+            self.weaver = GraphWeaver.resumeGraph(resumeGraph, resumeFrame)
         self.hiddenTrickle = GraphTrickle.newHiddenTrickle(heads, hideSeeds, forceHide)
         self.foreignTrickle = GraphTrickle.newForeignTrickle(heads, localSeeds)
+        self.trickle = trickle
         self.keyframeInterval = keyframeInterval
+        self.pendingKeyframes = None
 
         self.onKeyframe = GraphBuildLoop.defaultOnKeyframe
 
+    @staticmethod
+    def resume(
+            graph: Graph,
+            lastFrame: Frame | None,
+            hiddenCommits: set[Oid],
+            foreignCommits: set[Oid],
+            heads=None,
+            hideSeeds=None,
+            localSeeds=None,
+            keyframeInterval=KF_INTERVAL
+    ) -> GraphBuildLoop:
+        """
+        Prepare a loop that weaves more commits below the last row of an
+        existing graph (e.g. to extend a truncated commit log), so that the
+        commits that are already in the graph don't need to be woven again.
+
+        `lastFrame` is the graph's frame at its last row (see GraphWeaver.resumeGraph).
+        `hiddenCommits` and `foreignCommits` are the outcome of the trickles over the
+        commits that are already in the graph, with the same heads and seeds.
+        The trickles resume from the arcs that are still waiting for their parents
+        in `lastFrame`, so the commits in the graph aren't read again.
+        """
+        loop = GraphBuildLoop(heads, hideSeeds, localSeeds, keyframeInterval=keyframeInterval,
+                              resumeGraph=graph, resumeFrame=lastFrame)
+
+        # Children of the commits that haven't been seen yet
+        pendingParents = []
+        for arc in (lastFrame.openArcs if lastFrame else ()):
+            if arc:
+                children = [arc.openedBy]
+                children.extend(j.joinedBy for j in arc.junctions)
+                pendingParents.append((arc.closedBy, children))
+
+        loop.hiddenTrickle.resume(hiddenCommits, pendingParents)
+        loop.foreignTrickle.resume(foreignCommits, pendingParents)
+        return loop
+
     def sendAll(self, sequence):
         gen = self.coBuild()
         gen.send(None)  # prime it
@@ -74,6 +128,7 @@ class GraphBuildLoop:
         weaver = self.weaver
         hiddenTrickle = self.hiddenTrickle
         foreignTrickle = self.foreignTrickle
+        trickle = self.trickle
         keyframeInterval = self.keyframeInterval
 
         while True:
@@ -86,8 +141,9 @@ class GraphBuildLoop:
             parents = commit.parent_ids
 
             weaver.newCommit(oid, parents)
-            hiddenTrickle.newCommit(oid, parents)
-            foreignTrickle.newCommit(oid, parents)
+            if trickle:
+                hiddenTrickle.newCommit(oid, parents)
+                foreignTrickle.newCommit(oid, parents)
 
             row = weaver.row
             rowInt = int(row)
@@ -97,11 +153,29 @@ class GraphBuildLoop:
 
             # Save keyframes at regular intervals for faster random access.
             if rowInt % keyframeInterval == 0:
-                graph.saveKeyframe(weaver)
+                if self.pendingKeyframes is None:
+                    graph.saveKeyframe(weaver)
+                else:
+                    self.pendingKeyframes.append(weaver.sealCopy())
                 self.onKeyframe(rowInt)
 
         logger.debug(f"Peak arc count: {weaver.peakArcCount}")
 
+    def deferKeyframes(self):
+        """
+        Hold on to new keyframes instead of saving them into the graph right away.
+        Use this if another thread reads the graph while the loop is running;
+        call flushKeyframes() when it's safe to modify the graph's keyframe lists.
+        """
+        if self.pendingKeyframes is None:
+            self.pendingKeyframes = []
+
+    def flushKeyframes(self):
+        for kf in self.pendingKeyframes or []:
+            self.graph.saveKeyframe(kf)
+        if self.pendingKeyframes:
+            self.pendingKeyframes.clear()
+
     @property
     def hiddenCommits(self):
         return self.hiddenTrickle.flaggedSet
@@ -121,6 +195,7 @@ class GraphSpliceLoop:
             hideSeeds: Set[Oid] | None = None,
             localSeeds: Set[Oid] | None = None,
             keyframeInterval=KF_INTERVAL,
+            deferGraphSplice=False,
     ):
         oldHeads = _ensureSet(oldHeads)
         newHeads = _ensureSet(newHeads)
@@ -136,6 +211,7 @@ class GraphSpliceLoop:
         self.hideSeeds = hideSeeds
         self.localSeeds = localSeeds
         self.keyframeInterval = keyframeInterval
+        self.deferGraphSplice = deferGraphSplice
 
         self.splicer = GraphSplicer(self.graph, self.oldHeads, self.newHeads)
         self.hiddenTrickle = GraphTrickle.newHiddenTrickle(self.newHeads, self.hideSeeds)
@@ -174,7 +250,8 @@ class GraphSpliceLoop:
             hiddenTrickle.newCommit(oid, parents)
             foreignTrickle.newCommit(oid, parents)
 
-        splicer.finish()
+        # Work out the equilibrium rows without touching the old graph yet
+        splicer.settle()
 
         if splicer.foundEquilibrium:
             nRemoved = splicer.equilibriumOldRow
@@ -207,6 +284,20 @@ class GraphSpliceLoop:
         self.numRowsAdded = nAdded
         self.commitSequence = newCommitSequence
 
+        if not self.deferGraphSplice:
+            self.spliceGraph()
+
+    def spliceGraph(self):
+        """
+        Splice the new commits into the old graph.
+
+        coSplice() does this automatically, unless the loop was created with
+        deferGraphSplice. Deferring lets you run coSplice() on a worker thread
+        (it only reads the old graph), then modify the old graph on the UI
+        thread while nobody's looking at it.
+        """
+        self.splicer.finish()
+
     @staticmethod
     def _stabilizeTrickle(trickle: GraphTrickle, startRow: int, newCommitSequence: list[MockCommit]):
         if trickle.done:
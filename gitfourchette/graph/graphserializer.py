@@ -0,0 +1,243 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Flattens a woven Graph into plain data (ints, lists and typed arrays) so that
+it can be written to disk and rebuilt later without replaying the commit log.
+"""
+
+from __future__ import annotations
+
+import dataclasses
+import logging
+from array import array
+from collections.abc import Sequence
+from typing import ClassVar
+
+from gitfourchette.graph.graph import (
+    Arc,
+    ArcJunction,
+    BATCHROW_UNDEF,
+    BatchRow,
+    ChainHandle,
+    Frame,
+    Graph,
+    Oid,
+    PERMANENT_KF,
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class GraphSnapshot:
+    """
+    Plain-data representation of a Graph and of the commit sequence it was
+    woven from.
+
+    All commit hashes are stored once in `oids`. The first `numRows` entries
+    are the commits in the sequence, in row order. Any hashes that are
+    referenced by the graph but that aren't part of the sequence (i.e. parents
+    beyond a truncated history) follow.
+
+    Rows are absolute row numbers, with -1 standing for BATCHROW_UNDEF.
+    """
+
+    ARRAY_FIELDS: ClassVar[tuple[str, ...]] = (
+        "parentStart", "parentOid", "chainTop", "chainBottom",
+        "arcOpenedAt", "arcClosedAt", "arcChain", "arcLane", "arcOpenedBy", "arcClosedBy",
+        "arcJunctionStart", "junctionRow", "junctionBy")
+
+    numRows: int
+    oids: list[Oid]
+
+    parentStart: array
+    "Offsets into parentOid for each commit in the sequence (CSR layout; numRows+1 entries)"
+    parentOid: array
+    "Parent hashes, as indices into `oids`"
+
+    chainTop: array
+    chainBottom: array
+
+    arcOpenedAt: array
+    arcClosedAt: array
+    arcChain: array
+    arcLane: array
+    arcOpenedBy: array
+    arcClosedBy: array
+    arcJunctionStart: array
+    "Offsets into junctionRow/junctionBy for each arc (CSR layout; numArcs+1 entries)"
+    junctionRow: array
+    junctionBy: array
+
+    keyframes: list[tuple[int, int, list[int], list[int], int]]
+    "(row, commit, solvedArc indices, openArc indices, lastArc index); arc index -1 means None/sentinel"
+
+    @property
+    def numArcs(self) -> int:
+        return len(self.arcOpenedAt)
+
+
+class GraphSerializer:
+    @staticmethod
+    def dump(graph: Graph, commitSequence: Sequence) -> GraphSnapshot:
+        """
+        Capture the state of a graph and of the commit sequence that it depicts.
+        The graph must have been woven from exactly this commit sequence.
+        """
+
+        numRows = len(commitSequence)
+        oids: list[Oid] = []
+        oidIndex: dict[Oid, int] = {}
+
+        def indexOid(oid: Oid) -> int:
+            try:
+                return oidIndex[oid]
+            except KeyError:
+                i = len(oids)
+                oids.append(oid)
+                oidIndex[oid] = i
+                return i
+
+        # Register the commits in the sequence first, in row order
+        for commit in commitSequence:
+            indexOid(commit.id)
+        assert len(oids) == numRows, "duplicate commits in sequence"
+
+        parentStart = array('i', [0])
+        parentOid = array('i')
+        for commit in commitSequence:
+            parentOid.extend(indexOid(p) for p in commit.parent_ids)
+            parentStart.append(len(parentOid))
+
+        chainIndex: dict[int, int] = {}
+        chainTop = array('i')
+        chainBottom = array('i')
+
+        def indexChain(chain: ChainHandle) -> int:
+            chain = chain.resolve()
+            try:
+                return chainIndex[id(chain)]
+            except KeyError:
+                i = len(chainTop)
+                chainIndex[id(chain)] = i
+                chainTop.append(int(chain.topRow))
+                chainBottom.append(int(chain.bottomRow))
+                return i
+
+        arcIndex: dict[int, int] = {}
+        arcOpenedAt = array('i')
+        arcClosedAt = array('i')
+        arcChain = array('i')
+        arcLane = array('i')
+        arcOpenedBy = array('i')
+        arcClosedBy = array('i')
+        arcJunctionStart = array('i', [0])
+        junctionRow = array('i')
+        junctionBy = array('i')
+
+        arc = graph.startArc.nextArc
+        while arc is not None:
+            arcIndex[id(arc)] = len(arcOpenedAt)
+            arcOpenedAt.append(int(arc.openedAt))
+            arcClosedAt.append(int(arc.closedAt))
+            arcChain.append(indexChain(arc.chain))
+            arcLane.append(arc.lane)
+            arcOpenedBy.append(indexOid(arc.openedBy))
+            arcClosedBy.append(indexOid(arc.closedBy))
+            for junction in arc.junctions:
+                junctionRow.append(int(junction.joinedAt))
+                junctionBy.append(indexOid(junction.joinedBy))
+            arcJunctionStart.append(len(junctionRow))
+            arc = arc.nextArc
+
+        def arcRef(a: Arc | None) -> int:
+            # Keyframes may retain stale arcs that were culled from the linked list;
+            # those are never looked at during playback, so drop them.
+            return -1 if a is None else arcIndex.get(id(a), -1)
+
+        keyframes = []
+        for kf in graph.keyframes:
+            # Volatile keyframes reflect this session's access patterns; don't persist them
+            if kf.lastUse != PERMANENT_KF:
+                continue
+            keyframes.append((
+                int(kf.row),
+                indexOid(kf.commit),
+                [arcRef(a) for a in kf.solvedArcs],
+                [arcRef(a) for a in kf.openArcs],
+                arcRef(kf.lastArc)))
+
+        return GraphSnapshot(
+            numRows=numRows, oids=oids, parentStart=parentStart, parentOid=parentOid,
+            chainTop=chainTop, chainBottom=chainBottom,
+            arcOpenedAt=arcOpenedAt, arcClosedAt=arcClosedAt, arcChain=arcChain, arcLane=arcLane,
+            arcOpenedBy=arcOpenedBy, arcClosedBy=arcClosedBy, arcJunctionStart=arcJunctionStart,
+            junctionRow=junctionRow, junctionBy=junctionBy, keyframes=keyframes)
+
+    @staticmethod
+    def load(snapshot: GraphSnapshot) -> Graph:
+        """
+        Rebuild a Graph from a snapshot. The new graph gets a batch of its own,
+        so it can be spliced like any freshly-woven graph.
+        """
+
+        graph = Graph()
+        batchNo = BatchRow.BatchManager.reserveNewBatch()
+        graph.ownBatches.append(batchNo)
+
+        oids = snapshot.oids
+        rows = [BatchRow(batchNo, y) for y in range(snapshot.numRows)]
+
+        def row(y: int) -> BatchRow:
+            return rows[y] if y >= 0 else BATCHROW_UNDEF
+
+        chains = [ChainHandle(row(t), row(b)) for t, b in zip(snapshot.chainTop, snapshot.chainBottom, strict=True)]
+
+        arcs: list[Arc] = []
+        lastArc = graph.startArc
+        junctionStart = snapshot.arcJunctionStart
+        junctionRow = snapshot.junctionRow
+        junctionBy = snapshot.junctionBy
+
+        for i in range(snapshot.numArcs):
+            j0, j1 = junctionStart[i], junctionStart[i + 1]
+            arc = Arc(
+                openedAt=row(snapshot.arcOpenedAt[i]),
+                closedAt=row(snapshot.arcClosedAt[i]),
+                chain=chains[snapshot.arcChain[i]],
+                lane=snapshot.arcLane[i],
+                openedBy=oids[snapshot.arcOpenedBy[i]],
+                closedBy=oids[snapshot.arcClosedBy[i]])
+            if j0 != j1:
+                arc.junctions = [ArcJunction(joinedAt=row(junctionRow[j]), joinedBy=oids[junctionBy[j]])
+                                 for j in range(j0, j1)]
+            lastArc.nextArc = arc
+            lastArc = arc
+            arcs.append(arc)
+
+        def arcRef(i: int) -> Arc | None:
+            return arcs[i] if i >= 0 else None
+
+        for kfRow, kfCommit, solved, opened, last in snapshot.keyframes:
+            kf = Frame(
+                row=row(kfRow),
+                commit=oids[kfCommit],
+                solvedArcs=[arcRef(i) for i in solved],
+                openArcs=[arcRef(i) for i in opened],
+                lastArc=arcs[last] if last >= 0 else graph.startArc)
+            graph.keyframes.append(kf)
+            graph.keyframeRows.append(kf.row)
+
+        graph.commitRows = {oids[y]: rows[y] for y in range(snapshot.numRows)}
+
+        return graph
+
+    @staticmethod
+    def parentsOf(snapshot: GraphSnapshot, y: int) -> list[Oid]:
+        """ Return the parent hashes of the commit at row `y` in the snapshot. """
+        oids = snapshot.oids
+        return [oids[p] for p in snapshot.parentOid[snapshot.parentStart[y]:snapshot.parentStart[y + 1]]]
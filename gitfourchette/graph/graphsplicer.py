@@ -17,6 +17,7 @@ from gitfourchette.graph.graph import (
     Frame,
     Graph,
     KF_INTERVAL,
+    NO_JUNCTIONS,
     Oid,
 )
 from gitfourchette.graph.graphweaver import GraphWeaver
@@ -37,6 +38,7 @@ class GraphSplicer:
 
         self.oldGraph = oldGraph
         self.oldPlayer = oldGraph.startPlayback()
+        self.oldPlayer.trackOpenArcSignature()
 
         # Commits that we must see before finding the equilibrium.
         newHeads = set(newHeads)
@@ -99,32 +101,45 @@ class GraphSplicer:
 
         # See if we're done: no more commits we want to see,
         # and the graph frames start being "equal" in both graphs.
+        # Comparing the open arc signatures rules out most rows in constant time;
+        # only compare the frames lane by lane if the signatures match.
         if (len(self.requiredNewCommits) == 0 and
                 len(self.requiredOldCommits) == 0 and
+                self.weaver.openArcSignature == self.oldPlayer.openArcSignature and
                 self.isEquilibriumReached(self.weaver, self.oldPlayer)):
             self.foundEquilibrium = True
             self.keepGoing = False
             return
 
+    def settle(self):
+        """
+        Stop consuming commits and determine where the new graph meets the old graph.
+        This doesn't modify the old graph yet; call finish() to do the actual splicing.
+        """
+        self.keepGoing = False
+
+        # Save rows for use by external code
+        self.equilibriumNewRow = int(self.weaver.row)
+        self.equilibriumOldRow = int(self.oldPlayer.row)
+        if self.foundEquilibrium:
+            self.oldGraphRowOffset = self.equilibriumNewRow - self.equilibriumOldRow
+        else:
+            self.oldGraphRowOffset = 0
+
     def finish(self):
+        self.settle()
         if self.foundEquilibrium:
             self.onEquilibriumFound()
         else:
             self.onOldGraphDepleted()
-        self.keepGoing = False
 
     def onEquilibriumFound(self):
         """Completion with equilibrium"""
 
         # We'll basically concatenate newContext[eqNewRow:] and oldContext[:eqOldRow].
-        equilibriumNewRow = int(self.weaver.row)
-        equilibriumOldRow = int(self.oldPlayer.row)
-        rowShiftInOldGraph = equilibriumNewRow - equilibriumOldRow
-
-        # Save rows for use by external code
-        self.equilibriumNewRow = equilibriumNewRow
-        self.equilibriumOldRow = equilibriumOldRow
-        self.oldGraphRowOffset = rowShiftInOldGraph
+        equilibriumNewRow = self.equilibriumNewRow
+        equilibriumOldRow = self.equilibriumOldRow
+        rowShiftInOldGraph = self.oldGraphRowOffset
 
         logger.debug(f"Equilibrium: commit={str(self.oldPlayer.commit):.7} new={equilibriumNewRow} old={equilibriumOldRow}")
 
@@ -160,18 +175,19 @@ class GraphSplicer:
                 junctions.extend(j for j in newOpenArc.junctions if j.joinedAt <= equilibriumNewRow)  # before eq
                 junctions.extend(j for j in oldOpenArc.junctions if j.joinedAt > equilibriumOldRow)  # after eq
                 assert all(junctions.count(x) == 1 for x in junctions), "duplicate junctions after splicing"
-                newOpenArc.junctions = junctions
+                newOpenArc.junctions = junctions or NO_JUNCTIONS
 
         # Do the actual splicing.
 
+        # Delete lost arcs first: this uses the keyframes above the equilibrium to skip ahead in the arc list.
+        with Benchmark("Delete lost arcs"):
+            self.oldGraph.deleteArcsDependingOnRowsAbove(equilibriumOldRow)
+
         # If we're adding a commit at the top of the graph, the closed arcs of the first keyframe will be incorrect,
         # so we must make sure to nuke the keyframe for equilibriumOldRow if it exists.
         with Benchmark("Delete lost keyframes"):
             self.oldGraph.deleteKeyframesDependingOnRowsAbove(equilibriumOldRow + 1)
 
-        with Benchmark("Delete lost arcs"):
-            self.oldGraph.deleteArcsDependingOnRowsAbove(equilibriumOldRow)
-
         with Benchmark("Delete lost rows"):
             for lostCommit in (self.oldCommitsSeen - self.newCommitsSeen):
                 del self.oldGraph.commitRows[lostCommit]
@@ -195,11 +211,6 @@ class GraphSplicer:
 
         # If we exited the loop without reaching equilibrium, the whole graph has changed.
         # In that case, steal the contents of newGraph, and bail.
-
-        self.equilibriumOldRow = int(self.oldPlayer.row)
-        self.equilibriumNewRow = int(self.weaver.row)
-        self.oldGraphRowOffset = 0
-
         self.oldGraph.shallowCopyFrom(self.newGraph)
 
     @staticmethod
@@ -4,7 +4,7 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
-from collections.abc import Iterable
+from collections.abc import Callable, Iterable, Sequence
 
 from gitfourchette.graph.graph import Oid
 
@@ -80,5 +80,233 @@ class GraphTrickle:
         assert trickle.testFrontierInputs()
         return trickle
 
+    def resume(self, flaggedSet: set[Oid], pendingParents: Iterable[tuple[Oid, Iterable[Oid]]]):
+        """
+        Pick up where a trickle with the same seeds left off, without feeding
+        it the commits that it has already seen.
+
+        `self` must be a fresh trickle. `flaggedSet` is the outcome of the
+        previous trickle, and `pendingParents` lists the commits that it
+        hasn't seen yet, along with their children that it has seen.
+        """
+        frontier = self.frontier
+        self.flaggedSet = set(flaggedSet)
+
+        # Replay what newCommit did to the frontier when it saw these children
+        for parent, children in pendingParents:
+            for child in children:
+                if child in flaggedSet:
+                    frontier.setdefault(parent, PIPE)
+                elif frontier.get(parent, STOP) != SOURCE:
+                    frontier[parent] = STOP
+
     def testFrontierInputs(self):
         return all(isinstance(head, Oid) for head in self.frontier)
+
+
+class BatchTrickle:
+    """
+    Row-based counterpart of GraphTrickle, for commit sequences that are
+    entirely known up front.
+
+    Commits are identified by their row in the sequence, and each row's parents
+    are given as a list of parent rows (leaving out the parents that aren't in
+    the sequence). Integer keys are much cheaper to hash than Oids, and a pass
+    stops as soon as there's nothing left to trickle, so this is a lot faster
+    than feeding the commits to a GraphTrickle one by one. The flags are the
+    same as GraphTrickle's with the same seeds.
+    """
+
+    def __init__(self, frontier: dict[int, int], parked: dict[Oid, int]):
+        self.frontier = frontier
+        self.parked = parked
+        "Frontier entries of the commits that aren't in the sequence yet (see feed)"
+        self.flaggedRows = []
+
+    @staticmethod
+    def _seedRows(frontier: dict[int, int], parked: dict[Oid, int], rowOf: Callable[[Oid], int],
+                  seeds: Iterable[Oid], state: int):
+        for oid in seeds:
+            try:
+                row = rowOf(oid)
+            except KeyError:
+                # Not in the sequence. It won't be reached by run(), but it may turn up in feed().
+                parked[oid] = state
+                continue
+            frontier[row] = state
+            parked.pop(oid, None)
+
+    @staticmethod
+    def newHiddenTrickle(
+            rowOf: Callable[[Oid], int],
+            allHeads: Iterable[Oid],
+            hideSeeds: Iterable[Oid],
+            forceHide: Iterable[Oid] | None = None
+    ):
+        """ See GraphTrickle.newHiddenTrickle. `rowOf` maps commits to rows, or raises KeyError. """
+        frontier, parked = {}, {}
+        BatchTrickle._seedRows(frontier, parked, rowOf, allHeads, STOP)
+        BatchTrickle._seedRows(frontier, parked, rowOf, hideSeeds, PIPE)
+        if forceHide:
+            BatchTrickle._seedRows(frontier, parked, rowOf, forceHide, SOURCE)
+        return BatchTrickle(frontier, parked)
+
+    @staticmethod
+    def newForeignTrickle(
+            rowOf: Callable[[Oid], int],
+            allHeads: Iterable[Oid],
+            localSeeds: Iterable[Oid]
+    ):
+        """ See GraphTrickle.newForeignTrickle. `rowOf` maps commits to rows, or raises KeyError. """
+        frontier, parked = {}, {}
+        BatchTrickle._seedRows(frontier, parked, rowOf, allHeads, PIPE)
+        BatchTrickle._seedRows(frontier, parked, rowOf, localSeeds, STOP)
+        return BatchTrickle(frontier, parked)
+
+    def newRow(self, row: int, parentRows: Iterable[int]) -> bool:
+        """ Trickle through a single row (in sequence order). Return True if the row is flagged. """
+        frontier = self.frontier
+
+        if frontier.pop(row, STOP) != STOP:
+            for p in parentRows:
+                frontier.setdefault(p, PIPE)
+            self.flaggedRows.append(row)
+            return True
+        else:
+            for p in parentRows:
+                if frontier.get(p, STOP) != SOURCE:
+                    frontier[p] = STOP
+            return False
+
+    def run(self, parentRows: Iterable[Iterable[int]]) -> list[int]:
+        """
+        Trickle through an entire sequence, given the parent rows of each row
+        in sequence order. Return the flagged rows.
+        """
+        frontier = self.frontier
+        flaggedRows = self.flaggedRows
+
+        # Number of rows in the frontier that may still be flagged.
+        # Once it drops to zero, no other row can be flagged.
+        live = sum(1 for state in frontier.values() if state != STOP)
+
+        for row, parents in enumerate(parentRows):
+            if not live:
+                break
+
+            if frontier.pop(row, STOP) != STOP:
+                live -= 1
+                flaggedRows.append(row)
+                for p in parents:
+                    if p not in frontier:
+                        frontier[p] = PIPE
+                        live += 1
+            else:
+                for p in parents:
+                    state = frontier.get(p, STOP)
+                    if state == PIPE:
+                        live -= 1
+                    if state != SOURCE:
+                        frontier[p] = STOP
+
+        return flaggedRows
+
+    def feed(self, firstRow: int, links: Sequence[tuple[Oid | str, list[int], list[Oid]]]) -> list[int]:
+        """
+        Trickle through the rows of a sequence that is still growing, from
+        `firstRow` onwards. Pick up where the previous call left off.
+
+        `links` gives the id of each row, the rows of its parents that are in
+        the sequence, and the ids of the parents that aren't in it yet. The
+        frontier entries of the latter are parked until they join the sequence.
+
+        Return the rows that were flagged in this call.
+        """
+        frontier = self.frontier
+        parked = self.parked
+        flaggedRows = self.flaggedRows
+        numFlagged = len(flaggedRows)
+
+        # Same early-out as run(), counting the parked commits too
+        live = sum(1 for state in frontier.values() if state != STOP)
+        live += sum(1 for state in parked.values() if state != STOP)
+        if not live:
+            return []
+
+        # Unpark the commits that have joined the sequence
+        if parked:
+            for row, (oid, _parents, _pendingParents) in enumerate(links, firstRow):
+                try:
+                    frontier[row] = parked.pop(oid)
+                except KeyError:
+                    pass
+
+        for row, (_oid, parents, pendingParents) in enumerate(links, firstRow):
+            if not live:
+                break
+
+            if frontier.pop(row, STOP) != STOP:
+                live -= 1
+                flaggedRows.append(row)
+                for table, keys in ((frontier, parents), (parked, pendingParents)):
+                    for p in keys:
+                        if p not in table:
+                            table[p] = PIPE
+                            live += 1
+            else:
+                for table, keys in ((frontier, parents), (parked, pendingParents)):
+                    for p in keys:
+                        state = table.get(p, STOP)
+                        if state == PIPE:
+                            live -= 1
+                        if state != SOURCE:
+                            table[p] = STOP
+
+        return flaggedRows[numFlagged:]
+
+    def patch(
+            self,
+            parentRows: Iterable[Iterable[int]],
+            changedRows: Iterable[int],
+            wasFlagged: Callable[[int], bool],
+    ) -> tuple[list[int], list[int]]:
+        """
+        Work out which rows change flags when some seeds of a trickle change,
+        without trickling through the entire sequence again.
+
+        `self` must be a fresh trickle set up with the new seeds. `changedRows`
+        are the rows of the seeds whose initial state differs from the old
+        trickle's, and `wasFlagged` tells whether a row was flagged by the old
+        trickle.
+
+        Whether a row is flagged only depends on its own seed and on the flags
+        of its children. So, the flags can only change for the changed seeds and,
+        transitively, for the parents of the rows whose flag changed. We stop
+        trickling as soon as we've visited all of those.
+
+        Return the rows that became flagged, and the ones that aren't anymore.
+        """
+        pending = set(changedRows)
+        newlyFlagged = []
+        newlyUnflagged = []
+
+        for row, parents in enumerate(parentRows):
+            if not pending:
+                break
+
+            flagged = self.newRow(row, parents)
+
+            if row not in pending:
+                continue
+            pending.remove(row)
+
+            if flagged == wasFlagged(row):
+                continue
+
+            if flagged:
+                newlyFlagged.append(row)
+            else:
+                newlyUnflagged.append(row)
+            pending.update(parents)
+
+        return newlyFlagged, newlyUnflagged
@@ -18,6 +18,10 @@ class GraphWeaver(Frame):
     peakArcCount: int
     batchNo: int
 
+    openArcSignature: int
+    """XOR of the signatures of the arcs in openArcs (see Arc.signature).
+    Lets GraphSplicer rule out an equilibrium without comparing every lane."""
+
     @staticmethod
     def newGraph() -> tuple[Graph, GraphWeaver]:
         graph = Graph()
@@ -26,13 +30,64 @@ class GraphWeaver(Frame):
         graph.ownBatches.append(weaver.batchNo)
         return graph, weaver
 
-    def __init__(self, startArcSentinel: Arc):
+    def __init__(self, startArcSentinel: Arc, batchNo: int = -1):
         super().__init__(row=BATCHROW_UNDEF, commit="",
                          solvedArcs=[], openArcs=[], lastArc=startArcSentinel)
         self.freeLanes = []
         self.parentLookup = collections.defaultdict(list)
         self.peakArcCount = 0
-        self.batchNo = BatchRow.BatchManager.reserveNewBatch()
+        self.openArcSignature = 0
+        self.batchNo = batchNo if batchNo >= 0 else BatchRow.BatchManager.reserveNewBatch()
+
+    @staticmethod
+    def resumeGraph(graph: Graph, frame: Frame | None) -> GraphWeaver:
+        """
+        Create a weaver that appends rows below the last row of an existing
+        graph (e.g. to extend a truncated commit log) instead of starting over.
+
+        `frame` must be the graph's frame at its last row (None if the graph is
+        empty). Get it with graph.getFrame() on the thread that owns the graph:
+        getFrame may save keyframes into the graph.
+
+        The new rows go into the batch of the last row, so they follow it
+        even if the batch gets shifted by splicing later on.
+        """
+        if graph.isEmpty():
+            assert frame is None
+            weaver = GraphWeaver(graph.startArc)
+            graph.ownBatches.append(weaver.batchNo)
+            return weaver
+
+        assert isinstance(frame.row, BatchRow)
+
+        # Find the tail of the arc list
+        lastArc = frame.lastArc
+        while lastArc.nextArc is not None:
+            lastArc = lastArc.nextArc
+
+        weaver = GraphWeaver(lastArc, batchNo=frame.row.b)
+        weaver.row = frame.row
+        weaver.commit = frame.commit
+        weaver.solvedArcs = frame.solvedArcs.copy()
+        weaver.openArcs = frame.openArcs.copy()
+
+        numLanes = max(len(weaver.openArcs), len(weaver.solvedArcs))
+        Frame.reserveArcListCapacity(weaver.openArcs, numLanes)
+        Frame.reserveArcListCapacity(weaver.solvedArcs, numLanes)
+
+        # Arcs that are still waiting for their parent commit to appear
+        for lane, arc in enumerate(weaver.openArcs):
+            if arc is None:
+                weaver.freeLanes.append(lane)
+            else:
+                assert arc.closedAt == BATCHROW_UNDEF
+                weaver.parentLookup[arc.closedBy].append(arc)
+                weaver.openArcSignature ^= arc.signature()
+                # Splicing may have aliased the chain; we'll need to write to the actual chain
+                arc.chain = arc.chain.resolve()
+
+        weaver.peakArcCount = numLanes
+        return weaver
 
     def newCommit(self, me: Oid, myParents: list[Oid]):
         """Create arcs for a new commit row."""
@@ -64,6 +119,7 @@ class GraphWeaver(Frame):
                 arc.closedAt = row
                 self.solvedArcs[arc.lane] = arc
                 self.openArcs[arc.lane] = None  # Free up the lane below
+                self.openArcSignature ^= arc.signature()
                 if hasParents and arc.lane == myHomeLane:
                     handOffHomeLane = True
                 else:
@@ -92,7 +148,11 @@ class GraphWeaver(Frame):
                     arc = min(arcsOfParent, key=lambda a: a.lane)
                     assert arc.closedBy == parent
                     assert arc.closedAt == BATCHROW_UNDEF
-                    arc.junctions.append(ArcJunction(joinedAt=row, joinedBy=me))
+                    junction = ArcJunction(joinedAt=row, joinedBy=me)
+                    if arc.junctions:
+                        arc.junctions.append(junction)
+                    else:
+                        arc.junctions = [junction]
                     continue
 
             # We didn't make a junction, so open up a new arc on a free lane.
@@ -121,8 +181,9 @@ class GraphWeaver(Frame):
             # Make arc from this commit to its parent
             newArc = Arc(lane=freeLane, chain=parentChain,
                          openedAt=row, closedAt=BATCHROW_UNDEF,
-                         openedBy=me, closedBy=parent, junctions=[])
+                         openedBy=me, closedBy=parent)
             self.openArcs[freeLane] = newArc
+            self.openArcSignature ^= newArc.signature()
             self.parentLookup[parent].append(newArc)
             self.lastArc.nextArc = newArc
             self.lastArc = newArc
@@ -149,7 +210,7 @@ class GraphWeaver(Frame):
 
             newArc = Arc(lane=myHomeLane, chain=myHomeChain,
                          openedAt=row, closedAt=row,
-                         openedBy=me, closedBy=me, junctions=[])
+                         openedBy=me, closedBy=me)
             self.lastArc.nextArc = newArc
             self.lastArc = newArc
             assert newArc.isParentlessCommitBogusArc()
@@ -0,0 +1,213 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Persistent on-disk cache of commit graphs.
+
+When a repository is closed, its woven Graph and commit sequence are written
+to the cache directory. The next time the repository is opened, PrimeRepo can
+restore the graph from the cache and splice in whatever changed in the
+meantime, instead of walking and weaving the entire history from scratch.
+
+The hidden and foreign commits are saved along with the graph, as bitmaps of
+rows. They're only valid for the tips and seeds that they were trickled from,
+i.e. if none of the refs moved while the repository was closed.
+"""
+
+import dataclasses
+import hashlib
+import logging
+import marshal
+import os
+import sys
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+
+from gitfourchette import settings
+from gitfourchette.commitstore import CommitStore
+from gitfourchette.graph import Graph, GraphSerializer, GraphSnapshot
+from gitfourchette.porcelain import *
+from gitfourchette.qt import *
+from gitfourchette.toolbox import *
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class CachedGraph:
+    graph: Graph
+    commitSequence: CommitStore
+    refs: dict[str, Oid]
+    "Refs that the graph was walked from when it was cached. Splice the graph against the current refs before use."
+    truncatedHistory: bool
+    hiddenCommits: set[Oid]
+    foreignCommits: set[Oid]
+    hideSeeds: set[Oid]
+    "Hidden tips that hiddenCommits were trickled from"
+    localSeeds: set[Oid]
+    "Local tips that foreignCommits were trickled from"
+
+
+def _rowBitmap(rowOf: Callable[[Oid], int], commits: Iterable[Oid], numRows: int) -> bytes:
+    bitmap = bytearray((numRows + 7) // 8)
+    for oid in commits:
+        row = rowOf(oid)
+        bitmap[row >> 3] |= 1 << (row & 7)
+    return bytes(bitmap)
+
+
+def _bitmapRows(bitmap: bytes) -> Iterator[int]:
+    for i, byte in enumerate(bitmap):
+        while byte:
+            bit = byte & -byte
+            yield (i << 3) + bit.bit_length() - 1
+            byte ^= bit
+
+
+class GraphCache:
+    DIR_NAME = "graphcache"
+    FILE_EXT = ".graph"
+    FORMAT_VERSION = 5
+    MAX_FILES = 50
+    _instance = None
+
+    def __init__(self):
+        if not settings.TEST_MODE:
+            cacheDir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+        else:
+            cacheDir = qTempDir()
+        self.cacheDir = os.path.join(cacheDir, GraphCache.DIR_NAME)
+
+    @staticmethod
+    def instance():
+        if not GraphCache._instance:
+            GraphCache._instance = GraphCache()
+        return GraphCache._instance
+
+    def cachePath(self, workdir: str) -> str:
+        workdir = os.path.normpath(workdir)
+        key = hashlib.sha1(workdir.encode("utf-8")).hexdigest()
+        return os.path.join(self.cacheDir, key + GraphCache.FILE_EXT)
+
+    @staticmethod
+    def _header(workdir: str) -> tuple:
+        # marshal's format may change across Python versions; don't even try to read
+        # a cache file written by another interpreter.
+        return (GraphCache.FORMAT_VERSION, sys.version_info[:2], marshal.version,
+                os.path.normpath(workdir), settings.prefs.chronologicalOrder)
+
+    @benchmark
+    def save(self, workdir: str, graph: Graph, commitSequence: CommitStore, refs: dict[str, Oid],
+             truncatedHistory: bool, truncationThreshold: int,
+             hiddenCommits: set[Oid], foreignCommits: set[Oid], hideSeeds: set[Oid], localSeeds: set[Oid]):
+        snapshot = GraphSerializer.dump(graph, commitSequence)
+        rowOf = graph.getCommitRow
+
+        data = {
+            "header": GraphCache._header(workdir),
+            "refs": [(name, oid.raw) for name, oid in refs.items()],
+            "truncatedHistory": truncatedHistory,
+            "truncationThreshold": truncationThreshold,
+            "numRows": snapshot.numRows,
+            "oids": [oid if isinstance(oid, str) else oid.raw for oid in snapshot.oids],
+            "keyframes": snapshot.keyframes,
+            "commits": commitSequence.toPlainData(),
+            "hiddenRows": _rowBitmap(rowOf, hiddenCommits, snapshot.numRows),
+            "foreignRows": _rowBitmap(rowOf, foreignCommits, snapshot.numRows),
+            "hideSeeds": [oid.raw for oid in hideSeeds],
+            "localSeeds": [oid.raw for oid in localSeeds],
+        }
+        for name in GraphSnapshot.ARRAY_FIELDS:
+            data[name] = getattr(snapshot, name).tobytes()
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+        path = self.cachePath(workdir)
+        tempPath = path + ".tmp"
+        with open(tempPath, "wb") as f:
+            marshal.dump(data, f)
+        os.replace(tempPath, path)
+
+        self.makeRoom(GraphCache.MAX_FILES)
+
+    @benchmark
+    def load(self, repo: Repo, truncationThreshold: int) -> CachedGraph | None:
+        """
+        Restore the cached graph for the given repository.
+        Return None if there's no usable graph in the cache.
+        """
+
+        path = self.cachePath(repo.workdir)
+
+        try:
+            return self._load(repo, path, truncationThreshold)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            logger.warning(f"Ignoring unusable graph cache {path}: {exc}")
+            return None
+
+    def _load(self, repo: Repo, path: str, truncationThreshold: int) -> CachedGraph | None:
+        with open(path, "rb") as f:
+            data = marshal.load(f)
+
+        if data.get("header") != GraphCache._header(repo.workdir):
+            logger.info(f"Ignoring stale graph cache {path}")
+            return None
+
+        # A truncated history is only reusable if we'd truncate it at the same point today.
+        truncatedHistory = data["truncatedHistory"]
+        if truncatedHistory and data["truncationThreshold"] != truncationThreshold:
+            return None
+
+        numRows = data["numRows"]
+        if numRows - 1 > truncationThreshold:
+            return None
+
+        oids = [x if isinstance(x, str) else Oid(raw=x) for x in data["oids"]]
+        arrays = {}
+        for name in GraphSnapshot.ARRAY_FIELDS:
+            arrays[name] = array('i')
+            arrays[name].frombytes(data[name])
+
+        snapshot = GraphSnapshot(numRows=numRows, oids=oids, keyframes=data["keyframes"], **arrays)
+        graph = GraphSerializer.load(snapshot)
+
+        commitSequence = CommitStore.fromPlainData(repo, data["commits"])
+        assert len(commitSequence) == numRows
+
+        refs = {name: Oid(raw=raw) for name, raw in data["refs"]}
+
+        hiddenCommits = {commitSequence.oid(row) for row in _bitmapRows(data["hiddenRows"])}
+        foreignCommits = {commitSequence.oid(row) for row in _bitmapRows(data["foreignRows"])}
+        hideSeeds = {Oid(raw=raw) for raw in data["hideSeeds"]}
+        localSeeds = {Oid(raw=raw) for raw in data["localSeeds"]}
+
+        return CachedGraph(graph, commitSequence, refs, truncatedHistory,
+                           hiddenCommits, foreignCommits, hideSeeds, localSeeds)
+
+    def forget(self, workdir: str):
+        try:
+            os.unlink(self.cachePath(workdir))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        self.makeRoom(0)
+
+    def makeRoom(self, maxFiles: int):
+        try:
+            files = [os.path.join(self.cacheDir, f) for f in os.listdir(self.cacheDir)
+                     if f.endswith(GraphCache.FILE_EXT)]
+        except FileNotFoundError:
+            return
+
+        if len(files) <= maxFiles:
+            return
+
+        files.sort(key=os.path.getmtime, reverse=True)
+        for path in files[maxFiles:]:
+            logger.debug(f"Deleting graph cache file {path}")
+            os.unlink(path)
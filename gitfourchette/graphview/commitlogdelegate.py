@@ -8,8 +8,8 @@ import math
 
 from gitfourchette import settings
 from gitfourchette.forms.searchbar import SearchBar
-from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow, CommitToolTipZone
-from gitfourchette.graphview.graphpaint import paintGraphFrame
+from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow, CommitToolTipZone, trimCacheDict
+from gitfourchette.graphview.graphpaint import paintGraphFrame, GraphFrameCache
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
 from gitfourchette.repomodel import RepoModel, UC_FAKEID
@@ -57,6 +57,56 @@ XSPACING = 6
 NARROW_WIDTH = (500, 750)
 
 
+@dataclass
+class CommitDisplayRecord:
+    hashText: str
+    summaryText: str
+    authorText: str
+    dateText: str
+    searchableMessage: str
+    "Lowercase commit message, for search term highlighting"
+
+
+class CommitDisplayCache:
+    """
+    Display strings of commits that have already been painted, keyed by commit.
+
+    Painting a row formats the commit's summary, author and date, which
+    involves looking up the commit's data and a fair bit of string work.
+    None of this changes unless the user tweaks some display preferences,
+    so we keep the strings around for repaints (scrolling, hovering, etc.).
+    Refbox layouts are cached by ref name, so they don't go stale if refs move.
+    The cache is flushed whenever the fonts or the display preferences change.
+    """
+
+    CacheSize = 1000
+
+    def __init__(self):
+        self.records: dict[Oid, CommitDisplayRecord] = {}
+        self.refboxes: dict[tuple, tuple[str, QFont, int]] = {}
+        self.stamp = ()
+
+    def clear(self):
+        self.records.clear()
+        self.refboxes.clear()
+        self.stamp = ()
+
+    def sync(self):
+        prefs = settings.prefs
+        stamp = (prefs.authorDisplayStyle, prefs.shortTimeFormat, prefs.authorDiffAsterisk, prefs.shortHashChars)
+        if self.stamp != stamp:
+            self.records.clear()
+            self.stamp = stamp
+
+    def get(self, oid: Oid) -> CommitDisplayRecord | None:
+        return self.records.get(oid)
+
+    def put(self, oid: Oid, record: CommitDisplayRecord):
+        self.records[oid] = record
+        # Evict the oldest entries (dicts keep key insertion order)
+        trimCacheDict(self.records, CommitDisplayCache.CacheSize)
+
+
 class CommitLogDelegate(QStyledItemDelegate):
     def __init__(self, repoWidget, parent=None):
         super().__init__(parent)
@@ -71,8 +121,13 @@ class CommitLogDelegate(QStyledItemDelegate):
         self.refboxFont = QFont()
         self.homeRefboxFont = QFont()
 
+        self.graphFrameCache = GraphFrameCache()
+        self.displayCache = CommitDisplayCache()
+
     def invalidateMetrics(self):
         self.mustRefreshMetrics = True
+        self.graphFrameCache.clear()
+        self.displayCache.clear()
 
     def refreshMetrics(self, option: QStyleOptionViewItem):
         if not self.mustRefreshMetrics:
@@ -156,26 +211,15 @@ class CommitLogDelegate(QStyledItemDelegate):
         rightBound = rect.right()
 
         # Get the info we need about the commit
-        commit: Commit | None = index.data(CommitLogModel.Role.Commit)
-        if commit and commit.id != UC_FAKEID:
-            oid = commit.id
-            author = commit.author
-            committer = commit.committer
-
-            summaryText, contd = messageSummary(commit.message, ELISION)
-            hashText = shortHash(commit.id)
-            authorText = abbreviatePerson(author, settings.prefs.authorDisplayStyle)
-
-            qdt = QDateTime.fromSecsSinceEpoch(author.time)
-            dateText = option.locale.toString(qdt, settings.prefs.shortTimeFormat)
-
-            if settings.prefs.authorDiffAsterisk:
-                if author.email != committer.email:
-                    authorText += "*"
-                if author.time != committer.time:
-                    dateText += "*"
-
-            if self.repoModel.headCommitId == commit.id:
+        oid: Oid | None = index.data(CommitLogModel.Role.Oid)
+        if oid is not None and oid != UC_FAKEID:
+            record = self.getDisplayRecord(oid, index, option)
+            hashText = record.hashText
+            summaryText = record.summaryText
+            authorText = record.authorText
+            dateText = record.dateText
+
+            if self.repoModel.headCommitId == oid:
                 painter.setFont(self.activeCommitFont)
 
             searchBar: SearchBar = self.parent().searchBar
@@ -185,7 +229,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             if not searchBar.isVisible():
                 searchTerm = ""
         else:
-            commit = None
+            record = None
             oid = None
             hashText = "·" * settings.prefs.shortHashChars
             authorText = ""
@@ -244,7 +288,7 @@ class CommitLogDelegate(QStyledItemDelegate):
         painter.restore()
 
         # ------ Highlight searched hash
-        if searchTerm and searchTermLooksLikeHash and commit and str(commit).startswith(searchTerm):
+        if searchTerm and searchTermLooksLikeHash and record and str(oid).startswith(searchTerm):
             x1 = 0
             x2 = min(len(hashText), len(searchTerm)) * hcw
             SearchBar.highlightNeedle(painter, rect, hashText, 0, len(searchTerm), x1, x2)
@@ -252,7 +296,7 @@ class CommitLogDelegate(QStyledItemDelegate):
         # ------ Graph
         rect.setLeft(leftBoundSummary)
         if oid is not None:
-            paintGraphFrame(self.repoModel, oid, painter, rect, outlineColor)
+            paintGraphFrame(self.repoModel, oid, painter, rect, outlineColor, self.graphFrameCache)
             rect.setLeft(rect.right())
 
         # ------ Set refbox/message area rect
@@ -291,7 +335,7 @@ class CommitLogDelegate(QStyledItemDelegate):
 
         # ------ Message
         # use muted color for foreign commit messages if not selected
-        if not isSelected and commit and commit.id in self.repoModel.foreignCommits:
+        if not isSelected and record and oid in self.repoModel.foreignCommits:
             painter.setPen(Qt.GlobalColor.gray)
 
         elidedSummaryText = elide(summaryText)
@@ -301,7 +345,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             toolTips.append(CommitToolTipZone(rect.left(), rect.right(), "message"))
 
         # ------ Highlight search term
-        if searchTerm and commit and searchTerm in commit.message.lower():
+        if searchTerm and record and searchTerm in record.searchableMessage:
             needlePos = summaryText.lower().find(searchTerm)
             if needlePos < 0:
                 needlePos = len(summaryText) - ELISION_LENGTH
@@ -317,7 +361,7 @@ class CommitLogDelegate(QStyledItemDelegate):
             drawFittedText(painter, rect, Qt.AlignmentFlag.AlignVCenter, authorText, minStretch=QFont.Stretch.ExtraCondensed)
 
         # ------ Highlight searched author
-        if searchTerm and commit:
+        if searchTerm and record:
             needlePos = authorText.lower().find(searchTerm)
             if needlePos >= 0:
                 highlight(authorText, needlePos, len(searchTerm))
@@ -338,6 +382,35 @@ class CommitLogDelegate(QStyledItemDelegate):
         model.setData(index, leftBoundName if authorWidth != 0 else -1, CommitLogModel.Role.AuthorColumnX)
         model.setData(index, toolTips, CommitLogModel.Role.ToolTipZones)
 
+    def getDisplayRecord(self, oid: Oid, index: QModelIndex, option: QStyleOptionViewItem) -> CommitDisplayRecord:
+        cache = self.displayCache
+        cache.sync()
+        record = cache.get(oid)
+        if record is not None:
+            return record
+
+        commit: Commit = index.data(CommitLogModel.Role.Commit)
+        author = commit.author
+        committer = commit.committer
+        message = commit.message
+
+        summaryText, contd = messageSummary(message, ELISION)
+        hashText = shortHash(oid)
+        authorText = abbreviatePerson(author, settings.prefs.authorDisplayStyle)
+
+        qdt = QDateTime.fromSecsSinceEpoch(author.time)
+        dateText = option.locale.toString(qdt, settings.prefs.shortTimeFormat)
+
+        if settings.prefs.authorDiffAsterisk:
+            if author.email != committer.email:
+                authorText += "*"
+            if author.time != committer.time:
+                dateText += "*"
+
+        record = CommitDisplayRecord(hashText, summaryText, authorText, dateText, message.lower())
+        cache.put(oid, record)
+        return record
+
     def _paintRefbox(self, painter: QPainter, rect: QRect, refName: str, isHome: bool, dark: bool):
         if refName == 'HEAD' and not self.repoModel.headIsDetached:
             return
@@ -381,7 +454,13 @@ class CommitLogDelegate(QStyledItemDelegate):
         else:
             iconSize = 0
 
-        text, fittedFont, textWidth = fitText(font, 111, text, Qt.TextElideMode.ElideMiddle, minStretch=QFont.Stretch.ExtraCondensed)
+        fitKey = (text, font is self.homeRefboxFont)
+        try:
+            text, fittedFont, textWidth = self.displayCache.refboxes[fitKey]
+        except KeyError:
+            fitted = fitText(font, 111, text, Qt.TextElideMode.ElideMiddle, minStretch=QFont.Stretch.ExtraCondensed)
+            self.displayCache.refboxes[fitKey] = fitted
+            text, fittedFont, textWidth = fitted
 
         boxRect = QRect(rect)
         boxRect.setWidth(hPadding + iconSize + 2 + textWidth + hPadding)
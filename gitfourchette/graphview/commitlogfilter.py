@@ -4,38 +4,316 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+"""
+Proxy model that hides the commits of hidden branches from the commit log.
+
+QSortFilterProxyModel keeps a mapping entry for every source row, so it has to
+call filterAcceptsRow on the entire commit sequence whenever it's invalidated,
+and it rebuilds large chunks of its mapping whenever rows are spliced at the
+top of the graph. On large histories, this dominates refresh time.
+
+CommitLogFilter never reorders rows, so it only needs to know which source rows
+are hidden. It keeps them in a sorted array (usually tiny, if not empty), and
+maps rows either way by binary search. The array stores rows relative to a base
+offset, so inserting or removing k rows at the top of the commit log only
+touches the hidden rows among those k.
+"""
+
+import bisect
+from array import array
+from collections.abc import Callable, Iterable
+
 from gitfourchette.graphview.commitlogmodel import CommitLogModel
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
 from gitfourchette.toolbox import *
 
 
-class CommitLogFilter(QSortFilterProxyModel):
+def _runs(rows: list[int]) -> list[tuple[int, int]]:
+    """ Split sorted rows into runs of consecutive rows (first, last). """
+    runs = []
+    for row in rows:
+        if runs and runs[-1][1] == row - 1:
+            runs[-1] = (runs[-1][0], row)
+        else:
+            runs.append((row, row))
+    return runs
+
+
+class CommitLogFilter(QAbstractProxyModel):
     hiddenIds: set[Oid]
 
+    _hiddenRows: array
+    "Sorted source rows that are filtered out, minus _rowBase"
+
+    _rowBase: int
+    "Offset to add to the values in _hiddenRows to get actual source rows"
+
+    _sourceRowCount: int
+    "Number of rows in the source model as far as the proxy is concerned (it may lag behind in signal handlers)"
+
     def __init__(self, parent):
         super().__init__(parent)
         self.hiddenIds = set()
-        self.setDynamicSortFilter(True)
+        self._hiddenRows = array('q')
+        self._rowBase = 0
+        self._sourceRowCount = 0
 
     @property
     def clModel(self) -> CommitLogModel:
         return self.sourceModel()
 
+    def setSourceModel(self, sourceModel: CommitLogModel):
+        assert self.sourceModel() is None, "can't swap source models"
+
+        self.beginResetModel()
+        super().setSourceModel(sourceModel)
+        sourceModel.modelAboutToBeReset.connect(self.onSourceAboutToBeReset)
+        sourceModel.modelReset.connect(self.onSourceReset)
+        sourceModel.rowsAboutToBeRemoved.connect(self.onSourceRowsAboutToBeRemoved)
+        sourceModel.rowsRemoved.connect(self.onSourceRowsRemoved)
+        sourceModel.rowsInserted.connect(self.onSourceRowsInserted)
+        sourceModel.dataChanged.connect(self.onSourceDataChanged)
+        self._rescan()
+        self.endResetModel()
+
+    # -------------------------------------------------------------------------
+    # Hidden commits
+
     @benchmark
-    def setHiddenCommits(self, hiddenIds: set[Oid]):
-        # Invalidating the filter can be costly, so avoid if possible
+    def setHiddenCommits(self, hiddenIds: set[Oid], getRow: Callable[[Oid], int] | None = None):
+        """
+        Replace the set of hidden commits.
+
+        If you pass `getRow` (to map commit IDs to rows in the source model),
+        only the rows of the commits that changed visibility are refiltered.
+        Otherwise, the entire commit sequence is scanned.
+        """
+        # Refiltering can be costly, so avoid if possible
         if self.hiddenIds == hiddenIds:
             return
+
+        if getRow is not None:
+            self.patchHiddenCommits(hiddenIds - self.hiddenIds, self.hiddenIds - hiddenIds, getRow)
+            return
+
         # Duplicate the set so we don't prematurely bail from above
         # if hidden commits change in the same set object
         self.hiddenIds = set(hiddenIds)
-        self.invalidateFilter()
 
-    def filterAcceptsRow(self, sourceRow: int, sourceParent: QModelIndex) -> bool:
+        oldRows = set(self._iterHiddenRows())
+        newRows = {row for row in range(self._sourceRowCount) if not self.filterAcceptsRow(row)}
+        self._showRows(sorted(oldRows - newRows))
+        self._hideRows(sorted(newRows - oldRows))
+
+    def extendHiddenCommits(self, hiddenIds: set[Oid]):
+        """
+        Hide more commits without refiltering any rows.
+        Only valid if none of the new hidden commits are in the source model yet,
+        e.g. right before appending rows to the source model.
+        """
+        self.hiddenIds.update(hiddenIds)
+
+    @benchmark
+    def patchHiddenCommits(self, hide: set[Oid], show: set[Oid], getRow: Callable[[Oid], int]):
+        """
+        Hide and show a few commits without refiltering the entire commit sequence.
+        `getRow` maps commit IDs to rows in the source model.
+        """
+        self.hiddenIds.difference_update(show)
+        self.hiddenIds.update(hide)
+
+        rowsToHide = []
+        rowsToShow = []
+        for oids, rows in (hide, rowsToHide), (show, rowsToShow):
+            for oid in oids:
+                try:
+                    row = getRow(oid)
+                except KeyError:
+                    continue  # not in the commit log
+                # Skip commits that aren't where the mapping says (i.e. the source model isn't up to date)
+                if self._sourceOid(row) != oid:
+                    continue
+                if self._isHiddenRow(row) != (rows is rowsToShow):
+                    continue
+                rows.append(row)
+
+        self._showRows(sorted(rowsToShow))
+        self._hideRows(sorted(rowsToHide))
+
+    def filterAcceptsRow(self, sourceRow: int, sourceParent: QModelIndex | None = None) -> bool:
+        return self._sourceOid(sourceRow) not in self.hiddenIds
+
+    def _sourceOid(self, sourceRow: int) -> Oid | None:
         try:
-            commit = self.clModel._commitSequence[sourceRow]
-            return (not commit) or (commit.id not in self.hiddenIds)
+            return self.clModel._commitSequence.oid(sourceRow)
         except IndexError:
             # Probably an extra special row
-            return True
+            return None
+
+    def hiddenSourceRows(self) -> list[int]:
+        """ Source rows that are filtered out, in ascending order. """
+        return list(self._iterHiddenRows())
+
+    # -------------------------------------------------------------------------
+    # Hidden row bookkeeping
+
+    def _iterHiddenRows(self) -> Iterable[int]:
+        base = self._rowBase
+        return (stored + base for stored in self._hiddenRows)
+
+    def _numHiddenBefore(self, sourceRow: int) -> int:
+        return bisect.bisect_left(self._hiddenRows, sourceRow - self._rowBase)
+
+    def _isHiddenRow(self, sourceRow: int) -> bool:
+        i = self._numHiddenBefore(sourceRow)
+        hiddenRows = self._hiddenRows
+        return i < len(hiddenRows) and hiddenRows[i] + self._rowBase == sourceRow
+
+    def _shiftRows(self, fromIndex: int, delta: int):
+        """ Shift the hidden rows from the given position in _hiddenRows onwards. """
+        hiddenRows = self._hiddenRows
+        if fromIndex == 0:
+            self._rowBase += delta
+        else:
+            for i in range(fromIndex, len(hiddenRows)):
+                hiddenRows[i] += delta
+
+    def _scanRows(self, first: int, last: int) -> list[int]:
+        if not self.hiddenIds:
+            return []
+        return [row for row in range(first, last + 1) if not self.filterAcceptsRow(row)]
+
+    def _rescan(self):
+        self._sourceRowCount = self.clModel.rowCount()
+        self._rowBase = 0
+        self._hiddenRows = array('q', self._scanRows(0, self._sourceRowCount - 1))
+
+    def _hideRows(self, sourceRows: list[int]):
+        """ Filter out some visible source rows (sorted). """
+        # Go bottom-up so that the proxy rows of the remaining runs stay put
+        for first, last in reversed(_runs(sourceRows)):
+            proxyFirst = first - self._numHiddenBefore(first)
+            self.beginRemoveRows(QModelIndex(), proxyFirst, proxyFirst + last - first)
+            i = self._numHiddenBefore(first)
+            base = self._rowBase
+            self._hiddenRows[i:i] = array('q', range(first - base, last + 1 - base))
+            self.endRemoveRows()
+
+    def _showRows(self, sourceRows: list[int]):
+        """ Let some hidden source rows (sorted) through the filter. """
+        # Go top-down so that the proxy rows of the previous runs are settled
+        for first, last in _runs(sourceRows):
+            i = self._numHiddenBefore(first)
+            proxyFirst = first - i
+            self.beginInsertRows(QModelIndex(), proxyFirst, proxyFirst + last - first)
+            del self._hiddenRows[i: i + last - first + 1]
+            self.endInsertRows()
+
+    # -------------------------------------------------------------------------
+    # Source model signals
+
+    def onSourceAboutToBeReset(self):
+        self.beginResetModel()
+
+    def onSourceReset(self):
+        self._rescan()
+        self.endResetModel()
+
+    def onSourceRowsAboutToBeRemoved(self, parent: QModelIndex, first: int, last: int):
+        assert not parent.isValid()
+        i = self._numHiddenBefore(first)
+        j = self._numHiddenBefore(last + 1)
+        numVisible = (last - first + 1) - (j - i)
+        if numVisible > 0:
+            proxyFirst = first - i
+            self.beginRemoveRows(QModelIndex(), proxyFirst, proxyFirst + numVisible - 1)
+
+    def onSourceRowsRemoved(self, parent: QModelIndex, first: int, last: int):
+        assert not parent.isValid()
+        i = self._numHiddenBefore(first)
+        j = self._numHiddenBefore(last + 1)
+        numRemoved = last - first + 1
+        numVisible = numRemoved - (j - i)
+
+        del self._hiddenRows[i:j]
+        self._shiftRows(i, -numRemoved)
+        self._sourceRowCount -= numRemoved
+
+        if numVisible > 0:
+            self.endRemoveRows()
+
+    def onSourceRowsInserted(self, parent: QModelIndex, first: int, last: int):
+        assert not parent.isValid()
+        numInserted = last - first + 1
+        newHiddenRows = self._scanRows(first, last)
+        numVisible = numInserted - len(newHiddenRows)
+        i = self._numHiddenBefore(first)
+
+        if numVisible > 0:
+            proxyFirst = first - i
+            self.beginInsertRows(QModelIndex(), proxyFirst, proxyFirst + numVisible - 1)
+
+        self._shiftRows(i, numInserted)
+        base = self._rowBase
+        self._hiddenRows[i:i] = array('q', (row - base for row in newHiddenRows))
+        self._sourceRowCount += numInserted
+
+        if numVisible > 0:
+            self.endInsertRows()
+
+    def onSourceDataChanged(self, topLeft: QModelIndex, bottomRight: QModelIndex, roles=()):
+        first = topLeft.row()
+        last = bottomRight.row()
+        # Clamp to the visible rows within the range
+        proxyFirst = first - self._numHiddenBefore(first)
+        proxyLast = last - self._numHiddenBefore(last + 1)
+        if proxyFirst <= proxyLast:
+            self.dataChanged.emit(self.index(proxyFirst, 0), self.index(proxyLast, 0), roles)
+
+    # -------------------------------------------------------------------------
+    # QAbstractProxyModel interface
+
+    def mapFromSource(self, sourceIndex: QModelIndex) -> QModelIndex:
+        if not sourceIndex.isValid():
+            return QModelIndex()
+        sourceRow = sourceIndex.row()
+        if self._isHiddenRow(sourceRow):
+            return QModelIndex()
+        return self.createIndex(sourceRow - self._numHiddenBefore(sourceRow), sourceIndex.column())
+
+    def mapToSource(self, proxyIndex: QModelIndex) -> QModelIndex:
+        if not proxyIndex.isValid():
+            return QModelIndex()
+        proxyRow = proxyIndex.row()
+        hiddenRows = self._hiddenRows
+        if hiddenRows:
+            # hiddenRows[k] + base - k is the proxy row right below the k-th hidden row,
+            # which is non-decreasing, so we can bisect it to count the hidden rows above proxyRow.
+            base = self._rowBase
+            proxyRow += bisect.bisect_right(range(len(hiddenRows)), proxyRow, key=lambda k: hiddenRows[k] + base - k)
+        return self.clModel.index(proxyRow, proxyIndex.column())
+
+    def index(self, row: int, column: int = 0, parent: QModelIndex = QModelIndex_default) -> QModelIndex:
+        if parent.isValid() or column != 0 or not 0 <= row < self.rowCount():
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index: QModelIndex | None = None):
+        if index is None:  # QObject.parent()
+            return super().parent()
+        return QModelIndex()
+
+    def sibling(self, row: int, column: int, index: QModelIndex) -> QModelIndex:
+        return self.index(row, column)
+
+    def rowCount(self, parent: QModelIndex = QModelIndex_default) -> int:
+        if parent.isValid():
+            return 0
+        return self._sourceRowCount - len(self._hiddenRows)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex_default) -> int:
+        return 0 if parent.isValid() else 1
+
+    def hasChildren(self, parent: QModelIndex = QModelIndex_default) -> bool:
+        return not parent.isValid() and self.rowCount() > 0
@@ -8,6 +8,7 @@ import enum
 from dataclasses import dataclass
 from typing import Literal
 
+from gitfourchette.commitstore import CommitStore
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
 from gitfourchette.repomodel import UC_FAKEID
@@ -42,7 +43,7 @@ class CommitLogModel(QAbstractListModel):
         SpecialRow      = Qt.ItemDataRole.UserRole + 4
 
     # Reference to RepoState.commitSequence
-    _commitSequence: list[Commit]
+    _commitSequence: CommitStore
     _extraRow: SpecialRow
 
     _authorColumnX: int
@@ -50,7 +51,7 @@ class CommitLogModel(QAbstractListModel):
 
     def __init__(self, parent):
         super().__init__(parent)
-        self._commitSequence = []
+        self._commitSequence = CommitStore()
         self._extraRow = SpecialRow.Invalid
         self._authorColumnX = -1
         self._toolTipZones = {}
@@ -60,16 +61,16 @@ class CommitLogModel(QAbstractListModel):
         return self._commitSequence is not None
 
     def clear(self):
-        self.setCommitSequence([])
+        self.setCommitSequence(CommitStore())
         self._toolTipZones.clear()
         self._extraRow = SpecialRow.Invalid
 
-    def setCommitSequence(self, newCommitSequence: list[Commit]):
+    def setCommitSequence(self, newCommitSequence: CommitStore):
         self.beginResetModel()
         self._commitSequence = newCommitSequence
         self.endResetModel()
 
-    def mendCommitSequence(self, nRemovedRows: int, nAddedRows: int, newCommitSequence: list[Commit]):
+    def mendCommitSequence(self, nRemovedRows: int, nAddedRows: int, newCommitSequence: CommitStore):
         parent = QModelIndex()  # it's not a tree model so there's no parent
 
         self._commitSequence = newCommitSequence
@@ -84,6 +85,39 @@ class CommitLogModel(QAbstractListModel):
             self.beginInsertRows(parent, 0, nAddedRows)
             self.endInsertRows()
 
+    def extendCommitSequence(self, newCommitSequence: CommitStore):
+        """ Replace the commit sequence with a longer one that starts with the same rows. """
+        parent = QModelIndex()  # it's not a tree model so there's no parent
+        oldCount = len(self._commitSequence)
+        newCount = len(newCommitSequence)
+        assert newCount >= oldCount
+
+        if newCount == oldCount:
+            self._commitSequence = newCommitSequence
+            return
+
+        # Make room before the extra row, if any
+        self.beginInsertRows(parent, oldCount, newCount - 1)
+        self._commitSequence = newCommitSequence
+        self.endInsertRows()
+
+    def setExtraRow(self, extraRow: SpecialRow):
+        parent = QModelIndex()  # it's not a tree model so there's no parent
+        row = len(self._commitSequence)
+
+        if self._extraRow == extraRow:
+            return
+
+        if self._extraRow != SpecialRow.Invalid:
+            self.beginRemoveRows(parent, row, row)
+            self._extraRow = SpecialRow.Invalid
+            self.endRemoveRows()
+
+        if extraRow != SpecialRow.Invalid:
+            self.beginInsertRows(parent, row, row)
+            self._extraRow = extraRow
+            self.endInsertRows()
+
     def rowCount(self, *args, **kwargs) -> int:
         if not self.isValid:
             return 0
@@ -110,9 +144,7 @@ class CommitLogModel(QAbstractListModel):
 
         elif role == CommitLogModel.Role.Oid:
             try:
-                commit = self._commitSequence[row]
-                if commit is not None:
-                    return commit.id
+                return self._commitSequence.oid(row)
             except IndexError:
                 pass
 
@@ -72,13 +72,99 @@ def getCommitBulletColumn(
     return myLanePosition, columnCount
 
 
+class GraphFrameCache:
+    """
+    Pixmaps of graph frames that have already been painted, keyed by commit.
+
+    Getting a row's frame replays the graph from the nearest keyframe, and
+    each arc is then drawn with its own QPainterPath. Caching the result turns
+    repaints of rows that we've seen before (e.g. when scrolling back and
+    forth) into blits. The cache is flushed whenever the RepoModel's graph
+    generation changes (splicing, hiding branches, etc.).
+    """
+
+    CacheSize = 500
+
+    def __init__(self):
+        self.renders: dict[tuple, tuple[QPixmap, int]] = {}
+        self.repoModel = None
+        self.stamp = ()
+
+    def clear(self):
+        self.renders.clear()
+        self.repoModel = None
+        self.stamp = ()
+
+    def sync(self, repoModel: RepoModel):
+        stamp = (repoModel.graphGeneration, settings.prefs.flattenLanes)
+        if self.repoModel is not repoModel or self.stamp != stamp:
+            self.renders.clear()
+            self.repoModel = repoModel
+            self.stamp = stamp
+
+    def get(self, key: tuple) -> tuple[QPixmap, int] | None:
+        try:
+            # Bump to end of keys (dicts keep key insertion order)
+            entry = self.renders.pop(key)
+        except KeyError:
+            return None
+        self.renders[key] = entry
+        return entry
+
+    def put(self, key: tuple, pixmap: QPixmap, numColumns: int):
+        self.renders[key] = (pixmap, numColumns)
+
+        # Nuke old entries if the cache grew beyond twice its nominal size
+        if len(self.renders) > 2 * GraphFrameCache.CacheSize:
+            for oldKey in list(self.renders.keys())[:len(self.renders) - GraphFrameCache.CacheSize]:
+                del self.renders[oldKey]
+
+
 def paintGraphFrame(
         repoModel: RepoModel,
         oid: Oid,
         painter: QPainter,
         rect: QRect,
-        outlineColor: QColor
+        outlineColor: QColor,
+        cache: GraphFrameCache | None = None,
 ):
+    if cache is None:
+        layout = _getFrameLayout(repoModel, oid)
+        if layout is not None:
+            _drawFrame(repoModel, oid, layout, painter, rect, outlineColor)
+        return
+
+    cache.sync(repoModel)
+
+    dpr = painter.device().devicePixelRatioF()
+    height = rect.height()
+    key = (oid, height, dpr, outlineColor.rgba())
+    entry = cache.get(key)
+
+    if entry is None:
+        # Render the frame to a transparent pixmap wide enough for all of its columns
+        layout = _getFrameLayout(repoModel, oid)
+        if layout is None:
+            return
+        numColumns = layout[-1]
+        pixmap = QPixmap(int((numColumns + 1) * LANE_WIDTH * dpr), int(height * dpr))
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(Qt.GlobalColor.transparent)
+        pixmapPainter = QPainter(pixmap)
+        pixmapPainter.setRenderHints(painter.renderHints())
+        _drawFrame(repoModel, oid, layout, pixmapPainter, QRect(0, 0, (numColumns + 1) * LANE_WIDTH, height), outlineColor)
+        pixmapPainter.end()
+        entry = (pixmap, numColumns)
+        cache.put(key, *entry)
+
+    pixmap, numColumns = entry
+    painter.drawPixmap(rect.topLeft(), pixmap)
+
+    # Leave the rect as _drawFrame would have
+    rect.setRight(rect.left() + LANE_WIDTH // 2 + (numColumns - 1) * LANE_WIDTH + LANE_WIDTH)
+
+
+def _getFrameLayout(repoModel: RepoModel, oid: Oid):
     graph = repoModel.graph
     hiddenCommits = repoModel.hiddenCommits
     assert graph is not None
@@ -88,19 +174,7 @@ def paintGraphFrame(
         myRow = graph.getCommitRow(oid)
     except LookupError:  # pragma: no cover
         logger.warning(f"Skipping unregistered commit: {oid}")
-        return
-
-    painter.save()
-
-    # Lines are drawn with SquareCap to fill in gaps at fractional display scaling factors.
-    # This may cause the painter to overflow to neighboring rows, so set a clip rect.
-    painter.setClipRect(rect)
-
-    # Ensure all coordinates below are integers so our straight lines don't look blurry
-    x = int(rect.left() + LANE_WIDTH // 2)
-    top = int(rect.y())
-    bottom = int(rect.y() + rect.height())  # Don't use rect.bottom(), which for historical reasons doesn't return what we want (see Qt docs)
-    middle = (top + bottom) // 2
+        return None
 
     # Get graph frame for this row
     frame = graph.getFrame(myRow)
@@ -117,6 +191,32 @@ def paintGraphFrame(
     # Get column (horizontal position) of commit bullet point.
     myColumn, numFlattenedColumns = getCommitBulletColumn(commitLane, numFlattenedColumns, laneColumnsAB)
 
+    return frame, commitLane, laneColumnsAB, myColumn, numFlattenedColumns
+
+
+def _drawFrame(
+        repoModel: RepoModel,
+        oid: Oid,
+        layout: tuple,
+        painter: QPainter,
+        rect: QRect,
+        outlineColor: QColor
+):
+    hiddenCommits = repoModel.hiddenCommits
+    frame, commitLane, laneColumnsAB, myColumn, numFlattenedColumns = layout
+
+    painter.save()
+
+    # Lines are drawn with SquareCap to fill in gaps at fractional display scaling factors.
+    # This may cause the painter to overflow to neighboring rows, so set a clip rect.
+    painter.setClipRect(rect)
+
+    # Ensure all coordinates below are integers so our straight lines don't look blurry
+    x = int(rect.left() + LANE_WIDTH // 2)
+    top = int(rect.y())
+    bottom = int(rect.y() + rect.height())  # Don't use rect.bottom(), which for historical reasons doesn't return what we want (see Qt docs)
+    middle = (top + bottom) // 2
+
     rect.setRight(x + (numFlattenedColumns - 1) * LANE_WIDTH)
     mx = x + myColumn * LANE_WIDTH  # the screen X of this commit's bullet point
 
@@ -4,12 +4,13 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+import logging
 from contextlib import suppress
 
 from gitfourchette import settings
+from gitfourchette.commitsearch import CommitSearch
 from gitfourchette.forms.searchbar import SearchBar
 from gitfourchette.globalshortcuts import GlobalShortcuts
-from gitfourchette.graph import MockCommit
 from gitfourchette.graphview.commitlogdelegate import CommitLogDelegate
 from gitfourchette.graphview.commitlogfilter import CommitLogFilter
 from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow
@@ -20,6 +21,8 @@ from gitfourchette.repomodel import UC_FAKEID
 from gitfourchette.tasks import *
 from gitfourchette.toolbox import *
 
+logger = logging.getLogger(__name__)
+
 
 class GraphView(QListView):
     linkActivated = Signal(str)
@@ -28,6 +31,12 @@ class GraphView(QListView):
     clModel: CommitLogModel
     clFilter: CommitLogFilter
 
+    PrefetchDelay = 250
+    "Milliseconds to wait after the current commit changes before prefetching its neighbors' diffs"
+
+    PrefetchRadius = 2
+    "Number of commits to prefetch above and below the current commit"
+
     class SelectCommitError(KeyError):
         def __init__(self, oid: Oid, foundButHidden: bool, likelyTruncated: bool = False):
             super().__init__()
@@ -47,12 +56,23 @@ class GraphView(QListView):
     def __init__(self, parent):
         super().__init__(parent)
 
+        # Diff the neighbors of the current commit while the user is idle (see currentChanged)
+        self.prefetchTimer = QTimer(self)
+        self.prefetchTimer.setSingleShot(True)
+        self.prefetchTimer.setInterval(GraphView.PrefetchDelay)
+        self.prefetchTimer.timeout.connect(self.prefetchNeighbors)
+
         self.clModel = CommitLogModel(self)
         self.clFilter = CommitLogFilter(self)
         self.clFilter.setSourceModel(self.clModel)
 
         self.setModel(self.clFilter)
 
+        if settings.DEVDEBUG and HAS_QTEST:
+            self.modelTester = QAbstractItemModelTester(self.clFilter)
+            if not settings.TEST_MODE:
+                logger.warning("Commit log model tester enabled. This will SIGNIFICANTLY slow down graph refreshes!")
+
         # Massive perf boost when displaying/updating huge commit logs
         self.setUniformItemSizes(True)
 
@@ -67,7 +87,12 @@ class GraphView(QListView):
         self.searchBar = SearchBar(self, self.tr("Find a commit by hash, message or authorFind commit"))
         self.searchBar.detectHashes = True
         self.searchBar.setUpItemViewBuddy()
+        self.searchBar.searchPulse.connect(self.onSearchPulse)
         self.searchBar.hide()
+        self._commitSearch = None
+
+        # Load more commits when the user scrolls near the bottom of a truncated history
+        self.verticalScrollBar().actionTriggered.connect(self.onScrollBarAction)
 
         self.refreshPrefs(invalidateMetrics=False)
 
@@ -151,9 +176,22 @@ class GraphView(QListView):
             menu.deleteLater()
 
     def clear(self):
+        self.prefetchTimer.stop()
         self.clModel.clear()
+        self._commitSearch = None
         self.onSetCurrent()
 
+    def onScrollBarAction(self, _action: int):
+        if self.clModel._extraRow != SpecialRow.TruncatedHistory:
+            return
+        if not self.repoWidget.isLoaded or self.repoModel.graphIncomplete:
+            return
+
+        # The slider position has been adjusted, but the value hasn't been propagated yet
+        scrollBar = self.verticalScrollBar()
+        if scrollBar.sliderPosition() >= scrollBar.maximum() - scrollBar.pageStep():
+            self.linkActivated.emit(makeInternalLink("expandlog"))
+
     def mouseDoubleClickEvent(self, event: QMouseEvent):
         currentIndex = self.currentIndex()
         if not currentIndex.isValid() or event.button() != Qt.MouseButton.LeftButton:
@@ -242,6 +280,15 @@ class GraphView(QListView):
         else:
             self.onSetCurrent(selected.indexes()[0])
 
+    def currentChanged(self, current: QModelIndex, previous: QModelIndex):
+        super().currentChanged(current, previous)
+
+        # This is called even if our signals are blocked (e.g. when Jump selects a commit)
+        if current.isValid() and current.data(CommitLogModel.Role.SpecialRow) == SpecialRow.Commit:
+            self.prefetchTimer.start()
+        else:
+            self.prefetchTimer.stop()
+
     def onSetCurrent(self, current: QModelIndex = QModelIndex_default):
         if self.signalsBlocked():  # Don't bother with the jump if our signals are blocked
             return
@@ -259,6 +306,30 @@ class GraphView(QListView):
                 locator = NavLocator(NavContext.SPECIAL, path=str(special))
         Jump.invoke(self, locator)
 
+    def prefetchNeighbors(self):
+        """
+        Diff the commits around the current row ahead of time (see CommitDiffCache)
+        in a background task. Never competes with a running task.
+        """
+        if self.repoWidget.repoTaskRunner.isBusy():
+            self.prefetchTimer.start()
+            return
+
+        current = self.currentIndex()
+        if self.repoModel is None or not current.isValid():
+            return
+
+        model = self.model()
+        oids = []
+        for distance in range(1, GraphView.PrefetchRadius + 1):
+            for row in (current.row() + distance, current.row() - distance):
+                index = model.index(row, 0)
+                if index.isValid() and index.data(CommitLogModel.Role.SpecialRow) == SpecialRow.Commit:
+                    oids.append(index.data(CommitLogModel.Role.Oid))
+
+        if oids:
+            PrefetchCommits.invoke(self, oids)
+
     def selectRowForLocator(self, locator: NavLocator, force=False):
         filterIndex = self.getFilterIndexForLocator(locator)
         if force or filterIndex.row() != self.currentIndex().row():
@@ -318,24 +389,37 @@ class GraphView(QListView):
     # -------------------------------------------------------------------------
     # Find text in commit message or hash
 
+    def commitSearch(self) -> CommitSearch:
+        term = self.searchBar.searchTerm
+        likelyHash = self.searchBar.searchTermLooksLikeHash
+        authorStyle = settings.prefs.authorDisplayStyle
+        store = self.clModel._commitSequence
+
+        # Reuse the search until the term or the commit sequence changes
+        if self._commitSearch is None or not self._commitSearch.isSearching(store, term, likelyHash, authorStyle):
+            self._commitSearch = CommitSearch(store, term, likelyHash, authorStyle)
+        return self._commitSearch
+
     def searchRange(self, searchRange: range) -> QModelIndex | None:
         model = self.model()  # to filter out hidden rows, don't use self.clModel directly
+        clModel = self.clModel
 
-        term = self.searchBar.searchTerm
-        likelyHash = self.searchBar.searchTermLooksLikeHash
-        assert term
-        assert term == term.lower(), "search term should have been sanitized"
-
-        for i in searchRange:
-            index = model.index(i, 0)
-            commit = model.data(index, CommitLogModel.Role.Commit)
-            if commit is None or type(commit) is MockCommit:
-                continue
-            if likelyHash and str(commit.id).startswith(term):
-                return index
-            if term in commit.message.lower():
-                return index
-            if term in abbreviatePerson(commit.author, settings.prefs.authorDisplayStyle).lower():
+        if not searchRange:
+            return None
+
+        # The filter preserves the order of the rows, so map the bounds of the range to the source model
+        first = model.mapToSource(model.index(searchRange[0], 0)).row()
+        last = model.mapToSource(model.index(searchRange[-1], 0)).row()
+        step = searchRange.step
+
+        for row in self.commitSearch().findRows(range(first, last + step, step)):
+            index = model.mapFromSource(clModel.index(row, 0))
+            if index.isValid():
                 return index
 
         return None
+
+    def onSearchPulse(self):
+        if self.searchBar.searchTerm:
+            count = self.commitSearch().countMatches(self.clFilter.hiddenSourceRows())
+            self.searchBar.showMatchCount(count)
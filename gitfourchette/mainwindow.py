@@ -312,7 +312,7 @@ class MainWindow(QMainWindow):
 
             ActionDef(
                 self.tr("&Refresh"),
-                lambda: self.currentRepoWidget().refreshRepo(),
+                lambda: self.currentRepoWidget().refreshRepoThoroughly(),
                 shortcuts=GlobalShortcuts.refresh,
                 icon="SP_BrowserReload",
                 tip=self.tr("Check for changes in the repo (on the local filesystem only – will not fetch remotes)"),
@@ -556,7 +556,7 @@ class MainWindow(QMainWindow):
         if not settings.prefs.autoRefresh:
             return
         with suppress(NoRepoWidgetError):
-            self.currentRepoWidget().refreshRepo()
+            self.currentRepoWidget().refreshRepoAfterExternalChanges()
 
     def onRepoNameChange(self, rw: RepoWidget):
         self.refreshTabText(rw)
@@ -1073,6 +1073,7 @@ class MainWindow(QMainWindow):
         warnIfChanged = [
             "chronologicalOrder",  # need to reload entire commit sequence
             "maxCommits",
+            "loadHiddenBranches",
         ]
 
         warnIfNeedRestart = [
@@ -0,0 +1,105 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Cheap signatures of the files that back each part of RepoModel's caches.
+
+RefreshRepo runs on every refocus and after every task. Re-reading the refs
+(and peeling them all to sort them by commit time), the stashes, the
+submodules, etc. adds up in large repos, even though most refreshes don't
+change anything. Before each sync step, RepoModel compares a fingerprint of
+the step's inputs to the one it saw last time, and skips the step if they
+match. A fingerprint is just a bunch of stat results, so a no-op refresh
+costs a handful of stat calls.
+
+Git rewrites its files by renaming a lock file over them, so the inode number
+changes on every write. This makes the signatures reliable even if the
+filesystem has coarse timestamps.
+"""
+
+import os
+from collections.abc import Iterable
+
+from gitfourchette.porcelain import *
+
+
+def statSignature(path: str) -> tuple:
+    """ Return a signature that changes whenever the file at `path` is rewritten. """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ()
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def treeSignature(path: str) -> tuple:
+    """ Return the stat signatures of a directory and of everything below it. """
+    signatures = []
+    stack = [path]
+    while stack:
+        dirPath = stack.pop()
+        signatures.append((dirPath, statSignature(dirPath)))
+        try:
+            with os.scandir(dirPath) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            else:
+                signatures.append((entry.path, statSignature(entry.path)))
+    return tuple(signatures)
+
+
+class RepoFingerprint:
+    def __init__(self, repo: Repo):
+        self.gitDir = repo.path
+        self.workdir = repo.workdir or ""
+
+        # Linked worktrees keep their own HEAD and index, but share refs and config with the main repo
+        try:
+            with open(os.path.join(self.gitDir, "commondir"), encoding="utf-8") as f:
+                commonDir = f.read().strip()
+            self.commonDir = os.path.normpath(os.path.join(self.gitDir, commonDir))
+        except OSError:
+            self.commonDir = self.gitDir
+
+    def gitFile(self, name: str) -> tuple:
+        return statSignature(os.path.join(self.gitDir, name))
+
+    def commonFile(self, name: str) -> tuple:
+        return statSignature(os.path.join(self.commonDir, name))
+
+    def index(self) -> tuple:
+        return self.gitFile("index")
+
+    def refs(self) -> tuple:
+        return (
+            self.gitFile("HEAD"),
+            self.commonFile("packed-refs"),
+            treeSignature(os.path.join(self.commonDir, RefPrefix.HEADS)),
+            treeSignature(os.path.join(self.commonDir, RefPrefix.REMOTES)),
+            treeSignature(os.path.join(self.commonDir, RefPrefix.TAGS)),
+        )
+
+    def mergeheads(self) -> tuple:
+        return self.gitFile("MERGE_HEAD")
+
+    def stashes(self) -> tuple:
+        return self.commonFile("refs/stash"), self.commonFile("logs/refs/stash")
+
+    def submodules(self, paths: Iterable[str]) -> tuple:
+        # Submodules are listed in .gitmodules; they're initialized if their .git is present
+        if not self.workdir:
+            return ()
+        return (
+            statSignature(os.path.join(self.workdir, DOT_GITMODULES)),
+            tuple(statSignature(os.path.join(self.workdir, path, ".git")) for path in paths),
+        )
+
+    def remotes(self) -> tuple:
+        return self.commonFile("config")
@@ -9,8 +9,12 @@ from collections import defaultdict
 from collections.abc import Generator, Iterable
 
 from gitfourchette import settings
-from gitfourchette.graph import Graph, GraphSpliceLoop, MockCommit
+from gitfourchette.commitsearch import CommitSearch
+from gitfourchette.commitstore import CommitStore
+from gitfourchette.diffcache import CommitDiffCache
+from gitfourchette.graph import BatchTrickle, Graph, GraphSpliceLoop, MockCommit
 from gitfourchette.porcelain import *
+from gitfourchette.repofingerprint import RepoFingerprint
 from gitfourchette.repoprefs import RepoPrefs
 from gitfourchette.toolbox import *
 
@@ -36,11 +40,23 @@ class RepoModel:
     """Walker used to generate the graph. Call initializeWalker before use.
     Keep it around to speed up ulterior refreshes."""
 
-    commitSequence: list[Commit]
-    "Ordered list of commits."
+    walkerRow: int
+    """Number of commits that the walker has produced, if they are exactly the
+    real commits in commitSequence (in order); -1 if unknown. If this matches
+    numRealCommits, the walker can pick up where it left off (see resumeWalker)."""
+
+    commitSequence: CommitStore
+    "Ordered sequence of commits."
 
     truncatedHistory: bool
 
+    truncationThreshold: int
+    "Maximum number of commits that PrimeRepo was allowed to load."
+
+    graphIncomplete: bool
+    """True while a task is still weaving commits into the graph, so the graph may not reflect the refs yet
+    (e.g. PrimeRepo is streaming the commit log, or RefreshRepo is splicing new commits)."""
+
     graph: Graph
 
     refs: dict[str, Oid]
@@ -78,6 +94,12 @@ class RepoModel:
     hiddenCommits: set[Oid]
     "All cached commit oids that are hidden."
 
+    graphGeneration: int
+    "Bumped whenever the graph or the hidden commits change. Lets GraphView know that its cached renders are stale."
+
+    commitDiffCache: CommitDiffCache
+    "Diffs of recently-viewed commits (see LoadCommit)."
+
     workdirStale: bool
     "Flag indicating that the workdir should be refreshed before use."
 
@@ -87,16 +109,29 @@ class RepoModel:
     headIsDetached: bool
     homeBranch: str
 
+    graphTips: set[Oid]
+    "Tips that the graph was walked from (see getKnownTips)."
+
     prefs: RepoPrefs
 
+    fingerprint: RepoFingerprint
+    syncedFingerprints: dict[str, tuple]
+    "Fingerprints of the inputs of each sync step, as of the last time the step ran (see RepoFingerprint)."
+
     def __init__(self, repo: Repo):
         assert isinstance(repo, Repo)
 
-        self.commitSequence = []
+        self.commitSequence = CommitStore(repo)
         self.truncatedHistory = True
+        self.truncationThreshold = 0
+        self.graphIncomplete = False
 
         self.walker = None
+        self.walkerRow = -1
         self.graph = Graph()
+        self.graphGeneration = 0
+        self.graphTips = set()
+        self.commitDiffCache = CommitDiffCache()
 
         self.headIsDetached = False
         self.homeBranch = ""
@@ -120,6 +155,9 @@ class RepoModel:
 
         self.repo = repo
 
+        self.fingerprint = RepoFingerprint(repo)
+        self.syncedFingerprints = {}
+
         self.prefs = RepoPrefs(repo)
         self.prefs._parentDir = repo.path
         self.prefs.load()
@@ -142,6 +180,30 @@ class RepoModel:
         """ Oid of the currently checked-out commit. """
         return self.refs.get("HEAD", NULL_OID)
 
+    def isSynced(self, step: str, fingerprint: tuple) -> bool:
+        """
+        Return True if the inputs of a sync step haven't changed since it last ran.
+        Take the fingerprint BEFORE reading the data that it covers.
+        """
+        return self.syncedFingerprints.get(step) == fingerprint
+
+    def markSynced(self, step: str, fingerprint: tuple):
+        """
+        Remember the fingerprint that was taken before a sync step, once the step has succeeded.
+        (If the step raises, it'll run again next time.)
+        """
+        self.syncedFingerprints[step] = fingerprint
+
+    def forgetFingerprints(self):
+        """ Force all sync steps to run next time. """
+        self.syncedFingerprints.clear()
+
+    def syncIndex(self):
+        fingerprint = self.fingerprint.index()
+        if not self.isSynced("index", fingerprint):
+            self.repo.refresh_index()
+            self.markSynced("index", fingerprint)
+
     @benchmark
     def syncRefs(self):
         """ Refresh cached refs (`refs` and `refsAt`).
@@ -150,6 +212,10 @@ class RepoModel:
         refresh, or False if nothing changed.
         """
 
+        fingerprint = self.fingerprint.refs()
+        if self.isSynced("refs", fingerprint):
+            return False
+
         headWasDetached = self.headIsDetached
         self.headIsDetached = self.repo.head_is_detached
 
@@ -167,6 +233,7 @@ class RepoModel:
 
             # Nothing to do!
             # Still, signal a change if HEAD just detached/reattached.
+            self.markSynced("refs", fingerprint)
             return headWasDetached != self.headIsDetached
 
         # Build reverse ref cache
@@ -188,13 +255,18 @@ class RepoModel:
 
         # Since the refs have changed, we need to refresh hidden refs
         self.refreshHiddenRefCache()
+        self.markSynced("refs", fingerprint)
 
         # Let caller know that the refs changed.
         return True
 
     @benchmark
     def syncMergeheads(self):
+        fingerprint = self.fingerprint.mergeheads()
+        if self.isSynced("mergeheads", fingerprint):
+            return False
         mh = self.repo.listall_mergeheads()
+        self.markSynced("mergeheads", fingerprint)
         if mh != self.mergeheads:
             self.mergeheads = mh
             return True
@@ -202,9 +274,13 @@ class RepoModel:
 
     @benchmark
     def syncStashes(self):
+        fingerprint = self.fingerprint.stashes()
+        if self.isSynced("stashes", fingerprint):
+            return False
         stashes = []
         for stash in self.repo.listall_stashes():
             stashes.append(stash.commit_id)
+        self.markSynced("stashes", fingerprint)
         if stashes != self.stashes:
             self.stashes = stashes
             return True
@@ -212,8 +288,12 @@ class RepoModel:
 
     @benchmark
     def syncSubmodules(self):
+        fingerprint = self.fingerprint.submodules(self.submodules.values())
+        if self.isSynced("submodules", fingerprint):
+            return False
         submodules = self.repo.listall_submodules_dict()
         initializedSubmodules = {name for name, path in submodules.items() if self.repo.submodule_dotgit_present(path)}
+        self.markSynced("submodules", fingerprint)
 
         if submodules != self.submodules or initializedSubmodules != self.initializedSubmodules:
             self.submodules = submodules
@@ -227,7 +307,11 @@ class RepoModel:
         # We could infer remote names from refCache, but we don't want
         # to miss any "blank" remotes that don't have any branches yet.
         # RemoteCollection.names() is much faster than iterating on RemoteCollection itself
+        fingerprint = self.fingerprint.remotes()
+        if self.isSynced("remotes", fingerprint):
+            return False
         remotes = list(self.repo.remotes.names())
+        self.markSynced("remotes", fingerprint)
         if remotes != self.remotes:
             self.remotes = remotes
             return True
@@ -244,7 +328,7 @@ class RepoModel:
 
     @benchmark
     def primeWalker(self) -> Walker:
-        tipIds = self.refs.values()
+        tipIds = self.getKnownTips()
         sorting = SortMode.TOPOLOGICAL
 
         if settings.prefs.chronologicalOrder:
@@ -267,8 +351,39 @@ class RepoModel:
         for tip in tipIds:
             self.walker.push(tip)
 
+        # The caller is responsible for setting this if it keeps track of the commits it consumes
+        self.walkerRow = -1
+
         return self.walker
 
+    def resumeWalker(self) -> Walker | None:
+        """
+        Get a walker that produces the commits that come after the last commit
+        in commitSequence, e.g. to extend a truncated history.
+
+        If the walker isn't where commitSequence left off anymore (e.g. it was
+        used to refresh the top of the graph), walk past the commits that are
+        already in commitSequence. Return None if a fresh walk doesn't agree
+        with commitSequence.
+        """
+        numCommits = self.numRealCommits
+        if self.walker is not None and self.walkerRow == numCommits:
+            return self.walker
+
+        walker = self.primeWalker()
+        sequence = self.commitSequence
+        row = 0
+        for row, commit in zip(range(1, numCommits + 1), walker, strict=False):
+            if commit.id != sequence.oid(row):
+                logger.warning(f"Walker doesn't agree with commit sequence at row {row}")
+                return None
+
+        if row != numCommits:
+            return None
+
+        self.walkerRow = numCommits
+        return walker
+
     def uncommittedChangesMockCommit(self):
         try:
             head = self.refs["HEAD"]
@@ -313,13 +428,24 @@ class RepoModel:
         return arcs[0].openedBy == UC_FAKEID
 
     @benchmark
-    def syncTopOfGraph(self, oldRefs: dict[str, Oid]) -> GraphSpliceLoop:
-        # DO NOT call processEvents() here. While splicing a large amount of
-        # commits, GraphView may try to repaint an incomplete graph.
-        # GraphView somehow ignores setUpdatesEnabled(False) here!
+    def syncTopOfGraph(self) -> GraphSpliceLoop:
+        gsl = self.walkTopOfGraph()
+        self.applyTopOfGraph(gsl)
+        return gsl
+
+    @benchmark
+    def walkTopOfGraph(self) -> GraphSpliceLoop:
+        """
+        Weave new commits at the top of the graph (from the tips that have appeared
+        since `graphTips`) without modifying the graph itself. The graph is only read,
+        so this may run on a worker thread while GraphView is painting the current graph.
+
+        Call applyTopOfGraph() afterwards to splice the result into the graph.
+        """
         gsl = GraphSpliceLoop(self.graph, self.commitSequence,
-                              oldHeads=oldRefs.values(), newHeads=self.refs.values(),
-                              hideSeeds=self.getHiddenTips(), localSeeds=self.getLocalTips())
+                              oldHeads=self.graphTips, newHeads=self.getKnownTips(),
+                              hideSeeds=self.getHiddenTips(), localSeeds=self.getLocalTips(),
+                              deferGraphSplice=True)
         coSplice = gsl.coSplice()
         coSplice.send(None)  # prime the generator
 
@@ -337,31 +463,94 @@ class RepoModel:
                     break
         coSplice.close()  # flush it
 
-        self.commitSequence = gsl.commitSequence
+        if not isinstance(gsl.commitSequence, CommitStore):
+            # No equilibrium: the splice loop hands back a plain list of the new commits
+            store = CommitStore(self.repo)
+            store.extend(gsl.commitSequence)
+            gsl.commitSequence = store
+
+        CommitSearch.warmUp(gsl.commitSequence)
+        return gsl
+
+    @benchmark
+    def applyTopOfGraph(self, gsl: GraphSpliceLoop):
+        """
+        Splice the result of walkTopOfGraph() into the graph and adopt the new
+        commit sequence. If the graph is on display, call this on the UI thread.
+        """
+        # DO NOT call processEvents() here. While splicing a large amount of
+        # commits, GraphView may try to repaint an incomplete graph.
+        # GraphView somehow ignores setUpdatesEnabled(False) here!
+        gsl.spliceGraph()
+
+        commitSequence = gsl.commitSequence
+        commitSequence.resolveParentRows(self.graph.getCommitRow)
+
+        self.commitSequence = commitSequence
+        self.graphTips = set(gsl.newHeads)
         self.hideSeeds = gsl.hideSeeds
         self.localSeeds = gsl.localSeeds
         self.hiddenCommits = gsl.hiddenCommits
         self.foreignCommits = gsl.foreignCommits
+        self.graphGeneration += 1
 
-        return gsl
+    def newBatchTrickles(self, graph: Graph) -> tuple[BatchTrickle, BatchTrickle]:
+        """
+        Set up hidden/foreign trickles according to hideSeeds, localSeeds and graphTips,
+        for the rows of `graph` (see trickleCommits).
+        """
+        rowOf = graph.getCommitRow
+        hiddenTrickle = BatchTrickle.newHiddenTrickle(rowOf, self.graphTips, self.hideSeeds)
+        foreignTrickle = BatchTrickle.newForeignTrickle(rowOf, self.graphTips, self.localSeeds)
+        return hiddenTrickle, foreignTrickle
 
     @benchmark
-    def toggleHideRefPattern(self, refPattern: str):
+    def trickleCommits(self, commitSequence: CommitStore, start: int,
+                       trickles: tuple[BatchTrickle, BatchTrickle]) -> tuple[list[Oid], list[Oid]]:
+        """
+        Feed the rows of a growing commit sequence, from `start` onwards, to the
+        trickles returned by newBatchTrickles. Return the newly hidden and foreign commits.
+        """
+        links = list(commitSequence.iterParentLinks(start))
+        hiddenTrickle, foreignTrickle = trickles
+        hiddenRows = hiddenTrickle.feed(start, links)
+        foreignRows = foreignTrickle.feed(start, links)
+        return [links[row - start][0] for row in hiddenRows], [links[row - start][0] for row in foreignRows]
+
+    def toggleHideRefPattern(self, refPattern: str) -> tuple[set[Oid], set[Oid]]:
+        """
+        Hide or unhide the refs matching a pattern and patch hiddenCommits accordingly.
+        Return the commits that became hidden, and the ones that became visible.
+        """
         toggleSetElement(self.prefs.hiddenRefPatterns, refPattern)
         self.prefs.setDirty()
         self.refreshHiddenRefCache()
 
-        # Sync hidden commits
-        heads = self.refs.values()
+        # Sync hidden commits. Only the commits below the tips that changed visibility
+        # are trickled through again. (If we don't load hidden branches, the caller must
+        # also splice the graph with syncTopOfGraph so that it matches the new known tips.)
+        # Local seeds don't depend on hidden refs, so foreignCommits stays valid.
         newHideSeeds = self.getHiddenTips()
-        newLocalSeeds = self.getLocalTips()
-        gsl = GraphSpliceLoop(self.graph, self.commitSequence, oldHeads=heads, newHeads=heads,
-                              hideSeeds=newHideSeeds, localSeeds=newLocalSeeds)
-        gsl.sendAll(self.commitSequence)  # send the same commit sequence
-        self.hiddenCommits = gsl.hiddenCommits
-        self.foreignCommits = gsl.foreignCommits
+        sequence = self.commitSequence
+        rowOf = self.graph.getCommitRow
+        hiddenCommits = self.hiddenCommits
+        trickle = BatchTrickle.newHiddenTrickle(rowOf, self.graphTips, newHideSeeds)
+        changedRows = []
+        for oid in self.hideSeeds ^ newHideSeeds:
+            try:
+                changedRows.append(rowOf(oid))
+            except KeyError:
+                continue
+        hideRows, showRows = trickle.patch(sequence.iterParentRows(), changedRows,
+                                           lambda row: sequence.oid(row) in hiddenCommits)
+        newlyHidden = {sequence.oid(row) for row in hideRows}
+        newlyShown = {sequence.oid(row) for row in showRows}
+
+        self.hiddenCommits.difference_update(newlyShown)
+        self.hiddenCommits.update(newlyHidden)
         self.hideSeeds = newHideSeeds
-        self.localSeeds = newLocalSeeds
+        self.graphGeneration += 1
+        return newlyHidden, newlyShown
 
     @benchmark
     def refreshHiddenRefCache(self):
@@ -398,7 +587,18 @@ class RepoModel:
             self.prefs.setDirty()
 
     def getKnownTips(self) -> Iterable[Oid]:
-        return self.refs.values()
+        """
+        Return the tips to walk the graph from: all refs, unless we don't want to load
+        commits that only belong to hidden branches (in which case they're left out).
+        """
+        if settings.prefs.loadHiddenBranches:
+            return self.refs.values()
+        hiddenTips = self.getHiddenTips()
+        return [oid for oid in self.refs.values() if oid not in hiddenTips]
+
+    def graphTipsStale(self) -> bool:
+        """ Return True if the graph must be spliced to match the current known tips. """
+        return self.graphTips != set(self.getKnownTips())
 
     def getLocalTips(self):
         return {
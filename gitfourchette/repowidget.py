@@ -20,6 +20,7 @@ from gitfourchette.forms.openrepoprogress import OpenRepoProgress
 from gitfourchette.forms.searchbar import SearchBar
 from gitfourchette.forms.unloadedrepoplaceholder import UnloadedRepoPlaceholder
 from gitfourchette.globalshortcuts import GlobalShortcuts
+from gitfourchette.graphcache import GraphCache
 from gitfourchette.graphview.graphview import GraphView
 from gitfourchette.nav import NavHistory, NavLocator, NavContext
 from gitfourchette.porcelain import *
@@ -29,6 +30,7 @@ from gitfourchette.sidebar.sidebar import Sidebar
 from gitfourchette.tasks import RepoTask, TaskEffects, TaskBook, AbortMerge, RepoTaskRunner
 from gitfourchette.toolbox import *
 from gitfourchette.trtables import TrTables
+from gitfourchette.workdirwatcher import WorkdirWatcher
 
 logger = logging.getLogger(__name__)
 
@@ -110,8 +112,10 @@ class RepoWidget(QStackedWidget):
         self.repoTaskRunner.progress.connect(self.onRepoTaskProgress)
         self.repoTaskRunner.repoGone.connect(self.onRepoGone)
         self.repoTaskRunner.requestAttention.connect(self.requestAttention)
+        self.repoTaskRunner.ready.connect(self.onRepoTaskRunnerReady)
 
         self.repoModel = None
+        self.workdirWatcher = None
         self.pendingPath = os.path.normpath(pendingWorkdir)
         self.pendingLocator = NavLocator()
         self.pendingEffects = TaskEffects.Nothing
@@ -527,11 +531,17 @@ class RepoWidget(QStackedWidget):
             self.repoTaskRunner.killCurrentTask()
             self.repoTaskRunner.joinZombieTask()
 
+            # Save the commit graph so the repo opens faster next time
+            self.saveGraphCache()
+
             # Free the repository
             self.repoModel.repo.free()
             self.repoModel.repo = None
             logger.info(f"Repository freed: {self.pendingPath}")
 
+        # Stop watching the workdir
+        self.setWorkdirWatcher(None)
+
         # Forget RepoModel
         self.repoModel = None
         self.updateBoundRepo()
@@ -557,6 +567,20 @@ class RepoWidget(QStackedWidget):
             if self.isVisible():
                 self.refreshWindowChrome()
 
+    def saveGraphCache(self):
+        repoModel = self.repoModel
+        if repoModel.graph.isEmpty() or repoModel.graphIncomplete:
+            return
+        # Only record the refs that the graph was walked from (hidden branches may have been left out)
+        graphRefs = {name: oid for name, oid in repoModel.refs.items() if oid in repoModel.graphTips}
+        try:
+            GraphCache.instance().save(
+                repoModel.repo.workdir, repoModel.graph, repoModel.commitSequence, graphRefs,
+                repoModel.truncatedHistory, repoModel.truncationThreshold,
+                repoModel.hiddenCommits, repoModel.foreignCommits, repoModel.hideSeeds, repoModel.localSeeds)
+        except OSError as e:
+            logger.warning(f"OSError when writing graph cache: {e}")
+
     def loadPatchInNewWindow(self, patch: Patch, locator: NavLocator):
         try:
             diffDocument = DiffDocument.fromPatch(patch, locator)
@@ -684,12 +708,17 @@ class RepoWidget(QStackedWidget):
 
     def toggleHideRefPattern(self, refPattern: str):
         assert refPattern.startswith("refs/")
-        self.repoModel.toggleHideRefPattern(refPattern)
-        self.graphView.clFilter.setHiddenCommits(self.repoModel.hiddenCommits)
+        repoModel = self.repoModel
+        newlyHidden, newlyShown = repoModel.toggleHideRefPattern(refPattern)
+        self.graphView.clFilter.patchHiddenCommits(newlyHidden, newlyShown, repoModel.graph.getCommitRow)
 
         # Hide/draw refboxes for commits that are shared by non-hidden refs
         self.graphView.viewport().update()
 
+        # If we don't load hidden branches, splice their commits into (or out of) the graph
+        if repoModel.graphTipsStale():
+            self.refreshRepo(TaskEffects.Refs)
+
     # -------------------------------------------------------------------------
 
     def setInitialFocus(self):
@@ -700,13 +729,38 @@ class RepoWidget(QStackedWidget):
         if not self.focusWidget():  # only if nothing has the focus yet
             self.graphView.setFocus()
 
-    def refreshRepo(self, effects: TaskEffects = TaskEffects.DefaultRefresh, jumpTo: NavLocator = NavLocator.Empty):
+    def setWorkdirWatcher(self, watcher: WorkdirWatcher | None):
+        if self.workdirWatcher is not None:
+            self.workdirWatcher.deleteLater()
+        self.workdirWatcher = watcher
+
+    def refreshRepoThoroughly(self):
+        """ Refresh the repo without relying on any cached fingerprints (e.g. when the user explicitly asks for it). """
+        if self.repoModel is not None:
+            self.repoModel.forgetFingerprints()
+        self.refreshRepo()
+
+    def refreshRepoAfterExternalChanges(self):
+        """ Refresh the repo when the user may have changed it outside the app (e.g. upon regaining focus). """
+        effects = TaskEffects.DefaultRefresh
+        if self.workdirWatcher is not None and not self.workdirWatcher.isStale():
+            # Nothing has changed in the workdir since we last diffed it, don't bother rediffing it
+            effects &= ~TaskEffects.Workdir
+        self.refreshRepo(effects, trustIndexFingerprint=True)
+
+    def refreshRepo(self, effects: TaskEffects = TaskEffects.DefaultRefresh, jumpTo: NavLocator = NavLocator.Empty,
+                    trustIndexFingerprint: bool = False):
         """Refresh the repo as soon as possible."""
 
         if (not self.isLoaded) or self.isPriming:
             return
         assert self.repoModel is not None
 
+        if (effects & TaskEffects.Workdir) and not trustIndexFingerprint and self.workdirWatcher is not None:
+            # We may have modified the index in memory without touching the index file,
+            # so force the staged changes to be rediffed.
+            self.workdirWatcher.invalidateIndexFingerprint()
+
         if not self.isVisible() or self.repoTaskRunner.isBusy():
             # Can't refresh right now. Stash the effect bits for later.
             logger.debug(f"Stashing refresh bits {repr(effects)}")
@@ -881,6 +935,23 @@ class RepoWidget(QStackedWidget):
         elif not self.busyCursorDelayer.isActive():
             self.busyCursorDelayer.start()
 
+    def onRepoTaskRunnerReady(self):
+        # Give the runner a chance to settle before starting background work
+        QTimer.singleShot(0, self.startBackgroundTasks)
+
+    def startBackgroundTasks(self):
+        """ Start optional work that may be interrupted by any other task. """
+        if not self.isLoaded or self.repoTaskRunner.isBusy():
+            return
+
+        # Detect renames in a large commit whose file list was shown without them
+        flv = self.committedFiles
+        locator = self.navLocator
+        if (flv.skippedRenameDetection
+                and locator.context == NavContext.COMMITTED
+                and locator.commit == flv.commitId):
+            self.runTask(tasks.DetectRenames, flv.commitId)
+
     def onRepoGone(self):
         message = self.tr("Repository folder went missing:") + "\n" + escamp(self.pendingPath)
 
@@ -936,11 +1007,10 @@ class RepoWidget(QStackedWidget):
             locator = NavLocator.parseUrl(url)
             self.jump(locator)
         elif url.authority() == "expandlog":
-            # After loading, jump back to what is currently the last commit
-            self.pendingLocator = NavLocator.inCommit(self.repoModel.commitSequence[-1].id)
-            # Reload the repo
-            maxCommits = int(kwargs.get("n", self.repoModel.nextTruncationThreshold))
-            self.primeRepo(force=True, maxCommits=maxCommits)
+            # Load more commits below the existing ones (ignore repeated requests, e.g. from scrolling)
+            if not isinstance(self.repoTaskRunner.currentTask, tasks.ExpandLog):
+                maxCommits = int(kwargs.get("n", self.repoModel.nextTruncationThreshold))
+                self.runTask(tasks.ExpandLog, maxCommits)
         elif url.authority() == "opensubfolder":
             p = self.repo.in_workdir(simplePath)
             self.openRepo.emit(p, NavLocator())
@@ -96,6 +96,7 @@ class Prefs(PrefsFile):
     authorDisplayStyle          : AuthorDisplayStyle    = AuthorDisplayStyle.FULL_NAME
     shortTimeFormat             : str                   = list(SHORT_DATE_PRESETS.values())[0]
     maxCommits                  : int                   = 10000
+    loadHiddenBranches          : bool                  = True
     authorDiffAsterisk          : bool                  = True
     alternatingRowColors        : bool                  = False
 
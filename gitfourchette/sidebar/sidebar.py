@@ -482,6 +482,11 @@ class Sidebar(QTreeView):
         self.sidebarModel.rebuild(repoModel)
         self.restoreExpandedItems()
 
+        # The model isn't necessarily reset, but start from a blank selection anyway so that
+        # the next jump picks the most relevant ref (see selectAnyRef). RefreshRepo restores
+        # the selection from the backup if the user didn't move elsewhere.
+        self.selectionModel().clear()
+
     def backUpSelection(self):
         try:
             self.selectionBackup = SidebarNode.fromIndex(self.selectedIndexes()[0])
@@ -6,7 +6,9 @@
 
 from __future__ import annotations
 
+import bisect
 import logging
+from collections import defaultdict
 from collections.abc import Iterable
 from contextlib import suppress
 from typing import Any
@@ -100,6 +102,29 @@ class SidebarLayout:
     ])
 
 
+def _longestIncreasingSubsequence(values: list[int]) -> set[int]:
+    """ Return the positions (in `values`) of a longest strictly increasing subsequence of `values`. """
+    tailPositions: list[int] = []  # position of the smallest tail of each increasing run length
+    tailValues: list[int] = []
+    predecessors = [-1] * len(values)
+    for i, v in enumerate(values):
+        k = bisect.bisect_left(tailValues, v)
+        if k > 0:
+            predecessors[i] = tailPositions[k - 1]
+        if k == len(tailValues):
+            tailValues.append(v)
+            tailPositions.append(i)
+        else:
+            tailValues[k] = v
+            tailPositions[k] = i
+    positions = set()
+    i = tailPositions[-1] if tailPositions else -1
+    while i >= 0:
+        positions.add(i)
+        i = predecessors[i]
+    return positions
+
+
 class SidebarNode:
     children: list[SidebarNode]
     parent: SidebarNode | None
@@ -194,6 +219,9 @@ class SidebarModel(QAbstractItemModel):
     collapseCache: set[str]
     collapseCacheValid: bool
 
+    stashMessageCache: dict[Oid, str]
+    "Stripped stash messages, so that we don't have to look up every stash commit on every rebuild"
+
     class Role:
         Ref = Qt.ItemDataRole(Qt.ItemDataRole.UserRole + 0)
         IconKey = Qt.ItemDataRole(Qt.ItemDataRole.UserRole + 1)
@@ -211,6 +239,7 @@ class SidebarModel(QAbstractItemModel):
 
         self.collapseCache = set()
         self.collapseCacheValid = False
+        self.stashMessageCache = {}
 
         self.clear()
 
@@ -290,7 +319,19 @@ class SidebarModel(QAbstractItemModel):
 
     @benchmark
     def rebuild(self, repoModel: RepoModel):
-        self.beginResetModel()
+        """
+        Rebuild the node tree from the RepoModel's caches.
+
+        If the model was already showing this repo, the new tree is merged into
+        the existing one with fine-grained row insertions/removals (see mergeChildren),
+        so that views keep their selection, expanded folders and scroll position.
+        Otherwise, the model is reset.
+        """
+        incremental = self.repoModel is repoModel and bool(self.rootNode.children)
+        oldRootNode = self.rootNode
+
+        if not incremental:
+            self.beginResetModel()
 
         repo = repoModel.repo
 
@@ -410,9 +451,14 @@ class SidebarModel(QAbstractItemModel):
         # -----------------------------
         # Stashes
         # -----------------------------
+        stashMessageCache = {}
         for i, stashCommitId in enumerate(repoModel.stashes):
-            message = repo[stashCommitId].message
-            message = strip_stash_message(message)
+            try:
+                message = self.stashMessageCache[stashCommitId]
+            except KeyError:
+                message = repo[stashCommitId].message
+                message = strip_stash_message(message)
+            stashMessageCache[stashCommitId] = message
             refName = f"stash@{{{i}}}"
             node = SidebarNode(SidebarItem.Stash, str(stashCommitId))
             node.displayName = message
@@ -429,10 +475,101 @@ class SidebarModel(QAbstractItemModel):
             if submoduleKey not in repoModel.initializedSubmodules:
                 node.warning = self.tr("Submodule not initialized.")
 
+        self.stashMessageCache = stashMessageCache
+
         # -----------------------------
         # Commit new model
         # -----------------------------
-        self.endResetModel()
+        if not incremental:
+            self.endResetModel()
+            return
+
+        # Graft the new tree onto the old one, reusing the nodes that haven't changed
+        newRootNode = self.rootNode
+        self.rootNode = oldRootNode
+        keptNodes: dict[SidebarNode, SidebarNode] = {}
+        self.mergeChildren(oldRootNode, newRootNode, keptNodes)
+        self.nodesByRef = {ref: keptNodes.get(node, node) for ref, node in self.nodesByRef.items()}
+
+    def mergeChildren(self, oldParent: SidebarNode, newParent: SidebarNode, keptNodes: dict[SidebarNode, SidebarNode]):
+        """
+        Turn the children of oldParent into those of newParent, emitting row insertion/removal signals.
+        Children that are in both lists (same kind and data) are kept, and merged recursively.
+        Populates keptNodes with the new nodes that were superseded by old nodes.
+        """
+        keptNodes[newParent] = oldParent
+        oldParent.displayName = newParent.displayName
+        oldParent.warning = newParent.warning
+
+        oldChildren = oldParent.children
+        newChildren = newParent.children
+        parentIndex = QModelIndex() if oldParent is self.rootNode else oldParent.createIndex(self)
+
+        # Match children by kind and data. Some nodes aren't unique (e.g. spacers), so also key them by occurrence.
+        def keyChildren(children: list[SidebarNode]):
+            occurrences = defaultdict(int)
+            for node in children:
+                occurrences[(node.kind, node.data)] += 1
+                yield node.kind, node.data, occurrences[(node.kind, node.data)]
+
+        newRows = {key: row for row, key in enumerate(keyChildren(newChildren))}
+
+        # Keep the largest set of old children that appear in the same order in the new list
+        # (e.g. a branch moving to the top of a time-sorted list is a removal + insertion)
+        candidates = [(oldRow, newRows[key])
+                      for oldRow, key in enumerate(keyChildren(oldChildren))
+                      if key in newRows]
+        keep = _longestIncreasingSubsequence([newRow for _oldRow, newRow in candidates])
+        keptOldRows = {candidates[i][0] for i in keep}
+        keptNewRows = {candidates[i][1] for i in keep}
+
+        # Remove stale children in contiguous runs, bottom-up so that row numbers stay valid
+        row = len(oldChildren) - 1
+        while row >= 0:
+            if row in keptOldRows:
+                row -= 1
+                continue
+            last = row
+            while row >= 0 and row not in keptOldRows:
+                row -= 1
+            self.beginRemoveRows(parentIndex, row + 1, last)
+            del oldChildren[row + 1: last + 1]
+            for i in range(row + 1, len(oldChildren)):
+                oldChildren[i].row = i
+            self.endRemoveRows()
+
+        # Insert fresh children in contiguous runs, top-down
+        row = 0
+        while row < len(newChildren):
+            if row in keptNewRows:
+                row += 1
+                continue
+            first = row
+            while row < len(newChildren) and row not in keptNewRows:
+                row += 1
+            self.beginInsertRows(parentIndex, first, row - 1)
+            for node in newChildren[first:row]:
+                node.parent = oldParent
+            oldChildren[first:first] = newChildren[first:row]
+            for i in range(first, len(oldChildren)):
+                oldChildren[i].row = i
+            self.endInsertRows()
+
+        assert [(n.kind, n.data) for n in oldChildren] == [(n.kind, n.data) for n in newChildren]
+
+        # Recurse into the children that we kept
+        for row in keptNewRows:
+            oldNode = oldChildren[row]
+            if oldNode.mayHaveChildren():
+                self.mergeChildren(oldNode, newChildren[row], keptNodes)
+            else:
+                keptNodes[newChildren[row]] = oldNode
+                oldNode.displayName = newChildren[row].displayName
+                oldNode.warning = newChildren[row].warning
+
+        # Anything may look different (checked-out branch, hidden refs, etc.)
+        if oldChildren:
+            self.dataChanged.emit(oldChildren[0].createIndex(self), oldChildren[-1].createIndex(self))
 
     def populateRefNodeTree(self, shorthands: list[str], containerNode: SidebarNode, kind: SidebarItem, refNamePrefix: str, sortMode: RefSort = RefSort.Default):
         pendingFolders: dict[str, SidebarNode] = {}
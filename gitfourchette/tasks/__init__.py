@@ -52,8 +52,8 @@ from gitfourchette.tasks.jumptasks import (
     JumpToUncommittedChanges,
     RefreshRepo,
 )
-from gitfourchette.tasks.loadtasks import PrimeRepo
-from gitfourchette.tasks.loadtasks import LoadWorkdir, LoadCommit, LoadPatch
+from gitfourchette.tasks.loadtasks import PrimeRepo, ExpandLog
+from gitfourchette.tasks.loadtasks import LoadWorkdir, LoadCommit, LoadPatch, DetectRenames, PrefetchCommits
 from gitfourchette.tasks.nettasks import (
     DeleteRemoteBranch,
     RenameRemoteBranch,
@@ -18,7 +18,7 @@ from gitfourchette.diffview.diffdocument import DiffDocument
 from gitfourchette.diffview.specialdiff import SpecialDiffError, DiffConflict, DiffImagePair
 from gitfourchette.graphview.commitlogmodel import SpecialRow
 from gitfourchette.nav import NavLocator, NavContext, NavFlags
-from gitfourchette.porcelain import DeltaStatus, NULL_OID, Oid, Patch
+from gitfourchette.porcelain import DeltaStatus, NULL_OID, Patch
 from gitfourchette.qt import *
 from gitfourchette.repomodel import UC_FAKEID
 from gitfourchette.sidebar.sidebarmodel import UC_FAKEREF
@@ -45,6 +45,8 @@ class Jump(RepoTask):
         patch: Patch | None = None
 
     def canKill(self, task: RepoTask):
+        if isinstance(task, RefreshRepo) and task.splicingGraph:
+            return False
         return isinstance(task, Jump | RefreshRepo)
 
     def flow(self, locator: NavLocator):
@@ -130,14 +132,26 @@ class Jump(RepoTask):
             # so that it stays stale if this task gets interrupted.
             repoModel.workdirStale = True
 
+            # Skip the staged changes if the watcher can vouch that the index hasn't changed
+            watcher = rw.workdirWatcher
+            reloadStaged = (watcher is None
+                            or previousLocator.context == NavContext.EMPTY
+                            or locator.hasFlags(NavFlags.ForceRecreateDocument)
+                            or watcher.isIndexStale())
+
+            # Changes occurring during LoadWorkdir will make the workdir stale again
+            if watcher is not None:
+                watcher.markClean()
+
             # Load workdir (async)
             workdirTask = yield from self.flowSubtask(
-                LoadWorkdir, allowWriteIndex=locator.hasFlags(NavFlags.AllowWriteIndex))
+                LoadWorkdir, allowWriteIndex=locator.hasFlags(NavFlags.AllowWriteIndex), reloadStaged=reloadStaged)
 
-            # Fill FileListViews
-            with QSignalBlockerContext(rw.dirtyFiles, rw.stagedFiles):  # Don't emit jump signals
-                rw.dirtyFiles.setContents([workdirTask.dirtyDiff], False)
-                rw.stagedFiles.setContents([workdirTask.stageDiff], False)
+            # Fill FileListViews. Patch them rather than resetting them: (un)staging
+            # a file only affects a couple rows, and the lists may be very long.
+            rw.dirtyFiles.updateContents([workdirTask.dirtyDiff], False)
+            if workdirTask.stageDiff is not None:
+                rw.stagedFiles.updateContents([workdirTask.stageDiff], False)
 
             nDirty = rw.dirtyFiles.model().rowCount()
             nStaged = rw.stagedFiles.model().rowCount()
@@ -156,6 +170,8 @@ class Jump(RepoTask):
             repoModel.numUncommittedChanges = newNumChanges
 
             repoModel.workdirStale = False
+            if watcher is not None:
+                watcher.syncIndexFingerprint()
 
             # Show number of staged changes in sidebar and graph
             if numChangesDifferent:
@@ -331,7 +347,7 @@ class Jump(RepoTask):
         # Warning banner
         if not area.diffBanner.lastWarningWasDismissed:
             if flv.skippedRenameDetection:
-                warnings.append(self.tr("Rename detection was skipped to load this large commit faster."))
+                warnings.append(self.tr("Renames are being detected in the background in this large commit."))
             elif locator.hasFlags(NavFlags.AllowLargeCommits | NavFlags.ForceDiff):
                 n = sum(sum(1 if delta.status == DeltaStatus.RENAMED else 0 for delta in diff.deltas) for diff in diffs)
                 warnings.append(self.tr("%n renames detected.", "", n))
@@ -453,8 +469,13 @@ class JumpToHEAD(Jump):
 
 
 class RefreshRepo(RepoTask):
+    splicingGraph: bool = False
+    "True while new commits are being woven on the worker thread. Killing the task then would desync the graph from the refs."
+
     @staticmethod
     def canKill_static(task: RepoTask):
+        if isinstance(task, RefreshRepo) and task.splicingGraph:
+            return False
         return task is None or isinstance(task, Jump | RefreshRepo)
 
     def canKill(self, task: RepoTask):
@@ -493,7 +514,7 @@ class RefreshRepo(RepoTask):
 
         # Refresh the index
         if effectFlags & TaskEffects.Index:
-            repoModel.repo.refresh_index()
+            repoModel.syncIndex()
 
         if effectFlags & (TaskEffects.Head | TaskEffects.Workdir):
             submodulesChanged = repoModel.syncSubmodules()
@@ -503,7 +524,6 @@ class RefreshRepo(RepoTask):
 
         if effectFlags & (TaskEffects.Refs | TaskEffects.Remotes | TaskEffects.Head):
             # Refresh ref cache
-            oldRefs = repoModel.refs
             oldHeadBranch = repoModel.homeBranch
 
             refsChanged = repoModel.syncRefs()
@@ -511,9 +531,9 @@ class RefreshRepo(RepoTask):
             stashesChanged = repoModel.syncStashes()
             homeBranchChanged = oldHeadBranch != repoModel.homeBranch
 
-            # Load commits from changed refs only
-            if refsChanged:
-                self.syncTopOfGraph(oldRefs)
+            # Load commits from changed refs only (or from branches that were just unhidden)
+            if refsChanged or repoModel.graphTipsStale():
+                yield from self.syncTopOfGraph()
 
         # Schedule a repaint of the entire GraphView if the refs changed
         if effectFlags & (TaskEffects.Head | TaskEffects.Refs):
@@ -582,27 +602,38 @@ class RefreshRepo(RepoTask):
         logger.debug(f"Changes detected on refresh: "
                      f"Ref={refsChanged} Stash={stashesChanged} Submo={submodulesChanged} Remote={remotesChanged}")
 
-    def syncTopOfGraph(self, oldRefs: dict[str, Oid]):
+    def syncTopOfGraph(self):
         repoModel = self.repoModel
         graphView = self.rw.graphView
         clModel = graphView.clModel
         clFilter = graphView.clFilter
 
-        # Make sure we're on the UI thread.
-        # We don't want GraphView to try to read an incomplete state while repainting.
-        assert onAppThread()
-
-        # Update our graph model
-        gsl = repoModel.syncTopOfGraph(oldRefs)
+        # Walk and weave new commits on the worker thread. This only reads the current graph,
+        # which GraphView may keep painting in the meantime.
+        self.splicingGraph = True
+        repoModel.graphIncomplete = True
+        try:
+            yield from self.flowEnterWorkerThread()
+            gsl = repoModel.walkTopOfGraph()
+
+            # Splice the new commits into the graph on the UI thread, in one go with the model update,
+            # so that GraphView never gets to repaint an incomplete state.
+            yield from self.flowEnterUiThread()
+            repoModel.applyTopOfGraph(gsl)
+        finally:
+            # Don't leave the graph locked if the walk fails or the task gets interrupted
+            repoModel.graphIncomplete = False
+            self.splicingGraph = False
 
         with QSignalBlockerContext(graphView):
-            # Hidden commits may have changed in RepoState.syncTopOfGraph!
-            # If new commits are part of a hidden branch, we've got to invalidate the CommitFilter.
-            clFilter.setHiddenCommits(repoModel.hiddenCommits)
-
             if gsl.numRowsRemoved >= 0:
                 # Sync top of graphview
                 clModel.mendCommitSequence(gsl.numRowsRemoved, gsl.numRowsAdded, repoModel.commitSequence)
             else:
                 # Replace graph wholesale
                 clModel.setCommitSequence(repoModel.commitSequence)
+
+            # Hidden commits may have changed in RepoState.syncTopOfGraph!
+            # The new rows were filtered with the old hidden commits, so refilter
+            # the rows of the commits whose visibility has changed since.
+            clFilter.setHiddenCommits(repoModel.hiddenCommits, repoModel.graph.getCommitRow)
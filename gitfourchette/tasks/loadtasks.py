@@ -9,16 +9,21 @@ import logging
 from gitfourchette import colors
 from gitfourchette import settings
 from gitfourchette.application import GFApplication
+from gitfourchette.commitsearch import CommitSearch
+from gitfourchette.commitstore import CommitStore
 from gitfourchette.diffview.diffdocument import DiffDocument
 from gitfourchette.diffview.specialdiff import (ShouldDisplayPatchAsImageDiff, SpecialDiffError, DiffImagePair)
-from gitfourchette.graph import GraphBuildLoop
+from gitfourchette.graph import GraphBuildLoop, KF_INTERVAL
+from gitfourchette.graphcache import GraphCache
 from gitfourchette.graphview.commitlogmodel import SpecialRow
 from gitfourchette.nav import NavLocator, NavFlags, NavContext
 from gitfourchette.porcelain import *
 from gitfourchette.qt import *
-from gitfourchette.tasks.repotask import RepoTask
+from gitfourchette.repomodel import RepoModel
+from gitfourchette.tasks.repotask import AbortTask, RepoTask
 from gitfourchette.toolbox import *
 from gitfourchette.trtables import TrTables
+from gitfourchette.workdirwatcher import WorkdirWatcher
 
 logger = logging.getLogger(__name__)
 
@@ -38,12 +43,17 @@ class PrimeRepo(RepoTask):
 
     abortFlag: bool
 
+    uiPrimed: bool
+    "True once the repo is on display in the RepoWidget, even if the graph isn't complete yet."
+
+    FirstBatchSize = KF_INTERVAL
+    "Number of commits to weave before showing the top of the graph (if the commit log is longer than this)."
+
     def onAbortButtonClicked(self):
         self.abortFlag = True
 
     def flow(self, path: str, maxCommits: int = -1):
         from gitfourchette.repowidget import RepoWidget
-        from gitfourchette.repomodel import RepoModel
         from gitfourchette.tasks.jumptasks import Jump
 
         assert path
@@ -85,34 +95,242 @@ class PrimeRepo(RepoTask):
         # ---------------------------------------------------------------------
         yield from self.flowEnterWorkerThread()
 
+        if maxCommits < 0:  # -1 means take maxCommits from prefs. Warning, pref value can be 0, meaning infinity!
+            maxCommits = settings.prefs.maxCommits
+        if maxCommits == 0:  # 0 means infinity
+            maxCommits = 2**63  # ought to be enough
+        repoModel.truncationThreshold = maxCommits
+
+        # Try to reuse the graph that we cached last time we closed this repo,
+        # otherwise walk the entire commit log and build the graph from scratch.
+        # (Building from scratch may hop to the UI thread to show the top of the graph early.)
+        self.uiPrimed = False
+        if not self._primeGraphFromCache(repoModel):
+            yield from self._primeGraphFromScratch(repoModel)
+
+        # List the workdir's paths so we can tell when we need to refresh it
+        watchedPaths = None
+        if settings.prefs.autoRefresh:
+            with Benchmark("PrimeRepo/WatchWorkdir"):
+                watchedPaths = WorkdirWatcher.scanPaths(repo)
+
+        # ---------------------------------------------------------------------
+        # RETURN TO UI THREAD
+        # ---------------------------------------------------------------------
+        yield from self.flowEnterUiThread()
+
+        if repoModel.truncatedHistory:
+            extraRow = SpecialRow.TruncatedHistory
+        elif repo.is_shallow:
+            extraRow = SpecialRow.EndOfShallowHistory
+        else:
+            extraRow = SpecialRow.Invalid
+
+        if not self.uiPrimed:
+            self._primeUi(repoModel, extraRow)
+        else:
+            # Streamed in the graph; show the remaining rows and give the UI back to the user
+            with QSignalBlockerContext(rw.graphView):
+                rw.graphView.clModel.setExtraRow(extraRow)
+            rw.graphView.setEnabled(True)
+            rw.sidebar.setEnabled(True)
+
+        # Save commit count (if not truncated)
+        if not repoModel.truncatedHistory:
+            settings.history.setRepoNumCommits(repo.workdir, repoModel.numRealCommits)
+
+        # Bump repo in history
+        settings.history.addRepo(repo.workdir)
+        settings.history.setRepoSuperproject(repo.workdir, repoModel.superproject)
+        settings.history.write()
+        rw.window().fillRecentMenu()  # TODO: emit signal instead?
+
+        # Scrolling HEAD into view isn't super intuitive if we boot to Uncommitted Changes
+        # if newState.activeCommitId:
+        #     rw.graphView.scrollToCommit(newState.activeCommitId, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+        # Focus on some interesting widget within the RepoWidget after loading the repo.
+        # (delay to next event loop so Qt has time to show the widget first)
+        QTimer.singleShot(0, rw.setInitialFocus)
+
+        # Watch the workdir for changes (before the initial jump, which loads the workdir)
+        rw.setWorkdirWatcher(WorkdirWatcher(rw, repo, watchedPaths))
+
+        # Jump to workdir (or pending locator, if any)
+        if not rw.pendingLocator:
+            initialLocator = NavLocator(NavContext.WORKDIR)
+        else:
+            # Consume pending locator
+            initialLocator = rw.pendingLocator
+            rw.pendingLocator = NavLocator()
+        yield from self.flowSubtask(Jump, initialLocator)
+        rw.graphView.scrollToRowForLocator(initialLocator, QAbstractItemView.ScrollHint.PositionAtCenter)
+
+    def _primeUi(self, repoModel: RepoModel, extraRow: SpecialRow):
+        """ Show the repo in the RepoWidget (on the UI thread). """
+        rw = self.rw
+
+        # Assign RepoModel to RepoWidget
+        rw.repoModel = repoModel
+        rw.updateBoundRepo()
+
+        # Prime GraphView
+        with QSignalBlockerContext(rw.graphView):
+            rw.graphView.clFilter.setHiddenCommits(repoModel.hiddenCommits)
+            rw.graphView.clModel._extraRow = extraRow
+            rw.graphView.clModel.setCommitSequence(repoModel.commitSequence)
+            rw.graphView.selectRowForLocator(NavLocator.inWorkdir(), force=True)
+
+        # Prime Sidebar
+        with QSignalBlockerContext(rw.sidebar):
+            collapseCache = repoModel.prefs.collapseCache
+            if collapseCache:
+                rw.sidebar.sidebarModel.collapseCache = set(collapseCache)
+                rw.sidebar.sidebarModel.collapseCacheValid = True
+            rw.sidebar.refresh(repoModel)
+
+        # Restore main UI
+        rw.removePlaceholderWidget()
+
+        # Refresh tab text
+        rw.nameChange.emit()
+
+        # Splitters may have moved around while loading, restore them
+        rw.restoreSplitterStates()
+
+        self.uiPrimed = True
+
+    def _publishRows(self, repoModel: RepoModel, buildLoop: GraphBuildLoop, publishedSequence: CommitStore,
+                     hiddenCommits: set[Oid], foreignCommits: set[Oid]):
+        """
+        Show the rows that have been woven into the graph so far (on the UI thread).
+        The first call primes the UI; subsequent calls append rows to the commit log.
+
+        `publishedSequence` must be a frozen view of the rows woven so far (the worker
+        thread keeps appending to the full sequence, but the UI may only see the rows
+        that are already in the graph). Trickle its hidden/foreign commits on the
+        worker thread beforehand.
+        """
+        rw = self.rw
+
+        buildLoop.flushKeyframes()
+
+        repoModel.commitSequence = publishedSequence
+        repoModel.graph = buildLoop.graph
+        repoModel.hiddenCommits = hiddenCommits
+        repoModel.foreignCommits = foreignCommits
+        repoModel.graphGeneration += 1
+
+        if not self.uiPrimed:
+            self._primeUi(repoModel, SpecialRow.Invalid)
+            # Don't let the user start any tasks until the entire graph is ready
+            rw.graphView.setEnabled(False)
+            rw.sidebar.setEnabled(False)
+        else:
+            with QSignalBlockerContext(rw.graphView):
+                rw.graphView.clFilter.extendHiddenCommits(hiddenCommits)
+                rw.graphView.clModel.extendCommitSequence(repoModel.commitSequence)
+
+        # From now on, the UI thread may read the graph while we're weaving it.
+        buildLoop.deferKeyframes()
+
+    def _primeGraphFromCache(self, repoModel: RepoModel) -> bool:
+        cachedGraph = GraphCache.instance().load(repoModel.repo, repoModel.truncationThreshold)
+        if cachedGraph is None:
+            return False
+
+        self.progressMessage.emit(self.tr("Loading cached commit graph..."))
+
+        repoModel.graph = cachedGraph.graph
+        repoModel.graphGeneration += 1
+        repoModel.commitSequence = cachedGraph.commitSequence
+        repoModel.truncatedHistory = cachedGraph.truncatedHistory
+
+        repoModel.graphTips = set(cachedGraph.refs.values())
+        hideSeeds = repoModel.getHiddenTips()
+        localSeeds = repoModel.getLocalTips()
+        cachedMock = repoModel.commitSequence[0]
+
+        # If no refs moved since we cached the graph, the cached hidden/foreign commits
+        # are still valid: skip splicing and trickling the graph.
+        if (not repoModel.graphTipsStale()
+                and cachedGraph.hideSeeds == hideSeeds
+                and cachedGraph.localSeeds == localSeeds
+                and list(cachedMock.parent_ids) == repoModel.uncommittedChangesMockCommit().parent_ids):
+            repoModel.hiddenCommits = cachedGraph.hiddenCommits
+            repoModel.foreignCommits = cachedGraph.foreignCommits
+            repoModel.hideSeeds = hideSeeds
+            repoModel.localSeeds = localSeeds
+            logger.info(f"{repoModel.shortName}: restored {repoModel.numRealCommits} commits from graph cache")
+            CommitSearch.warmUp(repoModel.commitSequence)
+            return True
+
+        # Bring the cached graph up to date with the current refs
+        gsl = repoModel.syncTopOfGraph()
+
+        if gsl.numRowsRemoved < 0:
+            # The history was rewritten beyond recognition since we cached the graph.
+            # Splicing it would ignore the truncation threshold, so start over.
+            logger.info(f"{repoModel.shortName}: cached graph is unusable")
+            return False
+
+        logger.info(f"{repoModel.shortName}: restored {repoModel.numRealCommits} commits from graph cache "
+                    f"(-{gsl.numRowsRemoved} +{gsl.numRowsAdded})")
+
+        CommitSearch.warmUp(repoModel.commitSequence)
+        return True
+
+    def _primeGraphFromScratch(self, repoModel: RepoModel):
         locale = QLocale()
+        maxCommits = repoModel.truncationThreshold
 
         # Prime the walker (this might take a while)
         walker = repoModel.primeWalker()
 
-        commitSequence = [repoModel.uncommittedChangesMockCommit()]
+        commitSequence = CommitStore(repoModel.repo)
 
         # Retrieve the number of commits that we loaded last time we opened this repo
         # so we can estimate how long it'll take to load it again
-        numCommitsBallpark = settings.history.getRepoNumCommits(repo.workdir)
+        numCommitsBallpark = settings.history.getRepoNumCommits(repoModel.repo.workdir)
         if numCommitsBallpark != 0:
-            # Reserve second half of progress bar for graph progress
-            self.progressRange.emit(0, 2*numCommitsBallpark)
+            self.progressRange.emit(0, numCommitsBallpark)
 
         # ---------------------------------------------------------------------
-        # Build commit sequence
+        # Build commit sequence and graph in a single pass
+
+        hideSeeds = repoModel.getHiddenTips()
+        localSeeds = repoModel.getLocalTips()
+        knownTips = set(repoModel.getKnownTips())
+        # The hidden/foreign commits are trickled in batches whenever we publish rows (see _publishRows),
+        # which is a lot cheaper than trickling them commit by commit as we build the graph.
+        buildLoop = GraphBuildLoop(heads=knownTips, hideSeeds=hideSeeds, localSeeds=localSeeds, trickle=False)
+        coBuild = buildLoop.coBuild()
+        coBuild.send(None)  # prime the generator
+
+        repoModel.hideSeeds = hideSeeds
+        repoModel.localSeeds = localSeeds
+        repoModel.graphTips = knownTips
+        repoModel.graphIncomplete = True
+
+        # The trickles pick up where they left off at each publish, so every row is trickled once
+        trickles = repoModel.newBatchTrickles(buildLoop.graph)
+        hiddenCommits = set()
+        foreignCommits = set()
+        numTrickledRows = 0
+
+        mockCommit = repoModel.uncommittedChangesMockCommit()
+        commitSequence.append(mockCommit)
+        coBuild.send(mockCommit)
 
         self.progressAbortable.emit(True)
 
         truncatedHistory = False
-        if maxCommits < 0:  # -1 means take maxCommits from prefs. Warning, pref value can be 0, meaning infinity!
-            maxCommits = settings.prefs.maxCommits
-        if maxCommits == 0:  # 0 means infinity
-            maxCommits = 2**63  # ought to be enough
         progressInterval = 1000 if maxCommits >= 10000 else 1000
+        nextPublish = PrimeRepo.FirstBatchSize
 
         for i, commit in enumerate(walker):
             commitSequence.append(commit)
+            coBuild.send(commit)
 
             if i+1 >= maxCommits or (self.abortFlag and i+1 >= progressInterval):
                 truncatedHistory = True
@@ -125,10 +343,31 @@ class PrimeRepo(RepoTask):
                 if numCommitsBallpark > 0 and i <= numCommitsBallpark:
                     self.progressValue.emit(i)
 
+            # Show the top of the graph early, then append rows in batches of increasing size
+            if i+1 >= nextPublish:
+                nextPublish *= 2
+                # A row's flags only depend on the rows above it, so the flags of the
+                # rows that we've already published remain valid as the sequence grows.
+                # Only trickle the new rows, into new sets (the UI holds on to the old ones).
+                publishedSequence = commitSequence[:]
+                newHidden, newForeign = repoModel.trickleCommits(publishedSequence, numTrickledRows, trickles)
+                hiddenCommits = hiddenCommits.union(newHidden)
+                foreignCommits = foreignCommits.union(newForeign)
+                numTrickledRows = len(publishedSequence)
+                yield from self.flowEnterUiThread()
+                self._publishRows(repoModel, buildLoop, publishedSequence, hiddenCommits, foreignCommits)
+                yield from self.flowEnterWorkerThread()
+
+        coBuild.close()
+
         # Can't abort anymore
         self.progressAbortable.emit(False)
 
+        # Index the commits for GraphView's search bar while we're still on the worker thread
+        CommitSearch.warmUp(commitSequence)
+
         numCommits = len(commitSequence) - 1
+        repoModel.walkerRow = numCommits
         logger.info(f"{repoModel.shortName}: loaded {numCommits} commits")
         if truncatedHistory:
             message = self.tr("{0} commits (truncated log).").format(locale.toString(numCommits))
@@ -136,105 +375,137 @@ class PrimeRepo(RepoTask):
             message = self.tr("{0} commits total.").format(locale.toString(numCommits))
         self.progressMessage.emit(message)
 
-        if numCommitsBallpark != 0:
-            # First half of progress bar was for commit log
-            self.progressRange.emit(-numCommits, numCommits)
-        else:
-            self.progressRange.emit(0, numCommits)
-        self.progressValue.emit(0)
+        repoModel.truncatedHistory = truncatedHistory
 
-        # ---------------------------------------------------------------------
-        # Build graph
+        newHidden, newForeign = repoModel.trickleCommits(commitSequence, numTrickledRows, trickles)
+        hiddenCommits = hiddenCommits.union(newHidden)
+        foreignCommits = foreignCommits.union(newForeign)
 
-        hideSeeds = self.repoModel.getHiddenTips()
-        localSeeds = self.repoModel.getLocalTips()
-        buildLoop = GraphBuildLoop(heads=self.repoModel.getKnownTips(), hideSeeds=hideSeeds, localSeeds=localSeeds)
-        buildLoop.onKeyframe = self.progressValue.emit
-        buildLoop.sendAll(commitSequence)
-        self.progressValue.emit(numCommits)
+        if self.uiPrimed:
+            yield from self.flowEnterUiThread()
+            self._publishRows(repoModel, buildLoop, commitSequence[:], hiddenCommits, foreignCommits)
+
+        repoModel.hiddenCommits = hiddenCommits
+        repoModel.foreignCommits = foreignCommits
 
-        graph = buildLoop.graph
-        repoModel.hiddenCommits = buildLoop.hiddenCommits
-        repoModel.foreignCommits = buildLoop.foreignCommits
         repoModel.commitSequence = commitSequence
-        repoModel.truncatedHistory = truncatedHistory
-        repoModel.graph = graph
-        repoModel.hideSeeds = hideSeeds
-        repoModel.localSeeds = localSeeds
+        repoModel.graph = buildLoop.graph
+        repoModel.graphGeneration += 1
+        repoModel.graphIncomplete = False
 
-        # ---------------------------------------------------------------------
-        # RETURN TO UI THREAD
-        # ---------------------------------------------------------------------
-        yield from self.flowEnterUiThread()
+    def onError(self, exc: Exception):
+        self.rw.cleanup(str(exc), allowAutoReload=False)
+        super().onError(exc)
 
-        # Assign RepoModel to RepoWidget
-        rw.repoModel = repoModel
-        rw.updateBoundRepo()
 
-        # Save commit count (if not truncated)
-        if not truncatedHistory:
-            settings.history.setRepoNumCommits(repo.workdir, numCommits)
+class ExpandLog(RepoTask):
+    """
+    Load more commits at the bottom of a truncated commit log.
 
-        # Bump repo in history
-        settings.history.addRepo(repo.workdir)
-        settings.history.setRepoSuperproject(repo.workdir, repoModel.superproject)
-        settings.history.write()
-        rw.window().fillRecentMenu()  # TODO: emit signal instead?
+    Rather than priming the repo all over again, the walker and the graph
+    pick up where they left off, and the new rows are appended to GraphView.
+    """
 
-        # Finally, prime the UI.
+    def flow(self, maxCommits: int = -1):
+        from gitfourchette.tasks.jumptasks import Jump
 
-        # Prime GraphView
-        with QSignalBlockerContext(rw.graphView):
-            if repoModel.truncatedHistory:
-                extraRow = SpecialRow.TruncatedHistory
-            elif repo.is_shallow:
-                extraRow = SpecialRow.EndOfShallowHistory
-            else:
-                extraRow = SpecialRow.Invalid
+        rw = self.rw
+        repoModel = self.repoModel
+        graphView = rw.graphView
 
-            rw.graphView.clFilter.setHiddenCommits(repoModel.hiddenCommits)
-            rw.graphView.clModel._extraRow = extraRow
-            rw.graphView.clModel.setCommitSequence(repoModel.commitSequence)
-            rw.graphView.selectRowForLocator(NavLocator.inWorkdir(), force=True)
+        if not repoModel.truncatedHistory or repoModel.graphIncomplete:
+            return
 
-        # Prime Sidebar
-        with QSignalBlockerContext(rw.sidebar):
-            collapseCache = repoModel.prefs.collapseCache
-            if collapseCache:
-                rw.sidebar.sidebarModel.collapseCache = set(collapseCache)
-                rw.sidebar.sidebarModel.collapseCacheValid = True
-            rw.sidebar.refresh(repoModel)
+        requestedMaxCommits = maxCommits
+        if maxCommits < 0:
+            maxCommits = repoModel.nextTruncationThreshold
+        if maxCommits == 0:  # 0 means infinity
+            maxCommits = 2**63  # ought to be enough
 
-        # Restore main UI
-        rw.removePlaceholderWidget()
+        oldSequence = repoModel.commitSequence
+        numCommits = repoModel.numRealCommits
+        lastLocator = NavLocator.inCommit(oldSequence[-1].id)
+        repoModel.graphIncomplete = True
 
-        # Refresh tab text
-        rw.nameChange.emit()
+        # Get the frame to resume weaving from while we're on the UI thread:
+        # getFrame may save volatile keyframes, and GraphView reads them as it paints.
+        lastFrame = repoModel.graph.getFrame(len(oldSequence) - 1)
 
-        # Splitters may have moved around while loading, restore them
-        rw.restoreSplitterStates()
+        # ---------------------------------------------------------------------
+        # EXIT UI THREAD
+        # ---------------------------------------------------------------------
+        yield from self.flowEnterWorkerThread()
 
-        # Scrolling HEAD into view isn't super intuitive if we boot to Uncommitted Changes
-        # if newState.activeCommitId:
-        #     rw.graphView.scrollToCommit(newState.activeCommitId, QAbstractItemView.ScrollHint.PositionAtCenter)
+        walker = repoModel.resumeWalker()
+
+        if walker is None:
+            # The commit sequence doesn't match a fresh walk anymore. Reload the repo instead.
+            yield from self.flowEnterUiThread()
+            repoModel.graphIncomplete = False
+            rw.pendingLocator = lastLocator
+            QTimer.singleShot(0, lambda: rw.primeRepo(force=True, maxCommits=requestedMaxCommits))
+            return
+
+        # Resume the weave with the same tips and seeds that the graph was built from
+        buildLoop = GraphBuildLoop.resume(repoModel.graph, lastFrame, repoModel.hiddenCommits, repoModel.foreignCommits,
+                                          heads=repoModel.graphTips, hideSeeds=repoModel.hideSeeds,
+                                          localSeeds=repoModel.localSeeds)
+        # GraphView may read the graph while we're weaving it
+        buildLoop.deferKeyframes()
+        coBuild = buildLoop.coBuild()
+        coBuild.send(None)  # prime the generator
+
+        # Append to a copy of the sequence; GraphView keeps using the current one until we're done
+        commitSequence = oldSequence[:]
+        truncatedHistory = False
 
-        # Focus on some interesting widget within the RepoWidget after loading the repo.
-        # (delay to next event loop so Qt has time to show the widget first)
-        QTimer.singleShot(0, rw.setInitialFocus)
+        for commit in walker:
+            commitSequence.append(commit)
+            coBuild.send(commit)
+            numCommits += 1
+            if numCommits >= maxCommits:
+                truncatedHistory = True
+                break
 
-        # Jump to workdir (or pending locator, if any)
-        if not rw.pendingLocator:
-            initialLocator = NavLocator(NavContext.WORKDIR)
+        coBuild.close()
+        repoModel.walkerRow = numCommits
+        CommitSearch.warmUp(commitSequence)
+        logger.info(f"{repoModel.shortName}: extended history to {numCommits} commits")
+
+        # ---------------------------------------------------------------------
+        # RETURN TO UI THREAD
+        # ---------------------------------------------------------------------
+        yield from self.flowEnterUiThread()
+
+        buildLoop.flushKeyframes()
+        commitSequence.resolveParentRows(repoModel.graph.getCommitRow)
+
+        repoModel.commitSequence = commitSequence
+        repoModel.hiddenCommits = buildLoop.hiddenCommits
+        repoModel.foreignCommits = buildLoop.foreignCommits
+        repoModel.truncatedHistory = truncatedHistory
+        repoModel.truncationThreshold = maxCommits
+        repoModel.graphGeneration += 1
+        repoModel.graphIncomplete = False
+
+        if truncatedHistory:
+            extraRow = SpecialRow.TruncatedHistory
+        elif repoModel.repo.is_shallow:
+            extraRow = SpecialRow.EndOfShallowHistory
         else:
-            # Consume pending locator
-            initialLocator = rw.pendingLocator
-            rw.pendingLocator = NavLocator()
-        yield from self.flowSubtask(Jump, initialLocator)
-        rw.graphView.scrollToRowForLocator(initialLocator, QAbstractItemView.ScrollHint.PositionAtCenter)
+            extraRow = SpecialRow.Invalid
+            settings.history.setRepoNumCommits(repoModel.repo.workdir, numCommits)
 
-    def onError(self, exc: Exception):
-        self.rw.cleanup(str(exc), allowAutoReload=False)
-        super().onError(exc)
+        wasOnTruncatedRow = graphView.currentRowKind == SpecialRow.TruncatedHistory
+
+        with QSignalBlockerContext(graphView):
+            graphView.clFilter.extendHiddenCommits(repoModel.hiddenCommits)
+            graphView.clModel.extendCommitSequence(commitSequence)
+            graphView.clModel.setExtraRow(extraRow)
+
+        # If the truncated history row was selected, jump back to what was the last commit
+        if wasOnTruncatedRow:
+            yield from self.flowSubtask(Jump, lastLocator)
 
 
 class LoadWorkdir(RepoTask):
@@ -244,14 +515,21 @@ class LoadWorkdir(RepoTask):
             return True
         return isinstance(task, LoadCommit | LoadPatch)
 
-    def flow(self, allowWriteIndex: bool):
+    def flow(self, allowWriteIndex: bool, reloadStaged: bool = True):
+        """
+        Diff the working directory. If `reloadStaged` is False, the caller vouches
+        that the staged changes are the same as last time, so only the unstaged
+        changes are rediffed (and `stageDiff` is None).
+        """
         yield from self.flowEnterWorkerThread()
 
         with Benchmark("LoadWorkdir/Index"):
             self.repo.refresh_index()
 
-        with Benchmark("LoadWorkdir/Staged"):
-            self.stageDiff = self.repo.get_staged_changes(context_lines=contextLines())
+        self.stageDiff = None
+        if reloadStaged:
+            with Benchmark("LoadWorkdir/Staged"):
+                self.stageDiff = self.repo.get_staged_changes(context_lines=contextLines())
 
         # yield from self.flowEnterWorkerThread()  # let task thread be interrupted here
         with Benchmark("LoadWorkdir/Unstaged"):
@@ -262,17 +540,109 @@ class LoadCommit(RepoTask):
     def canKill(self, task: RepoTask):
         return isinstance(task, LoadWorkdir | LoadCommit | LoadPatch)
 
+    @staticmethod
+    def prefetch(repoModel: RepoModel, oid: Oid) -> bool:
+        """
+        Diff a commit ahead of time, as LoadCommit would by default.
+        Return False if the diffs were already cached.
+        """
+        cache = repoModel.commitDiffCache
+        key = cache.makeKey(oid, RENAME_COUNT_THRESHOLD, contextLines())
+        if key in cache:
+            return False
+        cache.diffs(repoModel.repo, oid, RENAME_COUNT_THRESHOLD, contextLines())
+        return True
+
     def flow(self, locator: NavLocator):
         yield from self.flowEnterWorkerThread()
 
         oid = locator.commit
         largeCommitThreshold = -1 if locator.hasFlags(NavFlags.AllowLargeCommits) else RENAME_COUNT_THRESHOLD
 
-        self.diffs, self.skippedRenameDetection = self.repo.commit_diffs(
-            oid, find_similar_threshold=largeCommitThreshold, context_lines=contextLines())
+        self.diffs, self.skippedRenameDetection = self.repoModel.commitDiffCache.diffs(
+            self.repo, oid, largeCommitThreshold, contextLines())
         self.message = self.repo.get_commit_message(oid)
 
 
+class DetectRenames(RepoTask):
+    """
+    Run rename detection on a large commit whose file list is already shown
+    (LoadCommit skips it beyond RENAME_COUNT_THRESHOLD), then update the
+    committed file list in place.
+
+    This runs in the background when the task runner is idle (see RepoWidget).
+    Any other task may interrupt it. The diffs are cached as soon as they're
+    ready, so an interrupted DetectRenames picks up the result the next time.
+    """
+
+    def isFreelyInterruptible(self) -> bool:
+        return True
+
+    def flow(self, oid: Oid):
+        yield from self.flowEnterWorkerThread()
+
+        cache = self.repoModel.commitDiffCache
+        diffs, _ = cache.diffs(self.repo, oid, -1, contextLines())
+        # Don't skip rename detection the next time this commit is loaded
+        cache.put(cache.makeKey(oid, RENAME_COUNT_THRESHOLD, contextLines()), diffs, False)
+
+        numRenames = sum(delta.status == DeltaStatus.RENAMED for diff in diffs for delta in diff.deltas)
+
+        yield from self.flowEnterUiThread()
+
+        rw = self.rw
+        area = rw.diffArea
+        flv = area.committedFiles
+        if flv.commitId != oid or not flv.skippedRenameDetection:
+            # The user has moved on to another commit
+            return
+
+        locator = rw.navLocator
+        path = locator.path if locator.context == NavContext.COMMITTED and locator.commit == oid else ""
+        oldDelta = flv.flModel.getDeltaForFile(path) if path else None
+
+        flv.updateContents(diffs, False)
+        area.committedHeader.setText(self.tr("%n changes:", "", flv.model().rowCount()))
+
+        # Reload the diff if the file it shows is now part of a rename
+        if path:
+            newDelta = flv.flModel.getDeltaForFile(path)
+            if (newDelta is None or oldDelta is None or newDelta.status != oldDelta.status
+                    or newDelta.old_file.path != oldDelta.old_file.path):
+                self.jumpTo = locator.withExtraFlags(NavFlags.AllowLargeCommits | NavFlags.ForceDiff)
+                return
+
+        if not area.diffBanner.lastWarningWasDismissed:
+            area.diffBanner.popUp("", self.tr("%n renames detected.", "", numRenames), canDismiss=True, withIcon=True)
+
+    def onError(self, exc: Exception):
+        # Don't retry automatically
+        self.rw.committedFiles.skippedRenameDetection = False
+        super().onError(exc)
+
+
+class PrefetchCommits(RepoTask):
+    """
+    Diff the commits around the selection ahead of time (see CommitDiffCache)
+    so that moving to a neighbor is instant.
+
+    GraphView starts this once the selection settles. Any other task may
+    interrupt it; the commits that were diffed before that stay cached.
+    """
+
+    def isFreelyInterruptible(self) -> bool:
+        return True
+
+    def flow(self, oids: list[Oid]):
+        for oid in oids:
+            # Give the task runner a chance to interrupt us between commits
+            yield from self.flowEnterWorkerThread()
+            try:
+                LoadCommit.prefetch(self.repoModel, oid)
+            except (GitError, KeyError) as exc:  # pragma: no cover
+                logger.info(f"Couldn't prefetch diffs for {oid}: {exc}")
+
+
 class LoadPatch(RepoTask):
     def canKill(self, task: RepoTask):
         return isinstance(task, LoadPatch)
@@ -307,9 +677,11 @@ class LoadPatch(RepoTask):
             return SpecialDiffError.submoduleDiff(self.repo, patch, locator)
 
         try:
-            diffModel = DiffDocument.fromPatch(patch, locator)
+            diffModel = DiffDocument.fromPatch(patch, locator, checkpoint=self._bailIfKilled)
             diffModel.document.moveToThread(QApplication.instance().thread())
             return diffModel
+        except AbortTask:
+            raise
         except SpecialDiffError as dme:
             return dme
         except ShouldDisplayPatchAsImageDiff:
@@ -318,6 +690,11 @@ class LoadPatch(RepoTask):
             summary, details = excStrings(exc)
             return SpecialDiffError(summary, icon="SP_MessageBoxCritical", preformatted=details)
 
+    def _bailIfKilled(self):
+        # The user has moved on to another file; don't bother finishing this document.
+        if self.isKilled:
+            raise AbortTask()
+
     def _makeHeader(self, result, locator):
         header = "<html>" + escape(locator.path)
 
@@ -344,8 +721,7 @@ class LoadPatch(RepoTask):
         return header
 
     def flow(self, patch: Patch, locator: NavLocator):
-        # yield from self.flowEnterWorkerThread()
-        yield from self.flowEnterUiThread()
-        # QThread.msleep(500)
+        # Build the document on the worker thread (flowSubtask takes us back to the UI thread afterwards)
+        yield from self.flowEnterWorkerThread()
         self.result = self._processPatch(patch, locator)
         self.header = self._makeHeader(self.result, locator)
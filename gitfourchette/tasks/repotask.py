@@ -169,6 +169,9 @@ class RepoTask(QObject):
     _currentFlow: FlowGeneratorType | None
     _currentIteration: int
 
+    _killed: bool
+    """ Set by RepoTaskRunner when another task interrupts this (root) task. """
+
     _taskStack: list[RepoTask]
     """Stack of active tasks in the chain of flowSubtask calls, including the root task at index 0.
     The reference to the list object is shared by all tasks in the same flowSubtask chain."""
@@ -188,6 +191,7 @@ class RepoTask(QObject):
         self.repoModel = None
         self._currentFlow = None
         self._currentIteration = 0
+        self._killed = False
         self.setObjectName(self.__class__.__name__)
         self.jumpTo = NavLocator()
         self.effects = TaskEffects.Nothing
@@ -205,6 +209,16 @@ class RepoTask(QObject):
     def isRootTask(self) -> bool:
         return self.rootTask is self
 
+    @property
+    def isKilled(self) -> bool:
+        """
+        True if another task has interrupted this task (or the root task of its chain of subtasks).
+
+        A killed task only dies next time its flow yields. Lengthy computations on the
+        worker thread may poll this to bail early; their results will be discarded anyway.
+        """
+        return self.rootTask._killed
+
     def parentWidget(self) -> QWidget:
         return findParentWidget(self)
 
@@ -232,6 +246,13 @@ class RepoTask(QObject):
         """
         return False
 
+    def isFreelyInterruptible(self) -> bool:
+        """
+        Return true if any other task may take precedence over this task while it's running
+        (e.g. optional background work that can be resumed later).
+        """
+        return False
+
     def _isRunningOnAppThread(self):
         return onAppThread() and self._runningOnUiThread
 
@@ -631,6 +652,7 @@ class RepoTaskRunner(QObject):
             # Move the currently-running task to zombie mode.
             # It'll get deleted next time it yields a FlowControlToken.
             self._zombieTask = self._currentTask
+            self._zombieTask._killed = True
         else:
             # There's already a zombie. This means that the current task hasn't
             # started yet - it's waiting on the zombie to die.
@@ -672,7 +694,7 @@ class RepoTaskRunner(QObject):
             self._currentTask = task
             self._startTask(task)
 
-        elif task.canKill(self._currentTask):
+        elif task.canKill(self._currentTask) or self._currentTask.isFreelyInterruptible():
             logger.info(f"Task {task} killed task {self._currentTask}")
             self.killCurrentTask()
             self._currentTask = task
@@ -44,11 +44,13 @@ class TaskBook:
             tasks.DeleteRemote: translate("task", "Remove remote"),
             tasks.DeleteRemoteBranch: translate("task", "Delete branch on remote"),
             tasks.DeleteTag: translate("task", "Delete tag"),
+            tasks.DetectRenames: translate("task", "Detect renames"),
             tasks.DiscardFiles: translate("task", "Discard files"),
             tasks.DiscardModeChanges: translate("task", "Discard mode changes"),
             tasks.DropStash: translate("task", "Drop stash"),
             tasks.EditRemote: translate("task", "Edit remote"),
             tasks.EditUpstreamBranch: translate("task", "Edit upstream branch"),
+            tasks.ExpandLog: translate("task", "Load more commits"),
             tasks.ExportCommitAsPatch: translate("task", "Export commit as patch file"),
             tasks.ExportPatchCollection: translate("task", "Export patch file"),
             tasks.ExportStashAsPatch: translate("task", "Export stash as patch file"),
@@ -76,6 +78,7 @@ class TaskBook:
             tasks.NewRemote: translate("task", "Add remote"),
             tasks.NewStash: translate("task", "Stash changes"),
             tasks.NewTag: translate("task", "New tag"),
+            tasks.PrefetchCommits: translate("task", "Prefetch nearby commits"),
             tasks.PrimeRepo: translate("task", "Open repo"),
             tasks.PullBranch: translate("task", "Pull remote branch"),
             tasks.PushBranch: translate("task", "Push branch"),
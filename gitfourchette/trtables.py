@@ -322,6 +322,13 @@ class TrTables:
                 "detailed information about the author and the committer.</p>"),
             "maxCommits": translate("Prefs", "Load up to # commits in the history"),
             "maxCommits_help": translate("Prefs", "Set to 0 to always load the full commit history."),
+            "loadHiddenBranches": translate("Prefs", "Load commits that only belong to hidden branches"),
+            "loadHiddenBranches_help": translate(
+                "Prefs",
+                "<p>If this option is ticked, the commits of hidden branches are loaded in the background "
+                "so that they can reappear instantly when you unhide the branches.</p>"
+                "<p>Untick it to speed up repositories where you keep many branches hidden: "
+                "their commits will only be loaded if you unhide them.</p>"),
             "alternatingRowColors": translate("Prefs", "Draw rows using alternating background colors"),
 
             "maxTrashFiles": translate("Prefs", "The trash keeps up to # discarded patches"),
@@ -0,0 +1,506 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+"""
+Keeps track of changes to the working directory between workdir refreshes.
+
+Rediffing the working directory has to stat every file in the checkout, which
+takes seconds in huge repos. Rather than doing this every time the app regains
+the foreground, RepoWidget asks the WorkdirWatcher whether anything may have
+changed since the last time LoadWorkdir ran.
+
+The actual watching is left to a backend:
+
+- On Linux, InotifyWatcherBackend talks to inotify directly and only watches
+  the directories of the workdir that aren't ignored. A directory watch with
+  IN_MODIFY reports files being created, deleted, renamed and modified in
+  place, so a checkout with hundreds of thousands of files only needs as many
+  watches as it has directories.
+
+- Elsewhere, QtWatcherBackend falls back to a QFileSystemWatcher on every file
+  and directory. QFileSystemWatcher's directory watches don't report files
+  being modified in place, so this only scales to small workdirs.
+
+Watches are a per-user resource that other programs need too, so all open
+workdirs share a single budget of watches (see watchBudget). If a workdir
+needs more watches than are left, the watcher gives up ("overflows") and
+always reports the workdir as stale, i.e. we fall back to rediffing it every
+time. Changes to the staged files are detected via the stat signature of the
+index file and the commit at HEAD.
+
+We don't query core.fsmonitor: libgit2 doesn't support it, and talking to the
+hook or to git's fsmonitor daemon would require spawning git processes.
+"""
+
+import ctypes
+import logging
+import os
+import struct
+import sys
+import weakref
+
+from gitfourchette.porcelain import *
+from gitfourchette.qt import *
+from gitfourchette.repofingerprint import statSignature
+
+logger = logging.getLogger(__name__)
+
+
+class WatcherBackend(QObject):
+    """
+    Watches absolute paths on behalf of a WorkdirWatcher.
+    """
+
+    DirectoriesOnly = False
+    "If True, watching a directory is enough to catch changes to the files in it."
+
+    changed = Signal(str)
+    "Something changed at this path (a file, or a directory's listing)."
+
+    listingChanged = Signal(str)
+    "Entries may have appeared in this watched directory, but the backend can't tell which ones."
+
+    appeared = Signal(str)
+    "A new directory appeared in a watched directory and should be watched too."
+
+    lost = Signal(str)
+    "The backend isn't watching this path anymore (e.g. it was deleted)."
+
+    failed = Signal(str)
+    "The backend may have missed events; the workdir can't be vouched for anymore."
+
+    @classmethod
+    def maxWatches(cls) -> int:
+        """ Number of watches that all workdirs may use together. """
+        raise NotImplementedError()
+
+    def addPaths(self, fullPaths: list[str]) -> list[str]:
+        """ Start watching the given paths. Return the paths that couldn't be watched. """
+        raise NotImplementedError()
+
+    def removePaths(self, fullPaths: list[str]):
+        raise NotImplementedError()
+
+
+class QtWatcherBackend(WatcherBackend):
+    MaxWatches = 5000
+    "Per-file watches that all workdirs may use together"
+
+    def __init__(self, parent: QObject):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onDirectoryChanged)
+        self.watcher.fileChanged.connect(self.onFileChanged)
+
+    @classmethod
+    def maxWatches(cls) -> int:
+        return QtWatcherBackend.MaxWatches
+
+    def addPaths(self, fullPaths: list[str]) -> list[str]:
+        return self.watcher.addPaths(fullPaths)
+
+    def removePaths(self, fullPaths: list[str]):
+        if fullPaths:
+            self.watcher.removePaths(fullPaths)
+
+    def onFileChanged(self, fullPath: str):
+        self.changed.emit(fullPath)
+
+        # QFileSystemWatcher stops watching files that are deleted or renamed.
+        # If the file was replaced (e.g. atomic save), keep watching the new one.
+        # (Adding a path that is still being watched is a no-op.)
+        if os.path.exists(fullPath):
+            self.watcher.addPath(fullPath)
+        else:
+            self.lost.emit(fullPath)
+
+    def onDirectoryChanged(self, fullPath: str):
+        self.changed.emit(fullPath)
+        if os.path.isdir(fullPath):
+            self.listingChanged.emit(fullPath)
+        else:
+            self.lost.emit(fullPath)
+
+
+def _loadLibc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class InotifyWatcherBackend(WatcherBackend):
+    DirectoriesOnly = True
+
+    UserWatchesShare = 4
+    "Only use a fraction (1/n) of the user's inotify watches; leave the rest to other programs"
+
+    # See inotify(7)
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ONLYDIR = 0x1000000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = os.O_CLOEXEC
+    IN_NONBLOCK = os.O_NONBLOCK
+
+    WatchMask = (IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+                 | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+    EventHeader = struct.Struct("iIII")
+    "struct inotify_event, minus the name that follows it"
+
+    libc = _loadLibc()
+    _maxWatches = -1
+
+    @staticmethod
+    def isAvailable() -> bool:
+        return InotifyWatcherBackend.libc is not None
+
+    @classmethod
+    def maxWatches(cls) -> int:
+        if InotifyWatcherBackend._maxWatches < 0:
+            try:
+                with open("/proc/sys/fs/inotify/max_user_watches") as f:
+                    userWatches = int(f.read())
+            except (OSError, ValueError):
+                userWatches = 8192
+            InotifyWatcherBackend._maxWatches = userWatches // InotifyWatcherBackend.UserWatchesShare
+        return InotifyWatcherBackend._maxWatches
+
+    def __init__(self, parent: QObject):
+        super().__init__(parent)
+        fd = self.libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self.fd = fd
+        self.pathsByWd: dict[int, str] = {}
+        self.wdsByPath: dict[str, int] = {}
+
+        self.notifier = QSocketNotifier(fd, QSocketNotifier.Type.Read, self)
+        self.notifier.activated.connect(self.readEvents)
+
+        # Closing the inotify instance drops all of its watches at once
+        weakref.finalize(self, os.close, fd)
+
+    def addPaths(self, fullPaths: list[str]) -> list[str]:
+        failed = []
+        for path in fullPaths:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.WatchMask)
+            if wd < 0:
+                failed.append(path)
+                continue
+            self.pathsByWd[wd] = path
+            self.wdsByPath[path] = wd
+        return failed
+
+    def removePaths(self, fullPaths: list[str]):
+        for path in fullPaths:
+            wd = self.wdsByPath.pop(path, None)
+            if wd is None:
+                continue
+            del self.pathsByWd[wd]
+            self.libc.inotify_rm_watch(self.fd, wd)
+
+    def readEvents(self):
+        try:
+            buffer = os.read(self.fd, 65536)
+        except BlockingIOError:
+            return
+
+        header = self.EventHeader
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, _cookie, nameLength = header.unpack_from(buffer, offset)
+            offset += header.size
+            name = buffer[offset: offset + nameLength].rstrip(b"\0")
+            offset += nameLength
+
+            if mask & self.IN_Q_OVERFLOW:
+                self.failed.emit("inotify queue overflow")
+                continue
+
+            dirPath = self.pathsByWd.get(wd)
+            if dirPath is None:  # We've stopped watching this directory already
+                continue
+
+            if mask & self.IN_IGNORED:
+                # The kernel dropped the watch (the directory was deleted)
+                del self.pathsByWd[wd]
+                del self.wdsByPath[dirPath]
+                self.lost.emit(dirPath)
+                continue
+
+            if mask & self.IN_MOVE_SELF:
+                # The watch now follows the directory elsewhere. If it moved within the
+                # workdir, the new parent reports it as a new directory.
+                self.removePaths([dirPath])
+                self.lost.emit(dirPath)
+                continue
+
+            if mask & self.IN_DELETE_SELF:  # IN_IGNORED follows
+                continue
+
+            path = os.path.join(dirPath, os.fsdecode(name)) if name else dirPath
+            self.changed.emit(path)
+
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                self.appeared.emit(path)
+
+
+class WorkdirWatcher(QObject):
+    Backend: type[WatcherBackend] = InotifyWatcherBackend if InotifyWatcherBackend.isAvailable() else QtWatcherBackend
+    "Backend used by new WorkdirWatchers"
+
+    totalWatches = 0
+    "Watches held by all WorkdirWatchers together"
+
+    dirtyPaths: set[str]
+    "Workdir paths (relative, '' for the root) in which something changed since the last markClean."
+
+    overflowed: bool
+    "True if we can't vouch for the workdir (too many paths, or the watcher failed)."
+
+    watched: set[str]
+    "Full paths that the backend is watching for us."
+
+    def __init__(self, parent: QObject, repo: Repo, paths: list[str] | None):
+        super().__init__(parent)
+        self.setObjectName("WorkdirWatcher")
+        self.repo = repo
+        self.workdir = os.path.normpath(repo.workdir)
+        self.dirtyPaths = set()
+        self.overflowed = paths is None
+        self.indexFingerprint = ()
+        self.watched = set()
+
+        # Give our watches back to the budget however we get deleted
+        weakref.finalize(self, WorkdirWatcher.releaseWatches, self.watched)
+
+        self.backend = WorkdirWatcher.Backend(self)
+        self.backend.changed.connect(self.onPathChanged)
+        self.backend.listingChanged.connect(self.onListingChanged)
+        self.backend.appeared.connect(self.onDirectoryAppeared)
+        self.backend.lost.connect(self.onPathLost)
+        self.backend.failed.connect(self.overflow)
+
+        if paths:
+            self.watchPaths(paths)
+
+    @staticmethod
+    def watchBudget(backend: type[WatcherBackend] | None = None) -> int:
+        """ Number of watches that may still be used with a backend, all workdirs combined. """
+        backend = backend or WorkdirWatcher.Backend
+        return max(0, backend.maxWatches() - WorkdirWatcher.totalWatches)
+
+    @staticmethod
+    def releaseWatches(watched: set[str]):
+        WorkdirWatcher.totalWatches -= len(watched)
+        watched.clear()
+
+    @staticmethod
+    def scanPaths(repo: Repo, limit: int = -1, top: str = "", directoriesOnly: bool | None = None
+                  ) -> list[str] | None:
+        """
+        List the paths of the workdir that are worth watching (relative paths),
+        starting with directory `top` and including everything below it. Files
+        are left out if the backend is happy with watching `directoriesOnly`.
+        Return None if there are more than `limit` of them.
+        Can be called from a worker thread.
+        """
+        limit = limit if limit >= 0 else WorkdirWatcher.watchBudget()
+        if directoriesOnly is None:
+            directoriesOnly = WorkdirWatcher.Backend.DirectoriesOnly
+        workdir = os.path.normpath(repo.workdir)
+        paths = [top]
+
+        # Every tracked file is worth watching, so don't bother walking the workdir
+        # if there are too many of them. (This is cheap: the index is loaded anyway.)
+        if not directoriesOnly and not top and len(repo.index) >= limit:
+            return None
+
+        for root, dirnames, filenames in os.walk(os.path.join(workdir, top)):
+            relRoot = os.path.relpath(root, workdir)
+            relRoot = "" if relRoot == os.curdir else relRoot.replace(os.sep, "/") + "/"
+
+            keep = []
+            for name in dirnames:
+                if name == ".git":
+                    continue
+                if len(paths) > limit:
+                    return None
+                relPath = relRoot + name
+                if repo.path_is_ignored(relPath + "/"):
+                    continue
+                keep.append(name)
+                paths.append(relPath)
+            dirnames[:] = keep
+
+            if directoriesOnly:
+                filenames = []
+
+            for name in filenames:
+                # Bail out before looking up any more ignore rules
+                if len(paths) > limit:
+                    return None
+                relPath = relRoot + name
+                if not repo.path_is_ignored(relPath):
+                    paths.append(relPath)
+
+            if len(paths) > limit:
+                return None
+
+        return paths
+
+    def fullPath(self, relPath: str) -> str:
+        return os.path.join(self.workdir, relPath) if relPath else self.workdir
+
+    def relativePath(self, fullPath: str) -> str:
+        relPath = os.path.relpath(fullPath, self.workdir)
+        return "" if relPath == os.curdir else relPath.replace(os.sep, "/")
+
+    def watchPaths(self, paths: list[str]):
+        if self.overflowed:
+            return
+
+        fullPaths = [p for p in map(self.fullPath, paths) if p not in self.watched]
+        if len(fullPaths) > WorkdirWatcher.watchBudget(type(self.backend)):
+            self.overflow("out of watches")
+            return
+
+        failed = self.backend.addPaths(fullPaths)
+        added = set(fullPaths)
+        added.difference_update(failed)
+        self.watched.update(added)
+        WorkdirWatcher.totalWatches += len(added)
+
+        # Don't fret about paths that vanished in the meantime
+        if any(os.path.exists(p) for p in failed):
+            self.overflow(f"couldn't watch {len(failed)} paths")
+
+    def overflow(self, reason: str):
+        logger.info(f"Not watching workdir anymore ({reason}): {self.workdir}")
+        self.overflowed = True
+        self.dirtyPaths.clear()
+        self.backend.removePaths(list(self.watched))
+        WorkdirWatcher.releaseWatches(self.watched)
+
+    def onPathChanged(self, fullPath: str):
+        if self.overflowed:
+            return
+
+        relPath = self.relativePath(fullPath)
+        if relPath in self.dirtyPaths or relPath == ".git" or relPath.startswith(".git/"):
+            return
+
+        # Directory-only backends report changes to files that we wouldn't watch individually
+        if fullPath not in self.watched and self.repo.path_is_ignored(relPath):
+            return
+
+        self.dirtyPaths.add(relPath)
+
+    def onPathLost(self, fullPath: str):
+        if fullPath in self.watched:
+            self.watched.remove(fullPath)
+            WorkdirWatcher.totalWatches -= 1
+        if not self.overflowed:
+            self.dirtyPaths.add(self.relativePath(fullPath))
+
+    def onDirectoryAppeared(self, fullPath: str):
+        if self.overflowed:
+            return
+
+        relPath = self.relativePath(fullPath)
+        if self.repo.path_is_ignored(relPath + "/"):
+            return
+
+        backend = type(self.backend)
+        subPaths = WorkdirWatcher.scanPaths(self.repo, WorkdirWatcher.watchBudget(backend), relPath, backend.DirectoriesOnly)
+        if subPaths is None:
+            self.overflow("out of watches")
+            return
+        self.dirtyPaths.add(relPath)
+        self.watchPaths(subPaths)
+
+    def onListingChanged(self, fullPath: str):
+        if self.overflowed:
+            return
+
+        # Watch any new files and subdirectories
+        watched = self.watched
+        backend = type(self.backend)
+        budget = WorkdirWatcher.watchBudget(backend)
+        relPath = self.relativePath(fullPath)
+        prefix = relPath + "/" if relPath else ""
+        newPaths = []
+        with os.scandir(fullPath) as it:
+            for entry in it:
+                if entry.name == ".git" or entry.path in watched:
+                    continue
+                subPath = prefix + entry.name
+                if not entry.is_dir(follow_symlinks=False):
+                    if not self.repo.path_is_ignored(subPath):
+                        newPaths.append(subPath)
+                    continue
+                if self.repo.path_is_ignored(subPath + "/"):
+                    continue
+                subPaths = WorkdirWatcher.scanPaths(self.repo, budget - len(newPaths), subPath, backend.DirectoriesOnly)
+                if subPaths is None:
+                    self.overflow("out of watches")
+                    return
+                newPaths.extend(subPaths)
+        if newPaths:
+            self.dirtyPaths.update(newPaths)
+            self.watchPaths(newPaths)
+
+    def getIndexFingerprint(self) -> tuple:
+        indexSignature = statSignature(os.path.join(self.repo.path, "index"))
+        try:
+            headId = self.repo.head_commit_id
+        except (GitError, KeyError):  # unborn HEAD
+            headId = NULL_OID
+        return indexSignature, headId
+
+    def markClean(self):
+        """
+        Call this right before rediffing the working directory.
+        Changes occurring from now on will make the workdir stale again.
+        """
+        self.dirtyPaths.clear()
+
+    def syncIndexFingerprint(self):
+        """
+        Call this after the staged changes have been rediffed successfully.
+        (Do it after the fact: rediffing the unstaged changes may rewrite the index's stat cache.)
+        """
+        self.indexFingerprint = self.getIndexFingerprint()
+
+    def invalidateIndexFingerprint(self):
+        """ Force the staged changes to be rediffed next time. """
+        self.indexFingerprint = ()
+
+    def isIndexStale(self) -> bool:
+        """ Return True if the staged changes may have changed since the last syncIndexFingerprint. """
+        return self.indexFingerprint != self.getIndexFingerprint()
+
+    def isStale(self) -> bool:
+        """ Return True if the workdir or the index may have changed since they were last rediffed. """
+        return self.overflowed or bool(self.dirtyPaths) or self.isIndexStale()
@@ -62,7 +62,7 @@ def tempDir() -> tempfile.TemporaryDirectory:
 
 @pytest.fixture
 def mainWindow(qtbot: QtBot) -> MainWindow:
-    from gitfourchette import settings, qt, trash, porcelain, tasks
+    from gitfourchette import settings, qt, trash, porcelain, tasks, graphcache
     from .util import TEST_SIGNATURE
 
     # Turn on test mode: Prevent loading/saving prefs; disable multithreaded work queue
@@ -111,6 +111,9 @@ def mainWindow(qtbot: QtBot) -> MainWindow:
     # Clear temp trash after this test
     trash.Trash.instance().clear()
 
+    # Clear temp graph cache after this test
+    graphcache.GraphCache.instance().clear()
+
     # Clean up the app without destroying it completely.
     # This will reset the temp settings folder.
     app.endSession()
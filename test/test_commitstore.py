@@ -0,0 +1,209 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from gitfourchette.commitsearch import CommitSearch
+from gitfourchette.commitstore import CommitStore, StoredCommit
+from gitfourchette.graph import MockCommit
+from .util import *
+
+
+def walkAll(repo: Repo) -> list[Commit]:
+    walker = repo.walk(repo.head.target, pygit2.enums.SortMode.TOPOLOGICAL)
+    return list(walker)
+
+
+def testCommitStoreColumns(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        mock = MockCommit("UC_FAKEID", [commits[0].id])
+
+        store = CommitStore(repo)
+        store.append(mock)
+        store.extend(commits)
+
+        assert len(store) == len(commits) + 1
+        assert store[0] is mock
+        assert store.oid(0) == "UC_FAKEID"
+
+        for row, commit in enumerate(commits, start=1):
+            stored = store[row]
+            assert isinstance(stored, StoredCommit)
+            assert stored == commit
+            assert stored.id == commit.id == store.oid(row)
+            assert stored.parent_ids == commit.parent_ids
+            assert stored.author == commit.author
+            assert stored.author.offset == commit.author.offset
+            assert stored.committer == commit.committer
+            assert stored.commit_time == commit.commit_time
+            assert stored.message == commit.message
+            # Attributes that aren't in the store are looked up in the repo
+            assert stored.tree_id == commit.tree_id
+
+        assert store[-1].id == commits[-1].id
+        assert [c.id for c in store][1:] == [c.id for c in commits]
+
+        # Only one entry per distinct person
+        assert len(store.people) == len({(c.author.name, c.author.email) for c in commits}
+                                        | {(c.committer.name, c.committer.email) for c in commits})
+
+
+def testCommitStoreParentRows(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.extend(commits)
+
+        rows = {c.id: y for y, c in enumerate(commits)}
+        for y, commit in enumerate(commits):
+            assert store.parentRows(y) == [rows.get(p, -1) for p in commit.parent_ids]
+
+        assert list(store.iterParentRows()) == [[rows[p] for p in c.parent_ids if p in rows] for c in commits]
+
+
+def testCommitStoreSplicing(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.extend(commits)
+
+        # Slices share columns with the original store
+        tail = store[3:]
+        assert len(tail) == len(commits) - 3
+        assert tail.segments[0][0] is store.segments[0][0]
+        assert [c.id for c in tail] == [c.id for c in commits[3:]]
+
+        # Concatenating a list of new commits in front of a store (like GraphSpliceLoop does)
+        spliced = commits[:5] + tail
+        assert isinstance(spliced, CommitStore)
+        assert [c.id for c in spliced] == [c.id for c in commits[:5] + commits[3:]]
+        assert spliced[4].author == commits[4].author
+
+        # Parents of new commits in front of a store can be resolved after the fact
+        rows = {c.id: y for y, c in enumerate(commits)}
+        spliced = commits[:3] + store[3:]
+        spliced.resolveParentRows(rows.__getitem__)
+        for y, commit in enumerate(commits):
+            assert spliced.parentRows(y) == [rows.get(p, -1) for p in commit.parent_ids]
+        assert list(spliced.iterParentRows()) == [[rows[p] for p in c.parent_ids if p in rows] for c in commits]
+
+        # Appending to a slice must not affect the store it was sliced from
+        head = store[:2]
+        head.append(commits[10])
+        assert len(store) == len(commits)
+        assert store[2].id == commits[2].id
+        assert head[2].id == commits[10].id
+
+
+def testCommitStoreCompaction(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.extend(commits)
+        expected = commits
+
+        for _i in range(CommitStore.MaxSegments * 2):
+            store = commits[:1] + store[1:]
+            store = store[:2] + store
+            expected = commits[:2] + expected
+            assert len(store.segments) <= CommitStore.MaxSegments
+
+        assert [c.id for c in store] == [c.id for c in expected]
+
+
+def testCommitStorePlainDataRoundtrip(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.append(MockCommit("UC_FAKEID", [commits[0].id]))
+        store.extend(commits)
+
+        restored = CommitStore.fromPlainData(repo, store.toPlainData())
+        assert len(restored) == len(store)
+        assert restored[0] == store[0]
+        for y in range(1, len(store)):
+            assert restored[y].id == store[y].id
+            assert restored[y].parent_ids == store[y].parent_ids
+            assert restored[y].author == store[y].author
+            assert restored.parentRows(y) == store.parentRows(y)
+            assert restored[y].message == store[y].message
+
+        # The search corpus survives the roundtrip
+        search = CommitSearch(restored, "first", False)
+        assert search.countMatches() == CommitSearch(store, "first", False).countMatches() > 0
+
+
+def testCommitSearchMatchesRowByRowScan(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.append(MockCommit("UC_FAKEID", [commits[0].id]))
+        store.extend(commits)
+
+        # Spread the rows over several chunks, like splicing does
+        store = commits[:4] + store[5:]
+        store = store[:1] + store
+        assert len(store.segments) > 1
+
+        def isMatch(commit, term, likelyHash):
+            if isinstance(commit, MockCommit):
+                return False
+            return ((likelyHash and str(commit.id).startswith(term))
+                    or term in commit.message.lower()
+                    or term in commit.author.name.lower())
+
+        for term, likelyHash in [("first", False), ("a u thor", False), ("merge", False),
+                                 ("4", True), ("83", True), ("zzz", False), ("\n", False)]:
+            search = CommitSearch(store, term, likelyHash)
+            expected = [y for y, c in enumerate(store) if isMatch(c, term, likelyHash)]
+            assert list(search.findRows(range(len(store)))) == expected
+            assert list(search.findRows(range(len(store) - 1, -1, -1))) == expected[::-1]
+            assert list(search.findRows(range(3, 9))) == [y for y in expected if 3 <= y < 9]
+            assert list(search.findRows(range(8, 2, -1))) == [y for y in expected if 2 < y <= 8][::-1]
+            assert search.countMatches() == len(expected)
+            assert search.countMatches(expected[::2]) == len(expected) // 2
+            assert search.countMatches(range(len(store))) == 0
+
+
+def testCommitStoreMessagesAreLazy(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.extend(commits)
+
+        # Only the lowercase search corpus is kept in the store
+        chunk = store.segments[0][0]
+        assert chunk.corpusSlice(0, 1) == commits[0].message.lower() + "\0"
+
+        assert not store.messageCache
+        assert store[0].message == commits[0].message
+        assert list(store.messageCache) == [commits[0].id.raw]
+
+
+def testCommitStoreParentLinks(tempDir):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        commits = walkAll(repo)
+        store = CommitStore(repo)
+        store.append(MockCommit("UC_FAKEID", [commits[0].id]))
+        store.extend(commits[:6])
+
+        # The parents of the last rows haven't been appended yet
+        links = list(store.iterParentLinks(4))
+        assert [oid for oid, _parents, _pending in links] == [c.id for c in commits[3:6]]
+        for row, (_oid, parents, pendingParents) in enumerate(links, 4):
+            assert parents == [p for p in store.parentRows(row) if p >= 0]
+            assert set(pendingParents) | {store.oid(p) for p in parents} == set(store[row].parent_ids)
+        assert any(pendingParents for _oid, _parents, pendingParents in links)
+
+        assert next(store.iterParentLinks())[0] == "UC_FAKEID"
+        assert list(store.iterParentLinks(len(store))) == []
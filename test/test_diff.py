@@ -702,3 +702,97 @@ def testRevertHunk(tempDir, mainWindow):
 
     assert NavLocator.inUnstaged("c/c1.txt").isSimilarEnoughTo(rw.navLocator)
     assert readFile(f"{wd}/c/c1.txt") == b"c1\n"
+
+
+def testDiffDocumentCheckpointCanAbandonWork(tempDir, mainWindow):
+    from gitfourchette.diffview.diffdocument import DiffDocument
+
+    class Abandon(Exception):
+        pass
+
+    wd = unpackRepo(tempDir)
+    writeFile(f"{wd}/longfile.txt", "".join(f"line {i}\n" for i in range(2000)))
+    rw = mainWindow.openRepo(wd)
+    patch = rw.dirtyFiles.getPatchForFile("longfile.txt")
+    locator = NavLocator.inUnstaged("longfile.txt")
+
+    # A complete document calls the checkpoint periodically
+    calls = []
+    document = DiffDocument.fromPatch(patch, locator, checkpoint=lambda: calls.append(None))
+    assert len(document.lineData) == 2001
+    assert len(calls) > 3
+
+    def checkpoint():
+        calls.append(None)
+        if len(calls) >= 3:
+            raise Abandon()
+
+    calls.clear()
+    with pytest.raises(Abandon):
+        DiffDocument.fromPatch(patch, locator, checkpoint=checkpoint)
+    assert len(calls) == 3
+
+
+def testKilledTaskKnowsItWasKilled(tempDir, mainWindow):
+    from gitfourchette import tasks
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+
+    task = rw.runTask(tasks.NewBranchFromHead)
+    dlg = findQDialog(rw, "new branch")
+    assert not task.isKilled
+
+    rw.repoTaskRunner.killCurrentTask()
+    assert task.isKilled
+
+    dlg.reject()
+    rw.repoTaskRunner.joinZombieTask()
+
+
+def testEmphasisRanges():
+    from gitfourchette.diffview.diffdocument import emphasisRanges, MAX_INTRALINE_DIFF_LENGTH
+
+    assert emphasisRanges("hello world\n", "hello world\n") == ([], [])
+    assert emphasisRanges("hello world\n", "hello there world\n") == ([], [(6, 12)])
+    assert emphasisRanges("int x = 1;\n", "int y = 2;\n") == ([(4, 5), (8, 9)], [(4, 5), (8, 9)])
+    assert emphasisRanges("abc\n", "xyz\n") == ([(0, 3)], [(0, 3)])
+
+    # Very long lines aren't fed to SequenceMatcher; the differing middle part is emphasized as a whole
+    a = "<" + "ab" * MAX_INTRALINE_DIFF_LENGTH + ">\n"
+    b = "<" + "ba" * MAX_INTRALINE_DIFF_LENGTH + ">\n"
+    assert emphasisRanges(a, b) == ([(1, len(a) - 2)], [(1, len(b) - 2)])
+
+
+def testIntraLineEmphasisIsLazy(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    writeFile(f"{wd}/longfile.txt", "".join(f"line {i} foo\n" for i in range(1000)) + "end\n")
+    with RepoContext(wd) as repo:
+        repo.index.add("longfile.txt")
+        repo.create_commit_on_head("longfile", TEST_SIGNATURE, TEST_SIGNATURE)
+    writeFile(f"{wd}/longfile.txt", "".join(f"line {i} bar\n" for i in range(1000)) + "end\n")
+
+    rw = mainWindow.openRepo(wd)
+    rw.jump(NavLocator.inUnstaged(path="longfile.txt"))
+    diffView = rw.diffView
+    highlighter = diffView.highlighter
+    lastLine = len(diffView.lineData) - 2
+    assert diffView.lineData[1].doppelganger == 1001
+    assert diffView.lineData[lastLine].doppelganger == 1000
+
+    def emphasizedRanges(i):
+        block = diffView.document().findBlockByNumber(i)
+        return [(r.start, r.start + r.length) for r in block.layout().formats()
+                if r.format.background() == highlighter.diffDocument.style.delCF2.background()
+                or r.format.background() == highlighter.diffDocument.style.addCF2.background()]
+
+    # Only the lines in the viewport (and their doppelgangers) have been processed
+    assert 1 in highlighter.emphasisCache
+    assert 1001 in highlighter.emphasisCache
+    assert lastLine not in highlighter.emphasisCache
+    assert emphasizedRanges(1) == [(len("line 0 "), len("line 0 foo"))]
+
+    # Scroll to the bottom
+    diffView.verticalScrollBar().setValue(diffView.verticalScrollBar().maximum())
+    assert lastLine in highlighter.emphasisCache
+    assert emphasizedRanges(lastLine) == [(len("line 999 "), len("line 999 bar"))]
@@ -4,6 +4,7 @@
 # For full terms, see the included LICENSE file.
 # -----------------------------------------------------------------------------
 
+import gc
 import pytest
 
 from .util import *
@@ -124,3 +125,218 @@ def testExternalChangeWhileTaskIsBusyThenAborts(tempDir, mainWindow):
 
     # Even though the task aborts, the repo should auto-refresh
     assert qlvGetRowData(rw.dirtyFiles) == ["sneaky.txt"]
+
+
+@pytest.mark.parametrize("backend", ["inotify", "qt", "overflow"])
+def testRegainForegroundOnlyRediffsChangedWorkdir(tempDir, mainWindow, monkeypatch, backend):
+    from gitfourchette.workdirwatcher import WorkdirWatcher, QtWatcherBackend, InotifyWatcherBackend
+    if backend == "inotify":
+        if not InotifyWatcherBackend.isAvailable():
+            pytest.skip("inotify not available")
+        monkeypatch.setattr(WorkdirWatcher, "Backend", InotifyWatcherBackend)
+    else:
+        monkeypatch.setattr(WorkdirWatcher, "Backend", QtWatcherBackend)
+    overflow = backend == "overflow"
+    if overflow:
+        monkeypatch.setattr(QtWatcherBackend, "MaxWatches", 0)
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    assert rw.workdirWatcher.overflowed == overflow
+
+    calls = []
+    realGetUnstagedChanges = rw.repo.get_unstaged_changes
+    realGetStagedChanges = rw.repo.get_staged_changes
+
+    def countingGetUnstagedChanges(*args, **kwargs):
+        calls.append("unstaged")
+        return realGetUnstagedChanges(*args, **kwargs)
+
+    def countingGetStagedChanges(*args, **kwargs):
+        calls.append("staged")
+        return realGetStagedChanges(*args, **kwargs)
+
+    monkeypatch.setattr(rw.repo, "get_unstaged_changes", countingGetUnstagedChanges)
+    monkeypatch.setattr(rw.repo, "get_staged_changes", countingGetStagedChanges)
+
+    # Nothing changed: don't rediff the workdir (unless the watcher gave up)
+    QTest.qWait(1)
+    mainWindow.onRegainForeground()
+    assert calls == (["unstaged"] if overflow else [])
+    calls.clear()
+
+    # Change a file in a subdirectory: rediff the unstaged changes, but the index hasn't changed
+    writeFile(f"{wd}/c/c1.txt", "modified outside\n")
+    QTest.qWait(1)
+    mainWindow.onRegainForeground()
+    assert calls == ["unstaged"]
+    assert qlvGetRowData(rw.dirtyFiles) == ["c/c1.txt"]
+    calls.clear()
+
+    # Stage the file outside of GF: the staged changes must be rediffed
+    with RepoContext(wd, write_index=True) as repo2:
+        repo2.index.add("c/c1.txt")
+        repo2.index.write()
+    QTest.qWait(1)
+    mainWindow.onRegainForeground()
+    assert calls == ["staged", "unstaged"]
+    assert (qlvGetRowData(rw.dirtyFiles), qlvGetRowData(rw.stagedFiles)) == ([], ["c/c1.txt"])
+    calls.clear()
+
+    # Create a directory, then a file in it: the new directory must be watched
+    os.mkdir(f"{wd}/newdir")
+    QTest.qWait(1)
+    mainWindow.onRegainForeground()
+    calls.clear()
+    writeFile(f"{wd}/newdir/new.txt", "hello\n")
+    QTest.qWait(1)
+    mainWindow.onRegainForeground()
+    assert calls == ["unstaged"]
+    assert qlvGetRowData(rw.dirtyFiles) == ["newdir/new.txt"]
+    assert rw.workdirWatcher.overflowed == overflow
+
+
+def testNoOpRefreshSkipsSyncSteps(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+
+    calls = []
+
+    def makeSpy(name):
+        real = getattr(rw.repo, name)
+
+        def spy(*args, **kwargs):
+            calls.append(name)
+            return real(*args, **kwargs)
+        return spy
+
+    for name in ["map_refs_to_ids", "listall_stashes", "listall_mergeheads", "listall_submodules_dict"]:
+        monkeypatch.setattr(rw.repo, name, makeSpy(name))
+
+    # Nothing changed on disk: the refresh shouldn't look at the refs, stashes, etc.
+    rw.refreshRepo()
+    assert calls == []
+
+    # Create a branch outside of GF: only the refs must be reloaded
+    with RepoContext(wd) as repo2:
+        repo2.create_branch_on_head("sneaky-branch")
+    rw.refreshRepo()
+    assert calls == ["map_refs_to_ids"]
+    assert "refs/heads/sneaky-branch" in rw.repoModel.refs
+    calls.clear()
+
+    # Explicit refresh runs everything
+    rw.refreshRepoThoroughly()
+    assert sorted(calls) == ["listall_mergeheads", "listall_stashes", "listall_submodules_dict", "map_refs_to_ids"]
+
+
+def testFailedGraphSpliceDoesntLockGraph(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.repomodel import RepoModel
+    from gitfourchette.tasks.repotask import AbortTask
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+
+    with RepoContext(wd) as repo2:
+        newOid = repo2.create_commit_on_head("external commit")
+
+    def failingWalk(_repoModel):
+        raise AbortTask("simulated walk failure")
+
+    with monkeypatch.context() as m:
+        m.setattr(RepoModel, "walkTopOfGraph", failingWalk)
+        rw.refreshRepo()
+        rejectQMessageBox(rw, "simulated walk failure")
+
+    # The graph isn't stuck in its splicing state
+    assert not rw.repoModel.graphIncomplete
+    assert newOid not in rw.repoModel.graph.commitRows
+
+    # The next refresh picks up the new commit
+    rw.refreshRepo()
+    assert newOid in rw.repoModel.graph.commitRows
+
+
+def testWorkdirWatcherGivesUpEarlyOnHugeCheckouts(tempDir, monkeypatch):
+    from gitfourchette.workdirwatcher import WorkdirWatcher
+
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        numTracked = len(repo.index)
+        assert WorkdirWatcher.scanPaths(repo, numTracked + 100, directoriesOnly=False) is not None
+
+        # Too many tracked files: don't even walk the workdir
+        numIgnoreLookups = 0
+        realPathIsIgnored = repo.path_is_ignored
+
+        def countingPathIsIgnored(path):
+            nonlocal numIgnoreLookups
+            numIgnoreLookups += 1
+            return realPathIsIgnored(path)
+
+        monkeypatch.setattr(repo, "path_is_ignored", countingPathIsIgnored)
+        assert WorkdirWatcher.scanPaths(repo, numTracked, directoriesOnly=False) is None
+        assert numIgnoreLookups == 0
+
+        # Subdirectories are walked until the limit is hit, and no further
+        assert WorkdirWatcher.scanPaths(repo, 1, "a", directoriesOnly=False) is None
+        assert numIgnoreLookups <= 1
+
+        # Watching directories only: the number of files doesn't matter
+        numIgnoreLookups = 0
+        dirs = WorkdirWatcher.scanPaths(repo, 10, directoriesOnly=True)
+        assert sorted(dirs) == ["", "a", "b", "c"]
+        assert numIgnoreLookups == 3
+
+
+def testWorkdirWatchersShareWatchBudget(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.workdirwatcher import WorkdirWatcher, QtWatcherBackend
+    monkeypatch.setattr(WorkdirWatcher, "Backend", QtWatcherBackend)
+
+    wd1 = unpackRepo(tempDir, renameTo="repo1")
+    wd2 = unpackRepo(tempDir, renameTo="repo2")
+    with RepoContext(wd1) as repo:
+        numPaths = len(WorkdirWatcher.scanPaths(repo, 1000))
+
+    # Let watchers from previous tests give their watches back
+    QTest.qWait(1)
+    gc.collect()
+
+    # Enough watches for one workdir, but not for two
+    baseline = WorkdirWatcher.totalWatches
+    monkeypatch.setattr(QtWatcherBackend, "MaxWatches", baseline + numPaths + numPaths // 2)
+
+    rw1 = mainWindow.openRepo(wd1)
+    assert not rw1.workdirWatcher.overflowed
+    assert WorkdirWatcher.totalWatches == baseline + numPaths
+
+    rw2 = mainWindow.openRepo(wd2)
+    assert rw2.workdirWatcher.overflowed
+    assert WorkdirWatcher.totalWatches == baseline + numPaths
+
+    # Closing the first workdir gives its watches back
+    mainWindow.closeTab(mainWindow.tabs.indexOf(rw1))
+    QTest.qWait(1)
+    assert WorkdirWatcher.totalWatches == baseline
+
+
+def testFailedSyncStepRunsAgain(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+
+    with RepoContext(wd) as repo2:
+        repo2.create_branch_on_head("sneaky-branch")
+
+    def failingMapRefs(*_args, **_kwargs):
+        raise GitError("simulated failure")
+
+    with monkeypatch.context() as m:
+        m.setattr(rw.repo, "map_refs_to_ids", failingMapRefs)
+        with pytest.raises(GitError):
+            repoModel.syncRefs()
+
+    # The step didn't go through, so it isn't considered synced
+    assert repoModel.syncRefs()
+    assert "refs/heads/sneaky-branch" in repoModel.refs
+    assert not repoModel.syncRefs()
@@ -14,9 +14,9 @@ from gitfourchette.forms.commitdialog import CommitDialog
 from gitfourchette.forms.donateprompt import DonatePrompt
 from gitfourchette.forms.reposettingsdialog import RepoSettingsDialog
 from gitfourchette.forms.unloadedrepoplaceholder import UnloadedRepoPlaceholder
-from gitfourchette.graphview.commitlogmodel import SpecialRow
+from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow
 from gitfourchette.mainwindow import MainWindow
-from gitfourchette.nav import NavLocator, NavContext
+from gitfourchette.nav import NavLocator, NavContext, NavFlags
 from gitfourchette.sidebar.sidebarmodel import SidebarItem
 from .util import *
 
@@ -118,6 +118,54 @@ def testSkipRenameDetection(tempDir, mainWindow):
     assert not rw.diffBanner.isVisibleTo(rw)
 
 
+def testDetectRenamesInBackground(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+
+    with RepoContext(wd, write_index=True) as repo:
+        os.rename(f"{wd}/a/a2.txt", f"{wd}/a/a2-renamed.txt")
+        repo.index.remove("a/a2.txt")
+        repo.index.add("a/a2-renamed.txt")
+        for i in range(100):
+            writeFile(f"{wd}/bogus{i:03}.txt", f"hello {i}\n")
+            repo.index.add(f"bogus{i:03}.txt")
+        oid = repo.create_commit_on_head("renamed a2.txt and added a ton of files")
+
+    rw = mainWindow.openRepo(wd)
+
+    # The file list appears right away, without rename detection
+    rw.jump(NavLocator.inCommit(oid, "bogus050.txt"))
+    assert 102 == len(qlvGetRowData(rw.committedFiles))
+    assert rw.committedFiles.skippedRenameDetection
+    assert ["bogus050.txt"] == qlvGetSelection(rw.committedFiles)
+
+    # Renames are detected in the background, the file list is updated in place
+    QTest.qWait(1)
+    assert not rw.repoTaskRunner.isBusy()
+    assert not rw.committedFiles.skippedRenameDetection
+    assert 101 == len(qlvGetRowData(rw.committedFiles))
+    assert ["bogus050.txt"] == qlvGetSelection(rw.committedFiles)
+    assert rw.navLocator.path == "bogus050.txt"
+    assert re.search(r"1 rename.* detected", rw.diffBanner.label.text(), re.I)
+
+    # The renames are remembered the next time the commit is shown
+    rw.jump(NavLocator.inCommit(rw.repo.head_commit.parent_ids[0]))
+    rw.jump(NavLocator.inCommit(oid))
+    assert 101 == len(qlvGetRowData(rw.committedFiles))
+    assert not rw.committedFiles.skippedRenameDetection
+
+    # If the diff that's being shown turns out to be part of a rename, it gets reloaded
+    rw.repoModel.commitDiffCache.clear()
+    rw.jump(NavLocator.inCommit(oid, "a/a2-renamed.txt").withExtraFlags(NavFlags.ForceDiff))
+    assert 102 == len(qlvGetRowData(rw.committedFiles))
+    assert rw.diffView.currentPatch.delta.status == DeltaStatus.ADDED
+
+    QTest.qWait(1)
+    assert 101 == len(qlvGetRowData(rw.committedFiles))
+    assert rw.navLocator.path == "a/a2-renamed.txt"
+    assert rw.specialDiffView.isVisibleTo(rw)
+    assert re.search(r"renamed:.+a2\.txt.+a2-renamed\.txt", rw.specialDiffView.toPlainText(), re.I)
+
+
 def testNewRepo(tempDir, mainWindow):
     triggerMenuAction(mainWindow.menuBar(), "file/new repo")
 
@@ -249,6 +297,106 @@ def testTruncatedHistory(tempDir, mainWindow, method):
     assert not rw.diffBanner.isVisibleTo(rw)
 
 
+def testExpandTruncatedHistoryIncrementally(tempDir, mainWindow):
+    from gitfourchette.graph import GraphDiagram
+    from gitfourchette.toolbox import makeInternalLink
+
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5})
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    graph = repoModel.graph
+    clModel = rw.graphView.clModel
+    assert repoModel.numRealCommits == 5
+
+    # Refreshing the top of the graph reuses the walker, so it'll have to catch up
+    rw.repo.create_commit_on_head("extend me", TEST_SIGNATURE, TEST_SIGNATURE)
+    rw.refreshRepo()
+    assert repoModel.numRealCommits == 6
+    assert repoModel.walkerRow == -1
+
+    # Load a few more commits: the existing graph and model must be extended, not rebuilt
+    rw.processInternalLink(makeInternalLink("expandlog", n="8"))
+    assert rw.repoModel is repoModel
+    assert repoModel.graph is graph
+    assert repoModel.numRealCommits == 8
+    assert repoModel.truncatedHistory
+    assert repoModel.walkerRow == 8
+    assert [c.id for c in clModel._commitSequence] == [c.id for c in repoModel.commitSequence]
+    assert clModel.index(9, 0).data(CommitLogModel.Role.SpecialRow) == SpecialRow.TruncatedHistory
+    assert all(graph.getCommitRow(c.id) == row for row, c in enumerate(repoModel.commitSequence))
+    graph.testConsistency()
+    extendedDiagram = GraphDiagram.diagram(graph)
+
+    # Scrolling to the bottom loads the rest of the history
+    rw.graphView.verticalScrollBar().triggerAction(QAbstractSlider.SliderAction.SliderToMaximum)
+    assert not repoModel.truncatedHistory
+    assert repoModel.numRealCommits > 8
+    assert clModel.rowCount() == len(repoModel.commitSequence)
+    assert [c.id for c in clModel._commitSequence] == [c.id for c in repoModel.commitSequence]
+    graph.testConsistency()
+    fullDiagram = GraphDiagram.diagram(graph)
+
+    # The graph must be identical to one that's built from scratch
+    rw.primeRepo(force=True, maxCommits=8)
+    assert rw.repoModel.numRealCommits == 8
+    assert GraphDiagram.diagram(rw.repoModel.graph) == extendedDiagram
+
+    rw.primeRepo(force=True, maxCommits=0)
+    assert GraphDiagram.diagram(rw.repoModel.graph) == fullDiagram
+
+
+@pytest.mark.parametrize("maxCommits", [0, 5])
+def testStreamGraphWhileLoading(tempDir, mainWindow, monkeypatch, maxCommits):
+    from gitfourchette.tasks import PrimeRepo
+
+    publishCalls = []
+    originalPublishRows = PrimeRepo._publishRows
+
+    def spyPublishRows(task, repoModel, *args):
+        publishCalls.append(len(repoModel.graph.commitRows))
+        originalPublishRows(task, repoModel, *args)
+        # Rows in the model must all be woven into the graph already
+        assert task.rw.graphView.clModel.rowCount() == len(repoModel.commitSequence)
+        assert all(c.id in repoModel.graph.commitRows for c in repoModel.commitSequence)
+
+    monkeypatch.setattr(PrimeRepo, "FirstBatchSize", 2)
+    monkeypatch.setattr(PrimeRepo, "_publishRows", spyPublishRows)
+
+    mainWindow.onAcceptPrefsDialog({"maxCommits": maxCommits})
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+
+    # The top of the graph was shown early, then rows were appended in growing batches
+    assert len(publishCalls) >= 3
+    assert publishCalls == sorted(publishCalls)
+
+    repoModel = rw.repoModel
+    assert not repoModel.graphIncomplete
+    assert rw.graphView.isEnabled()
+    assert rw.sidebar.isEnabled()
+    repoModel.graph.testConsistency()
+
+    clModel = rw.graphView.clModel
+    numRows = len(repoModel.commitSequence)
+    assert [c.id for c in clModel._commitSequence] == [c.id for c in repoModel.commitSequence]
+    assert all(c.id in repoModel.graph.commitRows for c in repoModel.commitSequence)
+
+    if maxCommits:
+        assert repoModel.numRealCommits == maxCommits
+        assert clModel.rowCount() == numRows + 1
+        assert rw.graphView.clFilter.rowCount() == numRows + 1
+        assert clModel.index(numRows, 0).data(CommitLogModel.Role.SpecialRow) == SpecialRow.TruncatedHistory
+    else:
+        assert clModel.rowCount() == numRows
+        assert rw.graphView.clFilter.rowCount() == numRows
+
+    # The fully-loaded graph must match the graph view's rows
+    for row in range(numRows):
+        oid = clModel.index(row, 0).data(CommitLogModel.Role.Oid)
+        assert repoModel.graph.getCommitRow(oid) == row
+
+
 def testRepoNickname(tempDir, mainWindow):
     wd = unpackRepo(tempDir)
     rw = mainWindow.openRepo(wd)
@@ -0,0 +1,46 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import json
+
+import pytest
+
+from gitfourchette.graph.graphbenchmark import SHAPES, BENCHMARKS, SyntheticHistory, main
+
+
+@pytest.mark.parametrize("shape", SHAPES.keys())
+def testSyntheticHistoryIsTopologicallySorted(shape):
+    history = SyntheticHistory.generate(shape, 300, seed=1)
+    assert len(history.sequence) >= 300
+
+    seen = set()
+    for commit in history.sequence:
+        assert commit.id not in seen
+        assert not any(p in seen for p in commit.parent_ids), "parents must come after their children"
+        seen.add(commit.id)
+
+    allParents = {p for c in history.sequence for p in c.parent_ids}
+    assert allParents <= seen
+    assert set(history.heads) == seen - allParents
+
+    again = SyntheticHistory.generate(shape, 300, seed=1)
+    assert again.sequence == history.sequence
+
+
+def testBenchmarkReport(tempDir):
+    path = f"{tempDir.name}/bench.json"
+    main(["--size", "200", "--repeat", "1", "--output", path, "--quiet"])
+
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+
+    results = report["results"]
+    assert len(results) == len(SHAPES) * len(BENCHMARKS)
+    for result in results:
+        assert result["size"] == 200
+        assert result["items"] > 0
+        assert result["seconds"] > 0
+        assert result["peakBytes"] >= 0
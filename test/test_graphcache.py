@@ -0,0 +1,140 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+import pytest
+
+from gitfourchette.graph import *
+from gitfourchette.graphcache import GraphCache
+from gitfourchette.nav import NavLocator
+from gitfourchette.repomodel import RepoModel
+from .test_graphsplicer import SCENARIOS, KF_INTERVAL_TEST
+from .util import *
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testGraphSerializerRoundtrip(scenarioKey):
+    textGraph1, textGraph2, expectEquilibrium = SCENARIOS[scenarioKey]
+    sequence1, heads1 = GraphDiagram.parseDefinition(textGraph1)
+    sequence2, heads2 = GraphDiagram.parseDefinition(textGraph2)
+
+    original = GraphBuildLoop(heads1, keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence1).graph
+
+    snapshot = GraphSerializer.dump(original, sequence1)
+    assert snapshot.numRows == len(sequence1)
+    assert snapshot.oids[:len(sequence1)] == [c.id for c in sequence1]
+    for y, commit in enumerate(sequence1):
+        assert GraphSerializer.parentsOf(snapshot, y) == list(commit.parent_ids)
+
+    restored = GraphSerializer.load(snapshot)
+    restored.testConsistency()
+    assert restored.keyframeRows == original.keyframeRows
+    assert [restored.getCommitRow(c.id) for c in sequence1] == list(range(len(sequence1)))
+    assert GraphDiagram.diagram(restored) == GraphDiagram.diagram(original)
+
+    # The restored graph must be spliceable just like the original one
+    spliceLoop = GraphSpliceLoop(restored, sequence1, heads1, heads2, keyframeInterval=KF_INTERVAL_TEST)
+    spliceLoop.sendAll(sequence2)
+    restored.testConsistency()
+    assert expectEquilibrium == spliceLoop.splicer.foundEquilibrium
+    assert [c.id for c in spliceLoop.commitSequence] == [c.id for c in sequence2]
+
+    verification = GraphBuildLoop().sendAll(sequence2).graph
+    restored.keyframes = []
+    restored.keyframeRows = []
+    assert GraphDiagram.diagram(restored) == GraphDiagram.diagram(verification)
+
+
+def testReopenRepoFromGraphCache(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    numCommits = rw.repoModel.numRealCommits
+    oldTail = [c.id for c in rw.repoModel.commitSequence[1:]]
+
+    mainWindow.closeTab(0)
+    assert os.path.isfile(GraphCache.instance().cachePath(wd))
+
+    # Make a new commit while the repo is closed
+    with RepoContext(wd) as repo:
+        writeFile(f"{wd}/toto.txt", "hello world\n")
+        repo.index.add("toto.txt")
+        newOid = repo.create_commit_on_head("made while the repo was closed")
+
+    rw = mainWindow.openRepo(wd)
+    sequence = rw.repoModel.commitSequence
+    assert rw.repoModel.numRealCommits == numCommits + 1
+    assert sequence[1].id == newOid
+    assert [c.id for c in sequence[2:]] == oldTail
+    rw.repoModel.graph.testConsistency()
+
+    # Restored commits must be usable like real commits
+    rw.jump(NavLocator.inCommit(sequence[-1].id))
+    assert rw.navLocator.commit == sequence[-1].id
+    assert sequence[-1].message
+
+
+def testIgnoreGraphCacheWithDifferentTruncation(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 3})
+    rw = mainWindow.openRepo(wd)
+    assert rw.repoModel.truncatedHistory
+    mainWindow.closeTab(0)
+
+    with RepoContext(wd) as repo:
+        assert GraphCache.instance().load(repo, 3) is not None
+        assert GraphCache.instance().load(repo, 5) is None
+
+    mainWindow.onAcceptPrefsDialog({"maxCommits": 5})
+    rw = mainWindow.openRepo(wd)
+    assert rw.repoModel.truncatedHistory
+    assert rw.repoModel.numRealCommits == 5
+
+
+def testReuseHiddenCommitsFromGraphCache(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        # Make a branch with a commit of its own
+        parent = repo.head_commit
+        oid = repo.create_commit(None, TEST_SIGNATURE, TEST_SIGNATURE, "hide me", parent.tree_id, [parent.id])
+        repo.create_branch_from_commit("hideme", oid)
+
+    rw = mainWindow.openRepo(wd)
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    rw.repoModel.prefs.write(force=True)
+    hiddenCommits = set(rw.repoModel.hiddenCommits)
+    foreignCommits = set(rw.repoModel.foreignCommits)
+    numVisibleRows = rw.graphView.clFilter.rowCount()
+    assert hiddenCommits == {oid}
+    mainWindow.closeTab(0)
+
+    # None of the refs moved, so the graph must be restored as is
+    numSplices = 0
+    originalSyncTopOfGraph = RepoModel.syncTopOfGraph
+
+    def countingSyncTopOfGraph(self):
+        nonlocal numSplices
+        numSplices += 1
+        return originalSyncTopOfGraph(self)
+
+    monkeypatch.setattr(RepoModel, "syncTopOfGraph", countingSyncTopOfGraph)
+
+    rw = mainWindow.openRepo(wd)
+    assert numSplices == 0
+    assert rw.repoModel.hiddenCommits == hiddenCommits
+    assert rw.repoModel.foreignCommits == foreignCommits
+    assert rw.graphView.clFilter.rowCount() == numVisibleRows
+    mainWindow.closeTab(0)
+
+    # Move a ref while the repo is closed: the cached flags can't be trusted anymore
+    with RepoContext(wd) as repo:
+        parent = repo.head_commit
+        newOid = repo.create_commit(None, TEST_SIGNATURE, TEST_SIGNATURE, "new", parent.tree_id, [parent.id])
+        repo.create_branch_from_commit("new-branch", newOid)
+
+    rw = mainWindow.openRepo(wd)
+    assert numSplices == 1
+    assert rw.repoModel.graph.getCommitRow(newOid) > 0
+    assert rw.repoModel.hiddenCommits == hiddenCommits
+    assert rw.repoModel.foreignCommits == foreignCommits
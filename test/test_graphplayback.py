@@ -217,3 +217,70 @@ def testVisibleJunctionOnHiddenArc():
     assert laneRemap['d'] == [(0, 0), (1, 1), (2, 2)]
     assert laneRemap['e'] == [(0, 0), (1, 1), (2, 2)]
     assert laneRemap['z'] == [(0, X), (1, X), (2, X)]
+
+
+def testCompactArcs():
+    sequence, heads = GraphDiagram.parseDefinition("u:z a:e b-c:d,e d:z e-z")
+    g = GraphBuildLoop(["u", "a", "b"]).sendAll(sequence).graph
+
+    arcs = list(g.startArc.nextArc)
+    assert all(not hasattr(arc, "__dict__") for arc in arcs)
+    assert all(not hasattr(row, "__dict__") for row in g.commitRows.values())
+
+    # Only the arc that got a junction owns a junction list
+    withJunctions = [arc for arc in arcs if arc.junctions]
+    assert [(arc.openedBy, arc.closedBy) for arc in withJunctions] == [("a", "e")]
+    assert all(arc.junctions is NO_JUNCTIONS for arc in arcs if arc not in withJunctions)
+
+
+def testAdaptiveKeyframes(monkeypatch):
+    import random
+    from gitfourchette.graph import graph as graphModule
+
+    monkeypatch.setattr(graphModule, "VOLATILE_KF_BUDGET", 20)
+
+    # Two interleaved branches, long enough for volatile keyframes to kick in
+    numRows = 2000
+    sequence = []
+    for i in range(numRows):
+        if i + 2 < numRows:
+            parents = [f"c{i + 2}"]
+        elif i + 1 < numRows:
+            parents = [f"c{i + 1}"]
+        else:
+            parents = []
+        sequence.append(MockCommit(f"c{i}", parents))
+    g = GraphBuildLoop(["c0", "c1"], keyframeInterval=1000).sendAll(sequence).graph
+    numPermanentKeyframes = len(g.keyframes)
+
+    reference = [frame.sealCopy() for frame in g.startPlayback()]
+    assert len(reference) == numRows
+
+    # Hammer a hot region of the graph, with occasional random accesses elsewhere
+    rng = random.Random(1234)
+    for _ in range(500):
+        if rng.random() < .8:
+            row = rng.randrange(1500, 1600)
+        else:
+            row = rng.randrange(numRows)
+        assert g.getFrame(row) == reference[row]
+
+    stats = g.keyframeStats
+    assert stats.saved > 0
+    assert stats.evicted > 0
+    assert stats.hits + stats.replays >= 500
+    assert stats.rowsReplayed / stats.replays < graphModule.VOLATILE_KF_SPACING
+    assert str(stats)
+
+    # Volatile keyframes stay within budget, and the hot region keeps its keyframes
+    volatileRows = [int(kf.row) for kf in g.keyframes if kf.lastUse != graphModule.PERMANENT_KF]
+    assert len(g.keyframes) - numPermanentKeyframes == len(volatileRows)
+    assert 0 < len(volatileRows) <= 20
+    hotRows = [row for row in volatileRows if 1500 - graphModule.VOLATILE_KF_SPACING <= row < 1600]
+    assert len(hotRows) >= 2
+
+    g.testConsistency()
+
+    # Volatile keyframes aren't persisted in snapshots
+    snapshot = GraphSerializer.dump(g, sequence)
+    assert len(snapshot.keyframes) == numPermanentKeyframes
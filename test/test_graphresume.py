@@ -0,0 +1,60 @@
+# -----------------------------------------------------------------------------
+# Copyright (C) 2024 Iliyas Jorio.
+# This file is part of GitFourchette, distributed under the GNU GPL v3.
+# For full terms, see the included LICENSE file.
+# -----------------------------------------------------------------------------
+
+from gitfourchette.graph import *
+import pytest
+
+from .test_graphsplicer import SCENARIOS, KF_INTERVAL_TEST
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testResumeTruncatedGraph(scenarioKey):
+    _textGraph1, textGraph2, _expectEquilibrium = SCENARIOS[scenarioKey]
+    sequence, heads = GraphDiagram.parseDefinition(textGraph2)
+    hideSeeds = set(sorted(heads)[-1:])
+    localSeeds = set(sorted(heads)[:1])
+
+    full = GraphBuildLoop(heads, hideSeeds, localSeeds, keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence)
+    expectedDiagram = GraphDiagram.diagram(full.graph)
+
+    for cut in range(1, len(sequence)):
+        truncated = GraphBuildLoop(heads, hideSeeds, localSeeds, keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence[:cut])
+        graph = truncated.graph
+
+        loop = GraphBuildLoop.resume(graph, graph.getFrame(cut - 1), truncated.hiddenCommits, truncated.foreignCommits,
+                                     heads, hideSeeds, localSeeds, keyframeInterval=KF_INTERVAL_TEST)
+        loop.sendAll(sequence[cut:])
+
+        assert loop.graph is graph
+        assert [graph.getCommitRow(c.id) for c in sequence] == list(range(len(sequence)))
+        assert GraphDiagram.diagram(graph) == expectedDiagram
+        assert loop.hiddenCommits == full.hiddenCommits
+        assert loop.foreignCommits == full.foreignCommits
+        graph.testConsistency()
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testResumeSplicedTruncatedGraph(scenarioKey):
+    textGraph1, textGraph2, _expectEquilibrium = SCENARIOS[scenarioKey]
+    sequence1, heads1 = GraphDiagram.parseDefinition(textGraph1)
+    sequence2, heads2 = GraphDiagram.parseDefinition(textGraph2)
+    expectedDiagram = GraphDiagram.diagram(GraphBuildLoop(heads2).sendAll(sequence2).graph)
+
+    for cut in range(1, len(sequence1)):
+        # Truncated graph of the old history, brought up to date with the new heads
+        graph = GraphBuildLoop(heads1, keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence1[:cut]).graph
+        spliceLoop = GraphSpliceLoop(graph, sequence1[:cut], heads1, heads2, keyframeInterval=KF_INTERVAL_TEST)
+        spliceLoop.sendAll(sequence2)
+        spliced = spliceLoop.commitSequence
+        assert [c.id for c in spliced] == [c.id for c in sequence2[:len(spliced)]]
+
+        lastFrame = graph.getFrame(len(spliced) - 1) if spliced else None
+        loop = GraphBuildLoop.resume(graph, lastFrame, spliceLoop.hiddenCommits,
+                                     spliceLoop.foreignCommits, heads2, keyframeInterval=KF_INTERVAL_TEST)
+        loop.sendAll(sequence2[len(spliced):])
+
+        assert GraphDiagram.diagram(graph) == expectedDiagram
+        graph.testConsistency()
@@ -397,3 +397,89 @@ def testGraphSplicing(scenarioKey):
                            newHeads=heads1, keyframeInterval=KF_INTERVAL_TEST)
     gsl2.sendAll(sequence1)
     g.testConsistency()
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testDeferredGraphSplicing(scenarioKey):
+    textGraph1, textGraph2, expectEquilibrium = SCENARIOS[scenarioKey]
+    sequence1, heads1 = GraphDiagram.parseDefinition(textGraph1)
+    sequence2, heads2 = GraphDiagram.parseDefinition(textGraph2)
+
+    g = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence1).graph
+    diagramBefore = GraphDiagram.diagram(g, verbose=True)
+    rowsBefore = [g.getCommitRow(c.id) for c in sequence1]
+
+    spliceLoop = GraphSpliceLoop(g, sequence1, heads1, heads2, keyframeInterval=KF_INTERVAL_TEST,
+                                 deferGraphSplice=True)
+    spliceLoop.sendAll(sequence2)
+
+    # The commit sequence is ready, but the old graph must be untouched so far
+    assert [c.id for c in sequence2] == [c.id for c in spliceLoop.commitSequence]
+    assert expectEquilibrium == spliceLoop.splicer.foundEquilibrium
+    assert GraphDiagram.diagram(g, verbose=True) == diagramBefore
+    assert [g.getCommitRow(c.id) for c in sequence1] == rowsBefore
+    g.testConsistency()
+
+    spliceLoop.spliceGraph()
+    g.testConsistency()
+    assert list(range(len(sequence2))) == [g.getCommitRow(c.id) for c in sequence2]
+
+    verification = GraphBuildLoop().sendAll(sequence2).graph
+    g.keyframes = []
+    g.keyframeRows = []
+    assert GraphDiagram.diagram(g, verbose=True) == GraphDiagram.diagram(verification, verbose=True)
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testOpenArcSignatures(scenarioKey):
+    from gitfourchette.graph.graphweaver import GraphWeaver
+
+    def recomputeSignature(frame: Frame):
+        row = int(frame.row)
+        signature = 0
+        for arc in frame.openArcs:
+            if arc and not arc.isStale(row):
+                signature ^= arc.signature()
+        return signature
+
+    for textGraph in SCENARIOS[scenarioKey][:2]:
+        sequence, _heads = GraphDiagram.parseDefinition(textGraph)
+
+        # The weaver maintains its signature as it goes
+        graph, weaver = GraphWeaver.newGraph()
+        for commit in sequence:
+            weaver.newCommit(commit.id, commit.parent_ids)
+            graph.commitRows[commit.id] = weaver.row
+            assert weaver.openArcSignature == recomputeSignature(weaver)
+            if int(weaver.row) % KF_INTERVAL_TEST == 0:
+                graph.saveKeyframe(weaver)
+
+        # Playback maintains its signature once tracking is on, wherever it starts from
+        for startRow in range(len(sequence)):
+            player = graph.startPlayback(startRow)
+            player.trackOpenArcSignature()
+            assert player.openArcSignature == recomputeSignature(player)
+            for _ in player:
+                assert player.openArcSignature == recomputeSignature(player)
+
+
+@pytest.mark.parametrize('scenarioKey', SCENARIOS.keys())
+def testIndexedCleanupMatchesFullScan(scenarioKey):
+    for textGraph in SCENARIOS[scenarioKey][:2]:
+        sequence, _heads = GraphDiagram.parseDefinition(textGraph)
+        g = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence).graph
+
+        # Keyframes index the rows they depend on
+        for kf in g.keyframes:
+            for row in range(int(kf.row) + 1):
+                dependsOnRowsAbove = not (
+                        all(arc is None or arc.isIndependentOfRowsAbove(row) for arc in kf.openArcs)
+                        and all(arc is None or arc.isIndependentOfRowsAbove(row) or arc.isStale(row) for arc in kf.solvedArcs))
+                assert kf.dependsOnRowsAbove(row) == dependsOnRowsAbove
+
+        # Deleting arcs skips ahead from the nearest keyframe
+        for row in range(1, len(sequence)):
+            g = GraphBuildLoop(keyframeInterval=KF_INTERVAL_TEST).sendAll(sequence).graph
+            firstKeptArc = next((arc for arc in g.startArc if arc.openedAt >= row), None)
+            g.deleteArcsDependingOnRowsAbove(row)
+            assert g.startArc.nextArc is firstKeptArc
@@ -345,3 +345,116 @@ def testLocalCommitMarks(fixture: ChainMarkerFixture, seeds, expected):
         oid = commit.id
         isLocal = oid not in builder.foreignCommits
         assert isLocal == (oid in expected), f"{oid} should be marked {oid in expected}, was marked {isLocal}"
+
+
+def parentRowLists(sequence):
+    rows = {commit.id: row for row, commit in enumerate(sequence)}
+    parentRows = [[rows[p] for p in commit.parent_ids if p in rows] for commit in sequence]
+    return rows, parentRows
+
+
+@pytest.mark.parametrize(
+    argnames=("fixture", "seeds", "expectedHidden"),
+    argvalues=itertools.chain.from_iterable(g.hiddenCommitsParametrizedArgs() for g in allFixtures),
+    ids=itertools.chain.from_iterable(g.hiddenCommitsParametrizedNames() for g in allFixtures),
+)
+def testBatchHiddenCommitMarks(fixture: ChainMarkerFixture, seeds, expectedHidden):
+    fixtureHeads = fixture.headsDef.split()
+    sequence, _graphHeads = GraphDiagram.parseDefinition(fixture.graphDef)
+    rows, parentRows = parentRowLists(sequence)
+
+    hiddenTips = {c for c in seeds if not c.endswith("!")}
+    hiddenTaps = {c.removesuffix("!") for c in seeds if c.endswith("!")}
+    trickle = BatchTrickle.newHiddenTrickle(rows.__getitem__, fixtureHeads, hiddenTips, hiddenTaps)
+    hiddenRows = trickle.run(parentRows)
+
+    assert {sequence[row].id for row in hiddenRows} == set(expectedHidden)
+
+
+@pytest.mark.parametrize(
+    argnames=("fixture", "seeds", "expected"),
+    argvalues=itertools.chain.from_iterable(g.localCommitsParametrizedArgs() for g in allFixtures),
+    ids=itertools.chain.from_iterable(g.localCommitsParametrizedNames() for g in allFixtures),
+)
+def testBatchLocalCommitMarks(fixture: ChainMarkerFixture, seeds, expected):
+    fixtureHeads = fixture.headsDef.split()
+    sequence, _graphHeads = GraphDiagram.parseDefinition(fixture.graphDef)
+    rows, parentRows = parentRowLists(sequence)
+
+    trickle = BatchTrickle.newForeignTrickle(rows.__getitem__, fixtureHeads, seeds)
+    foreignRows = trickle.run(parentRows)
+
+    localCommits = {commit.id for commit in sequence} - {sequence[row].id for row in foreignRows}
+    assert localCommits == set(expected)
+
+
+def feedInSlices(trickle: BatchTrickle, sequence, sliceLength: int) -> list[int]:
+    """ Feed a sequence to a trickle as if it were growing by `sliceLength` rows at a time. """
+    rows, _parentRows = parentRowLists(sequence)
+    flaggedRows = []
+    for start in range(0, len(sequence), sliceLength):
+        end = min(start + sliceLength, len(sequence))
+        links = []
+        for commit in sequence[start:end]:
+            # Parents below the end of the slice aren't known yet
+            parents = [rows[p] for p in commit.parent_ids if rows.get(p, end) < end]
+            pendingParents = [p for p in commit.parent_ids if rows.get(p, end) >= end]
+            links.append((commit.id, parents, pendingParents))
+        flaggedRows += trickle.feed(start, links)
+    return flaggedRows
+
+
+@pytest.mark.parametrize("sliceLength", [1, 2, 3, 1000])
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+def testFeedGrowingSequence(fixture: ChainMarkerFixture, sliceLength):
+    fixtureHeads = fixture.headsDef.split()
+    sequence, _graphHeads = GraphDiagram.parseDefinition(fixture.graphDef)
+    rows, _parentRows = parentRowLists(sequence)
+
+    # The seeds aren't in the sequence yet when the trickles are set up
+    def rowOf(_oid):
+        raise KeyError()
+
+    for seeds, expectedHidden in fixture.hiddenCommits.items():
+        hiddenTips = {c for c in seeds.split() if not c.endswith("!")}
+        hiddenTaps = {c.removesuffix("!") for c in seeds.split() if c.endswith("!")}
+        trickle = BatchTrickle.newHiddenTrickle(rowOf, fixtureHeads, hiddenTips, hiddenTaps)
+        hiddenRows = feedInSlices(trickle, sequence, sliceLength)
+        assert {sequence[row].id for row in hiddenRows} == set(expectedHidden.split()), seeds
+
+    for seeds, expectedLocal in fixture.localCommits.items():
+        trickle = BatchTrickle.newForeignTrickle(rowOf, fixtureHeads, seeds.split())
+        foreignRows = feedInSlices(trickle, sequence, sliceLength)
+        localCommits = set(rows) - {sequence[row].id for row in foreignRows}
+        assert localCommits == set(expectedLocal.split()), seeds
+
+
+@pytest.mark.parametrize("fixture", allFixtures, ids=[g.graphName for g in allFixtures])
+def testPatchHiddenCommits(fixture: ChainMarkerFixture):
+    fixtureHeads = fixture.headsDef.split()
+    sequence, _graphHeads = GraphDiagram.parseDefinition(fixture.graphDef)
+    cases = {k: set(v.split()) for k, v in fixture.hiddenCommits.items() if "!" not in k}
+
+    # Go from every set of hidden seeds to every other one
+    for (oldKey, oldHidden), (newKey, newHidden) in itertools.product(cases.items(), repeat=2):
+        oldSeeds = set(oldKey.split())
+        newSeeds = set(newKey.split())
+
+        gbu = GraphBuildLoop(fixtureHeads, hideSeeds=oldSeeds)
+        gbu.sendAll(sequence)
+        hiddenCommits = set(gbu.hiddenCommits)
+        assert hiddenCommits == oldHidden
+
+        rows, parentRows = parentRowLists(sequence)
+        trickle = BatchTrickle.newHiddenTrickle(rows.__getitem__, fixtureHeads, newSeeds)
+        changedRows = [rows[oid] for oid in oldSeeds ^ newSeeds if oid in rows]
+        hideRows, showRows = trickle.patch(parentRows, changedRows, lambda row, hc=hiddenCommits: sequence[row].id in hc)
+        hide = {sequence[row].id for row in hideRows}
+        show = {sequence[row].id for row in showRows}
+        assert not (hide & show)
+        assert hide <= newHidden
+        assert not (show & newHidden)
+
+        hiddenCommits.difference_update(show)
+        hiddenCommits.update(hide)
+        assert hiddenCommits == newHidden, f"{oldKey!r} -> {newKey!r}"
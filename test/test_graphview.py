@@ -7,8 +7,9 @@
 import pygit2.enums
 import pytest
 
-from gitfourchette.graphview.commitlogmodel import SpecialRow
-from gitfourchette.nav import NavLocator
+from gitfourchette.graphview.commitlogmodel import CommitLogModel, SpecialRow
+from gitfourchette import settings
+from gitfourchette.nav import NavLocator, NavFlags
 from .util import *
 
 
@@ -74,6 +75,10 @@ def testCommitSearch(tempDir, mainWindow):
     assert getGraphRow() > previousRow
     previousRow = getGraphRow()
 
+    # the search pulse has reported the number of matches
+    assert searchBar.matchCountLabel.isVisibleTo(rw)
+    assert searchBar.matchCountLabel.text().startswith(str(len(matchingCommits)))
+
     # escape closes search bar
     QTest.keySequence(searchEdit, "Escape")
     assert not searchBar.isVisibleTo(rw)
@@ -312,3 +317,250 @@ def testCommitAmendedOutsideAppVanishesFromGraph(tempDir, mainWindow):
 
     rw.refreshRepo()
     assert rw.navLocator.commit == newHeadId
+
+
+def testGraphFrameCache(tempDir, mainWindow):
+    from gitfourchette.graphview.graphpaint import paintGraphFrame, GraphFrameCache
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    outlineColor = QColor(Qt.GlobalColor.white)
+    cache = GraphFrameCache()
+
+    def render(oid, cache):
+        image = QImage(200, 20, QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        rect = QRect(0, 0, 200, 20)
+        paintGraphFrame(repoModel, oid, painter, rect, outlineColor, cache)
+        painter.end()
+        return image, rect.right()
+
+    # Cached renders look exactly like uncached renders
+    oids = [repoModel.commitSequence.oid(row) for row in range(len(repoModel.commitSequence))]
+    for oid in oids:
+        expected = render(oid, None)
+        assert render(oid, cache) == expected  # cache miss
+        assert render(oid, cache) == expected  # cache hit
+    assert len(cache.renders) == len(oids)
+
+    # Hiding a branch changes the graph generation, which flushes the cache
+    generation = repoModel.graphGeneration
+    rw.toggleHideRefPattern("refs/heads/no-parent")
+    assert repoModel.graphGeneration > generation
+    render(oids[0], cache)
+    assert len(cache.renders) == 1
+
+
+def testToggleHiddenBranchOnlyRefiltersAffectedRows(tempDir, mainWindow, monkeypatch):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        # Make a branch with 2 commits of its own
+        parent = repo.head_commit
+        for i in range(2):
+            oid = repo.create_commit(None, TEST_SIGNATURE, TEST_SIGNATURE, f"hide me {i}", parent.tree_id, [parent.id])
+            parent = repo.peel_commit(oid)
+        repo.create_branch_from_commit("hideme", parent.id)
+        tip = parent.id
+        tipParent = parent.parent_ids[0]
+
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    clFilter = rw.graphView.clFilter
+    numRows = clFilter.rowCount()
+
+    numFiltered = 0
+    originalFilterAcceptsRow = clFilter.filterAcceptsRow
+
+    def countingFilterAcceptsRow(*args):
+        nonlocal numFiltered
+        numFiltered += 1
+        return originalFilterAcceptsRow(*args)
+
+    monkeypatch.setattr(clFilter, "filterAcceptsRow", countingFilterAcceptsRow)
+
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert {tip, tipParent} <= repoModel.hiddenCommits
+    assert clFilter.rowCount() == numRows - 2
+    assert numFiltered < numRows
+
+    numFiltered = 0
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert not repoModel.hiddenCommits
+    assert clFilter.rowCount() == numRows
+    assert numFiltered < numRows
+
+
+def testCommitLogFilterMapsRowsAcrossSplices(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        parent = repo.head_commit
+        for i in range(2):
+            oid = repo.create_commit(None, TEST_SIGNATURE, TEST_SIGNATURE, f"hide me {i}", parent.tree_id, [parent.id])
+            parent = repo.peel_commit(oid)
+        repo.create_branch_from_commit("hideme", parent.id)
+
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    clModel = rw.graphView.clModel
+    clFilter = rw.graphView.clFilter
+
+    def checkMapping():
+        visibleRows = [row for row in range(clModel.rowCount())
+                       if clModel.index(row, 0).data(CommitLogModel.Role.Oid) not in repoModel.hiddenCommits]
+        assert clFilter.rowCount() == len(visibleRows)
+        for proxyRow, sourceRow in enumerate(visibleRows):
+            assert clFilter.mapToSource(clFilter.index(proxyRow, 0)).row() == sourceRow
+            assert clFilter.mapFromSource(clModel.index(sourceRow, 0)).row() == proxyRow
+        for sourceRow in set(range(clModel.rowCount())) - set(visibleRows):
+            assert not clFilter.mapFromSource(clModel.index(sourceRow, 0)).isValid()
+        return len(visibleRows)
+
+    numVisible = checkMapping()
+
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert checkMapping() == numVisible - 2
+
+    # Splice new commits at the top of the graph: one on the hidden branch, one on master
+    with RepoContext(wd) as repo:
+        for branchName in ["hideme", "master"]:
+            branch = repo.branches.local[branchName]
+            parent = branch.peel(Commit)
+            oid = repo.create_commit(branch.name, TEST_SIGNATURE, TEST_SIGNATURE, f"new {branchName}", parent.tree_id, [parent.id])
+    rw.refreshRepo()
+    assert checkMapping() == numVisible - 2 + 1
+
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert checkMapping() == numVisible + 2
+    rw.jump(NavLocator.inCommit(oid))
+    assert rw.graphView.currentCommitId == oid
+
+
+def testCommitDisplayCache(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.graphview import commitlogdelegate
+    from gitfourchette.toolbox import AuthorDisplayStyle
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    graphView = rw.graphView
+    delegate = graphView.itemDelegate()
+    cache = delegate.displayCache
+    headId = rw.repo.head_commit_id
+
+    numSummaries = 0
+    originalMessageSummary = commitlogdelegate.messageSummary
+
+    def countingMessageSummary(*args, **kwargs):
+        nonlocal numSummaries
+        numSummaries += 1
+        return originalMessageSummary(*args, **kwargs)
+
+    monkeypatch.setattr(commitlogdelegate, "messageSummary", countingMessageSummary)
+
+    # The first paint fills the cache
+    graphView.grab()
+    assert headId in cache.records
+    assert numSummaries > 0
+    summary = cache.records[headId].summaryText
+
+    # Repaints reuse the display records
+    numSummaries = 0
+    graphView.grab()
+    assert numSummaries == 0
+
+    # Changing a display pref flushes the cache
+    monkeypatch.setattr(settings.prefs, "authorDisplayStyle", AuthorDisplayStyle.FULL_EMAIL)
+    graphView.grab()
+    assert numSummaries > 0
+    assert cache.records[headId].summaryText == summary
+    assert "@" in cache.records[headId].authorText
+
+
+def testCommitDiffPrefetch(tempDir, mainWindow, monkeypatch):
+    from gitfourchette.graphview.graphview import GraphView
+
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    cache = repoModel.commitDiffCache
+    sequence = repoModel.commitSequence
+    cache.clear()
+
+    numDiffs = 0
+    originalCommitDiffs = rw.repo.commit_diffs
+
+    def countingCommitDiffs(*args, **kwargs):
+        nonlocal numDiffs
+        numDiffs += 1
+        return originalCommitDiffs(*args, **kwargs)
+
+    monkeypatch.setattr(rw.repo, "commit_diffs", countingCommitDiffs)
+
+    # Select a commit in the middle of the graph
+    oid = sequence.oid(5)
+    rw.jump(NavLocator.inCommit(oid))
+    assert rw.graphView.currentCommitId == oid
+    assert numDiffs == 1
+
+    # Its neighbors get diffed in the background
+    assert GraphView.PrefetchRadius >= 1
+    QTest.qWait(GraphView.PrefetchDelay + 500)
+    assert not rw.repoTaskRunner.isBusy()
+    assert numDiffs == 1 + 2 * GraphView.PrefetchRadius
+    assert len(cache.entries) == numDiffs
+
+    # Moving to a neighbor doesn't diff anything
+    QTest.keyClick(rw.graphView, Qt.Key.Key_Down)
+    assert rw.graphView.currentCommitId == sequence.oid(6)
+    assert numDiffs == 1 + 2 * GraphView.PrefetchRadius
+
+    # Same commit with more context lines: separate cache entry
+    with monkeypatch.context() as m:
+        m.setattr(settings.prefs, "contextLines", settings.prefs.contextLines + 1)
+        rw.jump(NavLocator.inCommit(sequence.oid(6)).withExtraFlags(NavFlags.ForceDiff))
+    assert numDiffs == 2 + 2 * GraphView.PrefetchRadius
+
+
+@pytest.mark.parametrize("closeAndReopen", [False, True])
+def testDontLoadHiddenBranches(tempDir, mainWindow, closeAndReopen):
+    settings.prefs.loadHiddenBranches = False
+
+    wd = unpackRepo(tempDir)
+    with RepoContext(wd) as repo:
+        # Make a branch with 2 commits of its own
+        parent = repo.head_commit
+        for i in range(2):
+            oid = repo.create_commit(None, TEST_SIGNATURE, TEST_SIGNATURE, f"hide me {i}", parent.tree_id, [parent.id])
+            parent = repo.peel_commit(oid)
+        repo.create_branch_from_commit("hideme", parent.id)
+        tip = parent.id
+
+    rw = mainWindow.openRepo(wd)
+    repoModel = rw.repoModel
+    assert tip in repoModel.graph.commitRows
+    numCommits = repoModel.numRealCommits
+
+    # Hiding the branch removes its exclusive commits from the graph
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert tip not in repoModel.graphTips
+    assert tip not in repoModel.graph.commitRows
+    assert repoModel.numRealCommits == numCommits - 2
+
+    if closeAndReopen:
+        # The branch stays out of the graph when the repo is reloaded (from the graph cache)
+        repoModel.prefs.write(force=True)
+        mainWindow.closeAllTabs()
+        rw = mainWindow.openRepo(wd)
+        repoModel = rw.repoModel
+        assert tip not in repoModel.graph.commitRows
+        assert repoModel.numRealCommits == numCommits - 2
+
+    # Unhiding the branch splices its commits back in
+    rw.toggleHideRefPattern("refs/heads/hideme")
+    assert tip in repoModel.graphTips
+    assert tip in repoModel.graph.commitRows
+    assert repoModel.numRealCommits == numCommits
+    rw.jump(NavLocator.inCommit(tip))
+    assert rw.graphView.currentCommitId == tip
@@ -116,6 +116,48 @@ def testNewEmptyRemoteShowsUpInSidebar(tempDir, mainWindow):
     assert 2 == sb.countNodesByKind(SidebarItem.Remote)
 
 
+def testSidebarUpdatesIncrementally(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    rw = mainWindow.openRepo(wd)
+    sb = rw.sidebar
+    sm = sb.sidebarModel
+
+    resets = []
+    inserted = []
+    removed = []
+    sm.modelAboutToBeReset.connect(lambda: resets.append(True))
+    sm.rowsInserted.connect(lambda parent, first, last: inserted.append((SidebarNode.fromIndex(parent).data, first, last)))
+    sm.rowsRemoved.connect(lambda parent, first, last: removed.append((SidebarNode.fromIndex(parent).data, first, last)))
+
+    masterNode = sb.findNodeByRef("refs/heads/master")
+    originNode = sb.findNode(lambda n: n.kind == SidebarItem.Remote and n.data == "origin")
+    sb.collapse(originNode.createIndex(sm))
+
+    # Create a branch outside of GF, then delete it
+    with RepoContext(wd) as repo2:
+        repo2.create_branch_on_head("sneaky")
+    rw.refreshRepo()
+
+    sneakyNode = sb.findNodeByRef("refs/heads/sneaky")
+    assert resets == []
+    assert removed == []
+    assert inserted == [(sneakyNode.parent.data, sneakyNode.row, sneakyNode.row)]
+
+    # Unchanged nodes are still the same objects, collapsed nodes stay collapsed
+    assert sb.findNodeByRef("refs/heads/master") is masterNode
+    assert not sb.isExpanded(originNode.createIndex(sm))
+
+    inserted.clear()
+    with RepoContext(wd) as repo2:
+        repo2.delete_local_branch("sneaky")
+    rw.refreshRepo()
+    assert resets == []
+    assert inserted == []
+    assert len(removed) == 1
+    assert "refs/heads/sneaky" not in sm.nodesByRef
+    assert sb.findNodeByRef("refs/heads/master") is masterNode
+
+
 @pytest.mark.parametrize("headerKind,leafKind", [
     (SidebarItem.LocalBranchesHeader, SidebarItem.LocalBranch),
     (SidebarItem.RemotesHeader, SidebarItem.RemoteBranch),
@@ -7,6 +7,7 @@
 import os.path
 import pytest
 
+from gitfourchette.filelists.filelistmodel import FileListModel
 from . import reposcenario
 from .util import *
 
@@ -169,3 +170,75 @@ def testUnstageChangeInEmptyRepo(tempDir, mainWindow, method):
     assert qlvGetRowData(rw.stagedFiles) == []
 
     assert rw.repo.status() == {"SomeNewFile.txt": FileStatus.WT_NEW}
+
+
+def testStagingPatchesFileListsWithoutReset(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    numFiles = 200
+    for i in range(numFiles):
+        writeFile(f"{wd}/new{i:03}.txt", f"file {i}\n")
+    rw = mainWindow.openRepo(wd)
+
+    resets = []
+    removed = []
+    inserted = []
+    for fileList in rw.dirtyFiles, rw.stagedFiles:
+        model = fileList.flModel
+        model.modelAboutToBeReset.connect(lambda fl=fileList: resets.append(fl))
+        model.rowsRemoved.connect(lambda parent, first, last, fl=fileList: removed.append((fl, first, last)))
+        model.rowsInserted.connect(lambda parent, first, last, fl=fileList: inserted.append((fl, first, last)))
+
+    # Scroll down the list and stage a file in the middle of it
+    rw.dirtyFiles.scrollToBottom()
+    scrollValue = rw.dirtyFiles.verticalScrollBar().value()
+    assert scrollValue > 0
+    row = rw.dirtyFiles.flModel.getRowForFile("new150.txt")
+    qlvClickNthRow(rw.dirtyFiles, row)
+    scrollValue = rw.dirtyFiles.verticalScrollBar().value()
+    QTest.keyPress(rw.dirtyFiles, Qt.Key.Key_Return)
+
+    assert resets == []
+    assert removed == [(rw.dirtyFiles, row, row)]
+    assert inserted == [(rw.stagedFiles, 0, 0)]
+    assert qlvGetRowData(rw.stagedFiles) == ["new150.txt"]
+    assert len(qlvGetRowData(rw.dirtyFiles)) == numFiles - 1
+
+    # The next file is selected, and the list didn't scroll away
+    assert rw.navLocator.path == "new151.txt"
+    assert qlvGetSelection(rw.dirtyFiles) == ["new151.txt"]
+    assert rw.dirtyFiles.verticalScrollBar().value() == scrollValue
+
+    # The surviving rows must point to the fresh diff
+    assert rw.dirtyFiles.getPatchForFile("new151.txt").delta.new_file.path == "new151.txt"
+
+
+def testFileListKeepsSelectionWhenUpdateFallsBackToReset(tempDir, mainWindow):
+    wd = unpackRepo(tempDir)
+    numFiles = 100
+    for i in range(numFiles):
+        writeFile(f"{wd}/new{i:03}.txt", f"file {i}\n")
+    with RepoContext(wd) as repo:
+        repo.index.add_all([f"new{i:03}.txt" for i in range(numFiles // 2)])
+        repo.index.write()
+    rw = mainWindow.openRepo(wd)
+    fileList = rw.dirtyFiles
+
+    stagedDiff = rw.repo.get_staged_changes()
+    unstagedDiff = rw.repo.get_unstaged_changes()
+    fileList.updateContents([stagedDiff, unstagedDiff], False)
+
+    fileList.scrollToBottom()
+    row = fileList.flModel.getRowForFile("new080.txt")
+    qlvClickNthRow(fileList, row)
+    scrollValue = fileList.verticalScrollBar().value()
+    assert scrollValue > 0
+
+    resets = []
+    fileList.flModel.modelAboutToBeReset.connect(lambda: resets.append(True))
+
+    # Swapping the diffs reorders the paths, which can't be patched in place
+    fileList.updateContents([unstagedDiff, stagedDiff], False)
+    assert resets
+    assert qlvGetSelection(fileList) == ["new080.txt"]
+    assert fileList.currentIndex().data(FileListModel.Role.FilePath) == "new080.txt"
+    assert fileList.verticalScrollBar().value() == scrollValue